@@ -1,57 +1,38 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 import io
-import time
-from datetime import datetime, timedelta
-
-# --- NOVA FUNÇÃO: previsão do pagamento para o mês atual ---
-def calcular_previsao_mes_atual_market(market_data):
-    """
-    Recebe o DataFrame `market_data` (retornado por fetch_market_data),
-    que deve conter, entre outras colunas, um possível DataFrame em cada linha 
-    na coluna 'Historico_Dividendos'. Retorna uma Series com o valor projetado 
-    do pagamento (aluguel/dividendo) para o mês atual para cada ticker.
-    """
-    hoje = datetime.now()
-    ano_atual = hoje.year
-    mes_atual = hoje.month
-    
-    previsoes = {}
-    
-    for ticker, row in market_data.iterrows():
-        df_hist = row.get('Historico_Dividendos', None)
-        
-        if isinstance(df_hist, pd.DataFrame):
-            # Garantir que 'Data' está no tipo datetime
-            df_hist['Data'] = pd.to_datetime(df_hist['Data'])
-            
-            # 1) Tentativa de pegar pagamento no mês/ano atuais
-            pagos_mes = df_hist[
-                (df_hist['Data'].dt.year == ano_atual) &
-                (df_hist['Data'].dt.month == mes_atual)
-            ]
-            if not pagos_mes.empty:
-                # Pega o último valor deste mês
-                ultimo = pagos_mes.sort_values("Data", ascending=False).iloc[0]
-                previsoes[ticker] = float(ultimo['Valor'])
-            else:
-                # Não há pagamento neste mês; usar último antes do 1º dia do mês
-                primeiro_dia_mes = datetime(ano_atual, mes_atual, 1)
-                pagos_anteriores = df_hist[df_hist['Data'] < primeiro_dia_mes]
-                if not pagos_anteriores.empty:
-                    ultimo_ant = pagos_anteriores.sort_values("Data", ascending=False).iloc[0]
-                    previsoes[ticker] = float(ultimo_ant['Valor'])
-                else:
-                    previsoes[ticker] = float("nan")
-        else:
-            # Sem histórico de dividendos/aluguel
-            previsoes[ticker] = float("nan")
-    
-    return pd.Series(previsoes, name="Prev_Pag_Mes_Atual")
-
+import os
+from datetime import datetime
+
+from market_cache import MarketDataCache
+from quote_store import QuoteStore
+from market_data import SimulatedProvider, get_provider, to_frames
+from memory_report import report
+from avaliacao import PlanilhaInvalida, carregar_planilha, prever_pagamento_mes
+from filtros import IndiceFiltros, assinatura, montar_display
+from graficos import assinatura_serie, figura_barras_faixa, figura_leque, figura_linha, figura_linhas, get_cache_figuras
+from ledger import VendaDescoberta
+from ledger_store import LEDGER_DIR, MEMORY, LedgerStore, portfolio_path
+from periodos import fatiar_periodo, indexar_por_data
+from portfolio import CarteiraIncremental
+from price_store import PriceStore, close_matrix
+from projecao import DIAS_MES, estimar_parametros, projetar, rendimento_mensal
+from retornos import metricas_retorno
+from risco import carregar_benchmark, metricas_risco, periodos_por_ano, ultimos_anos, versao_arquivo
+from simulacao import caminhos_normalizados, datas_simuladas, gerar_dados_historicos_simulados
+from valuation_store import ValuationStore, price_store_loader, valuation_path, value_history
+from workbook import content_hash
+
+# Métodos de apuração do custo das vendas (ver ledger.calcular_posicoes)
+METODOS_CUSTO = {'Custo Médio': 'medio', 'PEPS (FIFO)': 'fifo'}
+# Anos de barras diárias reais nos históricos de preço (risco, retornos e projeção)
+ANOS_HISTORICO = 3
+AVISO_SIMULADO = (
+    "Históricos de preço simulados (provedor simulado, MMPG_MARKET_PROVIDER=simulated): "
+    "os valores calculados sobre eles são apenas ilustrativos."
+)
 
 # --- Funções Auxiliares Originais (copiadas do seu código anterior) --- #
 
@@ -59,42 +40,52 @@ def calcular_previsao_mes_atual_market(market_data):
 def load_excel_data(uploaded_file):
     """Carrega os dados das abas do arquivo Excel enviado pelo usuário."""
     try:
-        df_historico = pd.read_excel(
-            uploaded_file,
-            sheet_name='Historico_Compras',
-            parse_dates=['Data_Compra']
-        )
-        df_watchlist = pd.read_excel(uploaded_file, sheet_name='Watchlist')
-        
-        # Garantir que Codigo_Ativo seja string e remover espaços
-        df_historico['Codigo_Ativo'] = df_historico['Codigo_Ativo'].astype(str).str.strip()
-        df_watchlist['Codigo_Ativo'] = df_watchlist['Codigo_Ativo'].astype(str).str.strip()
-        
-        # Validar colunas essenciais
-        required_hist_cols = [
-            'Data_Compra', 'Codigo_Ativo', 'Tipo_Ativo',
-            'Quantidade', 'Preco_Compra_Unitario'
-        ]
-        required_watch_cols = ['Codigo_Ativo', 'Tipo_Ativo']
-        
-        if not all(col in df_historico.columns for col in required_hist_cols):
-            st.error(f"A aba 'Historico_Compras' deve conter as colunas: {', '.join(required_hist_cols)}")
-            return None, None
-            
-        if not all(col in df_watchlist.columns for col in required_watch_cols):
-            st.error(f"A aba 'Watchlist' deve conter as colunas: {', '.join(required_watch_cols)}")
-            return None, None
-            
-        # Adicionar coluna Corretagem_Taxas se não existir
-        if 'Corretagem_Taxas' not in df_historico.columns:
-            df_historico['Corretagem_Taxas'] = 0
-        df_historico['Corretagem_Taxas'] = df_historico['Corretagem_Taxas'].fillna(0)
-
-        return df_historico, df_watchlist
+        return carregar_planilha(uploaded_file.getvalue())
+    except PlanilhaInvalida as e:
+        st.error(str(e))
+        return None, None
     except Exception as e:
         st.error(f"Erro ao ler o arquivo Excel: {e}. Verifique o formato e as abas ('Historico_Compras', 'Watchlist').")
         return None, None
 
+@st.cache_resource
+def abrir_livro_salvo(caminho):
+    """Livro salvo de uma carteira (um arquivo por chave), compartilhado pelas sessões que informam a mesma chave."""
+    return LedgerStore(caminho)
+
+def get_ledger_store():
+    """
+    Livro (Historico_Compras e Watchlist) da carteira aberta: o salvo da chave
+    informada, se o servidor permite salvar (MMPG_LEDGER_DIR), ou um livro em
+    memória só desta sessão.
+    """
+    chave = st.session_state.get('chave_carteira')
+    if LEDGER_DIR and chave:
+        return abrir_livro_salvo(portfolio_path(chave))
+    if 'livro_sessao' not in st.session_state:
+        st.session_state['livro_sessao'] = LedgerStore()
+    return st.session_state['livro_sessao']
+
+def importar_planilha(uploaded_file):
+    """Sincroniza o livro com a planilha enviada: inclui operações novas e remove as editadas ou apagadas."""
+    livro = get_ledger_store()
+    hash_arquivo = content_hash(uploaded_file.getvalue())
+    if livro.is_current(hash_arquivo):
+        return
+    df_historico, df_watchlist = load_excel_data(uploaded_file)
+    if df_historico is None or df_watchlist is None:
+        return
+    novas, removidas = livro.import_frames(df_historico, df_watchlist, hash_arquivo, uploaded_file.name)
+    st.success(f"{uploaded_file.name}: {novas} operações incluídas, {removidas} removidas.")
+
+@st.cache_data(max_entries=64, ttl=3600)
+def carregar_livro(_livro, versao):
+    """
+    Lê o livro completo; `versao` ((LedgerStore.id, LedgerStore.version)) muda a cada importação.
+    Limitado e com validade: cada sessão tem seu próprio livro, e os de sessões encerradas saem da memória.
+    """
+    return _livro.history(), _livro.watchlist()
+
 def create_example_excel():
     """Cria um arquivo Excel de exemplo para download."""
     data_historico = {
@@ -155,268 +146,269 @@ def create_example_excel():
     
     return output.getvalue()
 
-def gerar_dados_historicos_simulados(ticker, preco_atual, volatilidade=0.02, dias=365):
-    """Gera dados históricos simulados para um ticker."""
-    hoje = datetime.now()
-    datas = [
-        (hoje - timedelta(days=i)).strftime('%Y-%m-%d')
-        for i in range(dias, 0, -1)
-    ]
-    
-    # Gerar preços com tendência aleatória
-    np.random.seed(hash(ticker) % 10000)  # Seed baseado no ticker para consistência
-    tendencia = np.random.choice([-0.1, 0.1])  # Tendência de alta ou baixa
-    
-    # Simulação de movimento browniano geométrico
-    retornos_diarios = np.random.normal(tendencia/dias, volatilidade, dias)
-    precos = [preco_atual]
-    
-    for retorno in reversed(retornos_diarios[:-1]):
-        precos.append(precos[-1] * (1 - retorno))
-    
-    precos.reverse()  # Ordem cronológica
-    
-    # Adicionar dividendos simulados (a cada ~60 dias para FIIs)
-    dividendos = [0] * dias
-    if 'FII' in ticker.upper():
-        for i in range(30, dias, 60):
-            dividendos[i] = precos[i] * np.random.uniform(0.005, 0.01)  # 0.5% a 1% do preço
-    
-    df = pd.DataFrame({
-        'Data': pd.to_datetime(datas),
-        'Preço': precos,
-        'Dividendos': dividendos
-    })
-    
-    return df
+@st.cache_resource(max_entries=256)
+def carregar_historico_precos(ticker, preco_atual, dia):
+    """Histórico do ativo ordenado e indexado por data, compartilhado entre sessões (não alterar)."""
+    return indexar_por_data(gerar_dados_historicos_simulados(ticker, preco_atual, hoje=dia), 'Data')
+
+@st.cache_data(max_entries=32)
+def calcular_risco(tickers, precos_atuais, dia, versao_benchmark):
+    """
+    Volatilidade, drawdown, Sharpe e beta (vs. benchmark local, ex.: IFIX) do
+    último ano de todos os ativos numa passada sobre a matriz ativos x datas
+    dos históricos. Com históricos simulados o beta fica vazio: caminhos
+    aleatórios não se comparam ao índice real.
+    """
+    precos, datas = matriz_historicos(tickers, precos_atuais, dia)
+    benchmark = None if historico_simulado() else carregar_benchmark()
+    return metricas_risco(precos, datas, list(tickers), benchmark)
+
+@st.cache_data(max_entries=32)
+def calcular_retornos(_df_historico, versao, tickers, precos_atuais, dia, df_dividendos):
+    """
+    TWR do último ano e XIRR (com proventos) de cada ativo e da carteira.
+    O histórico entra no cache pela versão do livro, sem ser percorrido.
+    Com históricos simulados, os aportes do TWR valem os preços simulados do
+    dia, não os das operações, para não misturar as duas fontes.
+    """
+    precos, datas = ultimos_anos(*matriz_historicos(tickers, precos_atuais, dia))
+    df_precos = pd.DataFrame({'Preco_Atual': precos_atuais}, index=list(tickers))
+    return metricas_retorno(
+        _df_historico, df_precos, precos, datas, list(tickers), df_dividendos, hoje=pd.Timestamp.now(),
+        aportes_a_mercado=historico_simulado()
+    )
+
+@st.cache_resource
+def abrir_patrimonio_salvo(caminho):
+    """Série diária do patrimônio de uma carteira salva, em disco; cada atualização só calcula os dias novos."""
+    return ValuationStore(caminho)
+
+@st.cache_data(max_entries=16)
+def atualizar_patrimonio_salvo(_df_historico, caminho, versao, dia, df_dividendos):
+    """
+    Atualiza a série salva da carteira uma vez por versão do livro, dia e
+    proventos; as demais reexecuções reaproveitam o resultado, sem tocar no disco.
+    """
+    return abrir_patrimonio_salvo(caminho).update(
+        _df_historico, price_store_loader(get_price_store()), df_dividendos, today=dia
+    )
+
+@st.cache_data(max_entries=8)
+def calcular_evolucao_patrimonio(_df_historico, versao, tickers, precos_atuais, dia, df_dividendos):
+    """
+    Série do patrimônio calculada só em memória (nada vai para o disco): com
+    barras reais, desde a primeira operação; com históricos simulados, só
+    nos dias cobertos por eles, para não emendar preços de operação com
+    preços simulados.
+    """
+    if not historico_simulado():
+        return value_history(_df_historico, price_store_loader(get_price_store()), df_dividendos, today=dia)
+    cotacoes = {ticker: preco for ticker, preco in zip(tickers, precos_atuais) if preco > 0}
+
+    def carregar_precos(codigos, datas):
+        atuais = [cotacoes.get(codigo, np.nan) for codigo in codigos]
+        precos, datas_historico = matriz_historicos(codigos, atuais, dia)
+        matriz = pd.DataFrame(precos.T, index=datas_historico).reindex(datas).to_numpy().T
+        if datas[-1] == dia:
+            matriz[:, -1] = atuais  # Hoje: cotação atual
+        return matriz
+
+    _, datas_historico = matriz_historicos(tickers, precos_atuais, dia)
+    return value_history(_df_historico, carregar_precos, df_dividendos, start=datas_historico[0], today=dia)
+
+def carregar_evolucao_patrimonio(livro, df_historico, versao, tickers, precos_atuais, dia, df_dividendos):
+    """
+    Valor de mercado, capital aplicado e proventos por dia. Só carteiras
+    salvas com preços reais guardam a série em disco (um arquivo por
+    carteira); as demais a calculam em memória. Em ambos os casos, uma vez
+    por dia ou versão do livro, não a cada reexecução.
+    """
+    if not historico_simulado():
+        atualizar_barras(tuple(sorted(pd.unique(df_historico['Codigo_Ativo'].astype(str)))), dia)
+        if livro.path != MEMORY:
+            return atualizar_patrimonio_salvo(df_historico, valuation_path(livro.id), versao, dia, df_dividendos)
+    return calcular_evolucao_patrimonio(df_historico, versao, tickers, precos_atuais, dia, df_dividendos)
+
+def criar_grafico_patrimonio(df_patrimonio, versao):
+    """Valor de mercado (com e sem proventos) vs. capital aplicado; figura em cache por versão dos dados."""
+    chave = ('patrimonio', versao, assinatura_serie(df_patrimonio.index, df_patrimonio['Valor_Mercado'].to_numpy()))
+    return get_cache_figuras().obter(chave, lambda: figura_linhas(
+        df_patrimonio.index,
+        {
+            'Valor de mercado': df_patrimonio['Valor_Mercado'].to_numpy(),
+            'Valor + proventos': (df_patrimonio['Valor_Mercado'] + df_patrimonio['Proventos_Acumulados']).to_numpy(),
+            'Capital aplicado': df_patrimonio['Capital_Aplicado'].to_numpy(),
+        },
+        titulo='Evolução do Patrimônio',
+        rotulo_y='R$',
+        cores=['#1f77b4', '#2ca02c', '#7f7f7f']
+    ))
+
+@st.cache_data(max_entries=16)
+def calcular_projecao(tickers, quantidades, precos_atuais, dia, df_dividendos, meses, caminhos):
+    """
+    Percentis do valor da carteira e da renda mensal projetados por Monte
+    Carlo, com médias e covariâncias dos retornos históricos dos ativos
+    (fechamentos reais ou, com o provedor simulado, os caminhos simulados),
+    convertidas para dias úteis conforme a periodicidade do histórico.
+    """
+    precos, datas = matriz_historicos(tickers, precos_atuais, dia)
+    media, cov = estimar_parametros(precos, periodos_por_ano(datas))
+    rendimento = rendimento_mensal(df_dividendos, tickers, precos_atuais, dia)
+    return projetar(quantidades, precos_atuais, media, cov, rendimento, dias=meses * DIAS_MES, caminhos=caminhos)
+
+def mostrar_projecao(df_portfolio, df_dividendos, hoje):
+    """Leque do valor projetado da carteira e barras da renda mensal de proventos."""
+    posicoes = df_portfolio[(df_portfolio['Quantidade_Total'] > 0) & (df_portfolio['Preco_Atual'].astype('float64') > 0)]
+    if posicoes.empty:
+        st.info("Sem posições com cotação para projetar")
+        return
+    if historico_simulado():
+        st.caption(AVISO_SIMULADO)
+    col1, col2 = st.columns(2)
+    with col1:
+        meses = st.select_slider('Horizonte (meses)', options=[6, 12, 24, 36], value=12)
+    with col2:
+        caminhos = st.select_slider('Cenários simulados', options=[1_000, 5_000, 10_000, 20_000], value=10_000)
+    valor, renda = calcular_projecao(
+        tuple(posicoes['Codigo_Ativo']), tuple(posicoes['Quantidade_Total'].astype('float64')),
+        tuple(posicoes['Preco_Atual'].astype('float64')), hoje, df_dividendos, meses, caminhos
+    )
+    datas = pd.bdate_range(hoje + pd.offsets.BDay(1), periods=len(valor))
+    st.plotly_chart(
+        figura_leque(datas, valor, f'Valor Projetado da Carteira ({caminhos:,} cenários)', 'R$'),
+        use_container_width=True
+    )
+    if renda is not None:
+        meses_renda = [(hoje + pd.DateOffset(months=int(m))).strftime('%m/%Y') for m in renda.index]
+        st.plotly_chart(
+            figura_barras_faixa(meses_renda, renda, 'Renda Mensal Projetada (mediana e faixa de 5% a 95%)', 'R$'),
+            use_container_width=True
+        )
+
+@st.cache_resource
+def get_price_store():
+    """Barras diárias (yfinance) em Parquet, uma por ticker; só baixa as barras novas."""
+    return PriceStore()
+
+def historico_simulado():
+    """True com o provedor simulado: os históricos de preço são caminhos simulados, não barras reais."""
+    return get_market_provider().name == SimulatedProvider.name
+
+@st.cache_data(max_entries=4)
+def atualizar_barras(tickers, dia):
+    """Baixa as barras novas de cada ticker uma vez por dia; se falhar, ficam as já guardadas."""
+    price_store = get_price_store()
+    for ticker in tickers:
+        try:
+            price_store.refresh(f'{ticker}.SA')
+        except Exception:
+            pass
+    return dia
+
+def matriz_historicos(tickers, precos_atuais, dia):
+    """
+    Matriz ativos x datas dos históricos de preço: fechamentos diários reais
+    dos últimos ANOS_HISTORICO anos (PriceStore) com um provedor real, ou
+    caminhos simulados terminando nos preços atuais com o provedor simulado.
+    """
+    if not historico_simulado():
+        atualizar_barras(tuple(tickers), dia)
+        return close_matrix(get_price_store(), list(tickers), start=dia - pd.DateOffset(years=ANOS_HISTORICO))
+    precos, _ = caminhos_normalizados(list(tickers))
+    precos = precos * np.asarray(precos_atuais, dtype='float64').reshape(-1, 1)
+    return precos, datas_simuladas(precos.shape[1], dia)
 
 def criar_grafico_historico(ticker, dados_historicos, periodo='1a'):
-    """Cria um gráfico de linhas interativo para o histórico de preços."""
+    """
+    Cria um gráfico de linhas interativo para o histórico de preços (série reduzida, WebGL, em cache).
+    `dados_historicos` deve estar indexado por data (ver periodos.indexar_por_data).
+    """
     hoje = datetime.now()
-    if periodo == '1m':
-        data_inicio = hoje - timedelta(days=30)
-    elif periodo == '3m':
-        data_inicio = hoje - timedelta(days=90)
-    elif periodo == '6m':
-        data_inicio = hoje - timedelta(days=180)
-    elif periodo == 'YTD':
-        data_inicio = datetime(hoje.year, 1, 1)
-    else:  # 1a (padrão)
-        data_inicio = hoje - timedelta(days=365)
-    
-    df_filtrado = dados_historicos[dados_historicos['Data'] >= data_inicio]
+    chave = (
+        ticker, periodo, '1d', hoje.date(),
+        assinatura_serie(dados_historicos.index, dados_historicos['Preço'].to_numpy())
+    )
+    return get_cache_figuras().obter(chave, lambda: _montar_grafico_historico(ticker, dados_historicos, periodo, hoje))
+
+def _montar_grafico_historico(ticker, dados_historicos, periodo, hoje):
+    # Busca binária no índice de datas: fatia sem cópia, sem varrer a série
+    df_filtrado = fatiar_periodo(dados_historicos, periodo, hoje)
     
-    fig = px.line(
-        df_filtrado, 
-        x='Data', 
-        y='Preço',
-        title=f'Histórico de Preços - {ticker}',
-        labels={'Data': '', 'Preço': 'Preço (R$)'},
-        template='plotly_white'
+    fig = figura_linha(
+        df_filtrado.index,
+        df_filtrado['Preço'].to_numpy(),
+        titulo=f'Histórico de Preços - {ticker}',
+        rotulo_y='Preço (R$)',
+        nome='Preço'
     )
-    fig.update_traces(line=dict(width=2, color='#1f77b4'))
     
     # Adicionar marcadores para dividendos (se houver coluna 'Dividendos')
     if 'Dividendos' in df_filtrado.columns:
         div_dates = df_filtrado[df_filtrado['Dividendos'] > 0]
         if not div_dates.empty:
-            fig.add_scatter(
-                x=div_dates['Data'], 
+            fig.add_trace(go.Scattergl(
+                x=div_dates.index, 
                 y=div_dates['Preço'],
                 mode='markers',
                 marker=dict(size=8, symbol='diamond', color='green'),
                 name='Dividendo',
                 hovertemplate='Data: %{x}<br>Preço: R$ %{y:.2f}<br>Dividendo: R$ %{text:.2f}',
                 text=div_dates['Dividendos']
-            )
-    
-    fig.update_layout(
-        height=400,
-        margin=dict(l=20, r=20, t=50, b=20),
-        hovermode='x unified',
-        legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='right', x=1),
-        xaxis=dict(showgrid=False),
-        yaxis=dict(showgrid=True, gridcolor='rgba(0,0,0,0.1)')
-    )
+            ))
+            fig.update_layout(showlegend=True)
     
     return fig
 
-@st.cache_data(ttl=900)
-def fetch_market_data(tickers):
-    """Simula a busca de dados de mercado para uma lista de tickers."""
-    market_data = {}
-    
-    sample_data = {
-        'XPLG11': {'Preco_Atual': 99.70, 'Var_Dia_Pct': 0.41, 'P_VP': 0.93,
-                   'DY_12M_Pct': 10.24, 'Liquidez_Diaria_Vol': 3226098},
-        'HGLG11': {'Preco_Atual': 160.23, 'Var_Dia_Pct': 0.14, 'P_VP': 0.98,
-                   'DY_12M_Pct': 8.79, 'Liquidez_Diaria_Vol': 5714559},
-        'ITUB4':  {'Preco_Atual': 37.79, 'Var_Dia_Pct': 0.69, 'P_VP': 1.25,
-                   'DY_12M_Pct': 5.32, 'Liquidez_Diaria_Vol': 15000000},
-        'MXRF11': {'Preco_Atual': 9.52, 'Var_Dia_Pct': 0.53, 'P_VP': 0.85,
-                   'DY_12M_Pct': 13.25, 'Liquidez_Diaria_Vol': 8125365},
-        'VALE3':  {'Preco_Atual': 53.41, 'Var_Dia_Pct': -2.25, 'P_VP': 1.15,
-                   'DY_12M_Pct': 6.75, 'Liquidez_Diaria_Vol': 25000000},
-        'KNRI11': {'Preco_Atual': 145.70, 'Var_Dia_Pct': 0.48, 'P_VP': 0.90,
-                   'DY_12M_Pct': 8.80, 'Liquidez_Diaria_Vol': 6478154},
-        'VISC11': {'Preco_Atual': 103.30, 'Var_Dia_Pct': -0.54, 'P_VP': 0.84,
-                   'DY_12M_Pct': 9.84, 'Liquidez_Diaria_Vol': 3852021},
-        'MALL11': {'Preco_Atual': 101.40, 'Var_Dia_Pct': -0.59, 'P_VP': 0.84,
-                   'DY_12M_Pct': 10.03, 'Liquidez_Diaria_Vol': 3082284},
-        'CPTS11': {'Preco_Atual': 7.36, 'Var_Dia_Pct': -0.94, 'P_VP': 0.85,
-                   'DY_12M_Pct': 13.25, 'Liquidez_Diaria_Vol': 8125365},
-        'TVRI11': {'Preco_Atual': 91.62, 'Var_Dia_Pct': 0.35, 'P_VP': 0.90,
-                   'DY_12M_Pct': 13.59, 'Liquidez_Diaria_Vol': 1033718},
-        'HGRE11': {'Preco_Atual': 113.60, 'Var_Dia_Pct': 1.21, 'P_VP': 0.74,
-                   'DY_12M_Pct': 9.94, 'Liquidez_Diaria_Vol': 1648659},
-        'VGHF11': {'Preco_Atual': 7.75, 'Var_Dia_Pct': 0.39, 'P_VP': 0.91,
-                   'DY_12M_Pct': 14.27, 'Liquidez_Diaria_Vol': 2954165},
-        'VRTA11': {'Preco_Atual': 81.55, 'Var_Dia_Pct': -0.60, 'P_VP': 0.92,
-                   'DY_12M_Pct': 12.92, 'Liquidez_Diaria_Vol': 1449132},
-        'XPML11': {'Preco_Atual': 104.34, 'Var_Dia_Pct': 0.14, 'P_VP': 0.89,
-                   'DY_12M_Pct': 11.07, 'Liquidez_Diaria_Vol': 11465813}
-    }
-    
-    fii_details = {
-        'XPLG11': {
-            'Descricao': 'XP Log FII investe em ativos logísticos (galpões e centros de distribuição).',
-            'Segmento': 'Galpões Logísticos',
-            'Taxa_Vacancia': 2.5,
-            'Qtd_Imoveis': 18,
-            'ABL': 106750,
-            'VPA': 107.25,
-            'Historico_Dividendos': pd.DataFrame({
-                'Data': pd.date_range(end=datetime.now(), periods=12, freq='M'),
-                'Valor': [0.82, 0.81, 0.83, 0.80, 0.82, 0.85, 0.83, 0.84, 0.82, 0.81, 0.83, 0.85],
-                'DY': [0.82, 0.81, 0.83, 0.80, 0.82, 0.85, 0.83, 0.84, 0.82, 0.81, 0.83, 0.85]
-            })
-        },
-        'HGLG11': {
-            'Descricao': 'CSHG Logística FII foca em empreendimentos logísticos e industriais de alto padrão.',
-            'Segmento': 'Galpões Logísticos',
-            'Taxa_Vacancia': 1.8,
-            'Qtd_Imoveis': 28,
-            'ABL': 162740,
-            'VPA': 163.50,
-            'Historico_Dividendos': pd.DataFrame({
-                'Data': pd.date_range(end=datetime.now(), periods=12, freq='M'),
-                'Valor': [1.10, 1.12, 1.10, 1.15, 1.10, 1.12, 1.10, 1.15, 1.10, 1.12, 1.10, 1.15],
-                'DY': [0.69, 0.70, 0.69, 0.72, 0.69, 0.70, 0.69, 0.72, 0.69, 0.70, 0.69, 0.72]
-            })
-        }
-    }
-    
-    acao_details = {
-        'ITUB4': {
-            'Descricao': 'Itaú Unibanco Holding S.A. é o maior banco privado do Brasil, oferecendo serviços bancários.',
-            'Segmento': 'Bancos',
-            'P_L': 8.5,
-            'ROE': 18.7,
-            'Margem_Liquida': 21.3,
-            'Divida_Patrimonio': 0.45,
-            'Cresc_Receita': 12.8,
-            'Historico_Dividendos': pd.DataFrame({
-                'Data': pd.date_range(end=datetime.now(), periods=4, freq='3M'),
-                'Valor': [0.50, 0.48, 0.52, 0.55],
-                'DY': [1.32, 1.27, 1.38, 1.46]
-            })
-        },
-        'VALE3': {
-            'Descricao': 'Vale S.A. é uma das maiores empresas de mineração do mundo, maior produtora de minério de ferro.',
-            'Segmento': 'Mineração',
-            'P_L': 5.2,
-            'ROE': 22.5,
-            'Margem_Liquida': 25.8,
-            'Divida_Patrimonio': 0.38,
-            'Cresc_Receita': -5.3,
-            'Historico_Dividendos': pd.DataFrame({
-                'Data': pd.date_range(end=datetime.now(), periods=4, freq='3M'),
-                'Valor': [0.90, 1.20, 0.85, 1.10],
-                'DY': [1.68, 2.25, 1.59, 2.06]
-            })
-        }
-    }
-    
-    for ticker in tickers:
-        if ticker in sample_data:
-            market_data[ticker] = sample_data[ticker].copy()
-            market_data[ticker]['Erro'] = None
-            
-            # Adicionar dados detalhados para FIIs
-            if ticker in fii_details:
-                market_data[ticker].update(fii_details[ticker])
-            
-            # Adicionar dados detalhados para Ações
-            if ticker in acao_details:
-                market_data[ticker].update(acao_details[ticker])
-                
-        else:
-            # Para tickers não encontrados no nosso conjunto de dados simulados
-            market_data[ticker] = {
-                'Preco_Atual': None,
-                'Var_Dia_Pct': None,
-                'P_VP': None,
-                'DY_12M_Pct': None,
-                'Liquidez_Diaria_Vol': None,
-                'Erro': 'Ticker não encontrado na base de dados simulada'
-            }
-    
-    # Adicionar um pequeno atraso para simular chamada de API
-    time.sleep(0.5)
-    
-    return pd.DataFrame.from_dict(market_data, orient='index')
-
-def calcular_portfolio(df_historico, df_market_data):
-    """Calcula métricas do portfólio com base no histórico e dados de mercado."""
-    if df_historico.empty:
-        return pd.DataFrame(), 0, 0, 0, 0
-
-    # Calcular custo total por transação
-    df_historico['Custo_Total_Transacao'] = (
-        df_historico['Quantidade'] * df_historico['Preco_Compra_Unitario']
-    ) + df_historico['Corretagem_Taxas']
-
-    # Agrupar por ativo para calcular posição consolidada
-    portfolio = df_historico.groupby('Codigo_Ativo').agg(
-        Quantidade_Total=('Quantidade', 'sum'),
-        Custo_Total_Acumulado=('Custo_Total_Transacao', 'sum')
-    ).reset_index()
+@st.cache_resource
+def get_market_cache():
+    """Retorna o cache de dados de mercado (SQLite, TTL por campo, stale-while-revalidate)."""
+    return MarketDataCache()
 
-    # Calcular Preço Médio de Compra
-    portfolio['Preco_Medio_Compra'] = (
-        portfolio['Custo_Total_Acumulado'] / portfolio['Quantidade_Total']
-    )
+@st.cache_resource
+def get_market_provider():
+    """Retorna o provedor de dados de mercado (MMPG_MARKET_PROVIDER: simulated ou yahoo)."""
+    return get_provider()
 
-    # Juntar com dados de mercado
-    portfolio = portfolio.merge(
-        df_market_data[['Preco_Atual', 'Erro']],
-        left_on='Codigo_Ativo', right_index=True, how='left'
-    )
+@st.cache_resource
+def get_quote_store():
+    """Cotações compartilhadas por todas as sessões do servidor, atualizadas por uma thread em segundo plano."""
+    return QuoteStore(get_market_provider().get_market_data, cache=get_market_cache())
 
-    # Calcular Valor Atual da Posição e Lucro/Prejuízo
-    portfolio['Valor_Atual_Posicao'] = (
-        portfolio['Quantidade_Total'] * portfolio['Preco_Atual']
-    )
-    portfolio['Valor_Atual_Posicao'] = portfolio['Valor_Atual_Posicao'].fillna(0)
-    portfolio['Lucro_Prejuizo_Reais'] = (
-        portfolio['Valor_Atual_Posicao'] - portfolio['Custo_Total_Acumulado']
-    )
-    portfolio['Lucro_Prejuizo_Perc'] = portfolio.apply(
-        lambda row: (
-            row['Lucro_Prejuizo_Reais'] / row['Custo_Total_Acumulado'] * 100
-        ) if row['Custo_Total_Acumulado'] != 0 else 0,
-        axis=1
-    )
-
-    # Calcular totais do portfólio
-    total_investido = portfolio['Custo_Total_Acumulado'].sum()
-    total_atual = portfolio['Valor_Atual_Posicao'].sum()
-    pl_total_reais = total_atual - total_investido
-    pl_total_perc = (
-        pl_total_reais / total_investido * 100
-    ) if total_investido != 0 else 0
-
-    return portfolio, total_investido, total_atual, pl_total_reais, pl_total_perc
+def fetch_market_data(tickers):
+    """
+    Lê os dados de mercado da memória compartilhada do servidor; só tickers novos são buscados na hora.
+    Retorna (df_market_data compacto, tabela longa de dividendos de todos os ativos).
+    """
+    market_data = get_quote_store().get(tickers)
+    return to_frames(market_data)
+
+def calcular_portfolio_incremental(df_historico, df_precos, metodo='medio', versao=None):
+    """Reaproveita as posições entre reexecuções: só ativos com histórico alterado são recalculados."""
+    if 'carteira_incremental' not in st.session_state:
+        st.session_state['carteira_incremental'] = CarteiraIncremental()
+    return st.session_state['carteira_incremental'].calcular(df_historico, df_precos, metodo, versao)
+
+def obter_indice_filtros(df_watchlist, df_market_data, df_portfolio, versao):
+    """Monta a tabela da Visão Geral e suas máscaras de filtro só quando os dados mudam, não a cada clique."""
+    chave = (versao, assinatura(df_market_data, df_portfolio))
+    guardado = st.session_state.get('indice_filtros')
+    if guardado is None or guardado[0] != chave:
+        guardado = (chave, IndiceFiltros(montar_display(df_watchlist, df_market_data, df_portfolio)))
+        st.session_state['indice_filtros'] = guardado
+    return guardado[1]
+
+def mostrar_relatorio_memoria(objetos):
+    """Memória por objeto da sessão e dos DataFrames principais na sidebar (só com MMPG_MEMORY_REPORT=1)."""
+    if not os.environ.get('MMPG_MEMORY_REPORT'):
+        return
+    objetos = {**{f'session_state.{nome}': valor for nome, valor in st.session_state.items()}, **objetos}
+    with st.sidebar.expander("🧠 Memória", expanded=False):
+        df_memoria = report(objetos)
+        st.dataframe(df_memoria[['Objeto', 'Linhas', 'MB']], hide_index=True, use_container_width=True,
+                     column_config={"MB": st.column_config.NumberColumn("MB", format="%.3f")})
+        # Objetos compartilhados (ex.: a tabela da Visão Geral) entram em mais de uma linha
+        st.caption(f"Soma: {df_memoria['MB'].sum():.2f} MB")
 
 # --- Funções de Formatação ---
 def format_currency(value):
@@ -431,7 +423,7 @@ def format_integer(value):
 def format_number(value):
     return f"{value:,.2f}" if pd.notna(value) else "N/A"
 
-def criar_cards_info(dados_ativo):
+def criar_cards_info(dados_ativo, df_dividendos):
     """Cria cards com informações detalhadas sobre o ativo."""
     tab1, tab2, tab3 = st.tabs(["📋 Informações Gerais", "📊 Métricas Financeiras", "💰 Dividendos"])
     
@@ -474,9 +466,12 @@ def criar_cards_info(dados_ativo):
                 st.metric("Liquidez Média Diária", format_currency(dados_ativo.get('Liquidez_Diaria_Vol')))
     
     with tab3:
-        if 'Historico_Dividendos' in dados_ativo:
+        historico_dividendos = df_dividendos.loc[
+            df_dividendos['Codigo_Ativo'] == dados_ativo.get('Codigo_Ativo'), ['Data', 'Valor', 'DY']
+        ]
+        if not historico_dividendos.empty:
             st.dataframe(
-                dados_ativo['Historico_Dividendos'],
+                historico_dividendos,
                 column_config={
                     "Data": st.column_config.DateColumn("Data Pagamento"),
                     "Valor": st.column_config.NumberColumn("Valor (R$)", format="R$ %.2f"),
@@ -488,8 +483,9 @@ def criar_cards_info(dados_ativo):
         else:
             st.info("Histórico de dividendos não disponível")
 
-def criar_tabela_moderna(df_view):
-    """Cria uma tabela moderna com formatação avançada."""
+def criar_tabela_moderna(df_view, simulado=False):
+    """Cria uma tabela moderna com formatação avançada; `simulado` marca as colunas calculadas sobre históricos simulados."""
+    nota = " (sobre históricos simulados)" if simulado else ""
     column_config = {
         "Código": st.column_config.TextColumn(
             "Código",
@@ -562,6 +558,44 @@ def criar_tabela_moderna(df_view):
             min_value=-50,
             max_value=50
         ),
+        "Lucro Realizado (R$)": st.column_config.NumberColumn(
+            "Lucro Realizado",
+            help="Lucro ou prejuízo já realizado com vendas",
+            format="R$ %.2f"
+        ),
+        "TWR 1A (%)": st.column_config.NumberColumn(
+            "TWR 1A",
+            help="Retorno ponderado pelo tempo no último ano, com proventos" + nota,
+            format="%.2f%%"
+        ),
+        "XIRR (% a.a.)": st.column_config.NumberColumn(
+            "XIRR",
+            help="Taxa interna de retorno anual da posição desde a primeira compra, com proventos",
+            format="%.2f%%"
+        ),
+        "Vol. 1A (%)": st.column_config.NumberColumn(
+            "Volatilidade",
+            help="Volatilidade anualizada dos retornos diários no último ano" + nota,
+            format="%.1f%%"
+        ),
+        "Drawdown Máx. (%)": st.column_config.NumberColumn(
+            "Drawdown Máx.",
+            help="Maior queda a partir de um pico no último ano" + nota,
+            format="%.1f%%"
+        ),
+        "Sharpe": st.column_config.NumberColumn(
+            "Sharpe",
+            help="Retorno acima do CDI por unidade de volatilidade no último ano (anualizado)" + nota,
+            format="%.2f"
+        ),
+        "Beta IFIX": st.column_config.NumberColumn(
+            "Beta",
+            help=(
+                "Desativado com históricos simulados" if simulado
+                else "Sensibilidade ao IFIX no último ano (vazio sem o arquivo do índice em data/ifix.csv)"
+            ),
+            format="%.2f"
+        ),
         "Volume Dia": st.column_config.NumberColumn(
             "Volume Diário",
             help="Volume financeiro negociado no dia",
@@ -602,43 +636,86 @@ uploaded_file = st.file_uploader(
     "Selecione seu arquivo Excel com as abas 'Historico_Compras' e 'Watchlist'",
     type=['xlsx']
 )
+if LEDGER_DIR:
+    st.text_input(
+        "Chave da carteira (opcional)", key='chave_carteira', type='password',
+        help="Com uma chave, a carteira fica salva no servidor e volta ao informar a mesma chave. "
+             "Sem ela, os dados ficam só nesta sessão."
+    )
 
+# A planilha enviada alimenta o livro da carteira (da sessão ou salvo pela chave); as páginas leem do livro
 if uploaded_file is not None:
-    # 1) Carregar dados do Excel
-    df_historico, df_watchlist = load_excel_data(uploaded_file)
+    importar_planilha(uploaded_file)
+
+livro = get_ledger_store()
+if not livro.is_empty():
+    # 1) Carregar dados do livro (releitura completa só quando o livro muda)
+    versao_livro = (livro.id, livro.version())
+    df_historico, df_watchlist = carregar_livro(livro, versao_livro)
     
-    if df_historico is not None and df_watchlist is not None:
+    if not df_historico.empty:
         # --- 2) Busca de Dados da API ---
         tickers_to_fetch = df_watchlist['Codigo_Ativo'].unique().tolist()
-        df_market_data = fetch_market_data(tickers_to_fetch)
+        df_market_data, df_dividendos = fetch_market_data(tickers_to_fetch)
         
         # --- 3) Cálculo da previsão de pagamento (aluguel/dividendo) ---
-        df_previsao = calcular_previsao_mes_atual_market(df_market_data)
+        df_previsao = prever_pagamento_mes(df_dividendos, df_market_data.index)
         df_market_data = pd.concat([df_market_data, df_previsao], axis=1)
+
+        # --- 3.1) Métricas de risco (volatilidade, drawdown, Sharpe, beta) ---
+        tickers_mercado = tuple(df_market_data.index)
+        precos_atuais = tuple(df_market_data['Preco_Atual'].astype('float64').fillna(0))
+        hoje = pd.Timestamp.now().normalize()
+        df_risco = calcular_risco(tickers_mercado, precos_atuais, hoje, versao_arquivo())
+
+        # --- 3.2) Retornos ponderados pelo tempo (TWR) e pelo dinheiro (XIRR) ---
+        df_retornos, retorno_carteira, _ = calcular_retornos(
+            df_historico, versao_livro, tickers_mercado, precos_atuais, hoje, df_dividendos
+        )
+        df_market_data = pd.concat([df_market_data, df_risco, df_retornos], axis=1)
         
         # --- 4) Cálculo do Portfólio ---
-        df_portfolio, total_investido, total_atual, pl_total_reais, pl_total_perc = (
-            calcular_portfolio(df_historico, df_market_data)
+        st.sidebar.header("🧮 Cálculo")
+        metodo_custo = st.sidebar.radio(
+            'Método de custo das vendas',
+            list(METODOS_CUSTO),
+            index=0
         )
+        try:
+            df_portfolio, total_investido, total_atual, pl_total_reais, pl_total_perc = (
+                calcular_portfolio_incremental(
+                    df_historico,
+                    df_market_data[['Preco_Atual', 'Erro']],
+                    METODOS_CUSTO[metodo_custo],
+                    versao_livro
+                )
+            )
+        except VendaDescoberta as e:
+            st.error(f"Histórico inconsistente: {e}")
+            st.stop()
+
+        # Tabela da Visão Geral (watchlist + mercado + posições), refeita só quando os dados mudam
+        indice_filtros = obter_indice_filtros(df_watchlist, df_market_data, df_portfolio, versao_livro)
 
         # --- 5) Filtros na Sidebar ---
         st.sidebar.header("🔎 Filtros")
         with st.sidebar.expander("Filtrar por Tipo", expanded=True):
-            tipo_ativo_opts = sorted(df_watchlist['Tipo_Ativo'].unique())
+            tipo_ativo_opts = indice_filtros.opcoes['Tipo_Ativo']
             tipos_selecionados = st.multiselect(
                 'Selecione os tipos',
                 tipo_ativo_opts,
                 default=tipo_ativo_opts
             )
         with st.sidebar.expander("Filtrar por Setor", expanded=True):
-            setor_opts = sorted(df_watchlist['Setor'].dropna().unique())
+            setor_opts = indice_filtros.opcoes['Setor']
             setores_selecionados = st.multiselect(
                 'Selecione os setores',
                 setor_opts,
                 default=setor_opts
             )
         with st.sidebar.expander("Filtrar por Posse", expanded=True):
-            ativos_possessao = df_portfolio['Codigo_Ativo'].unique()
+            # Ativos totalmente vendidos não contam como posse
+            ativos_possessao = df_portfolio.loc[df_portfolio['Quantidade_Total'] > 0, 'Codigo_Ativo'].unique()
             filtro_posse = st.radio(
                 'Mostrar',
                 ['Todos da Watchlist', 'Meus Ativos'],
@@ -653,33 +730,20 @@ if uploaded_file is not None:
                 ativos_disponiveis
             )
 
-        # --- 6) Construir o df_display (Visão Geral) ---
-        df_display = df_watchlist.merge(
-            df_market_data,
-            left_on='Codigo_Ativo',
-            right_index=True,
-            how='left'
-        )
-        df_display = df_display.merge(
-            df_portfolio[
-                [
-                    'Codigo_Ativo', 'Quantidade_Total', 'Preco_Medio_Compra',
-                    'Custo_Total_Acumulado', 'Valor_Atual_Posicao',
-                    'Lucro_Prejuizo_Reais', 'Lucro_Prejuizo_Perc'
-                ]
-            ],
-            on='Codigo_Ativo',
-            how='left'
+        # --- 6) Filtrar o df_display (Visão Geral) ---
+        # Máscaras pré-calculadas; todos os setores selecionados inclui ativos sem setor
+        df_display = indice_filtros.filtrar(
+            {
+                'Tipo_Ativo': tipos_selecionados,
+                'Setor': setores_selecionados if len(setores_selecionados) < len(setor_opts) else None,
+            },
+            somente_posse=filtro_posse == 'Meus Ativos'
         )
 
-        # Aplicar filtros de posse/tipo/setor
-        if filtro_posse == 'Meus Ativos':
-            df_display = df_display[df_display['Codigo_Ativo'].isin(ativos_possessao)]
-        if tipos_selecionados:
-            df_display = df_display[df_display['Tipo_Ativo'].isin(tipos_selecionados)]
-        if setores_selecionados:
-            if len(setores_selecionados) < len(setor_opts):
-                df_display = df_display[df_display['Setor'].isin(setores_selecionados)]
+        mostrar_relatorio_memoria({
+            'df_historico': df_historico, 'df_watchlist': df_watchlist,
+            'df_market_data': df_market_data, 'df_dividendos': df_dividendos, 'df_portfolio': df_portfolio,
+        })
 
         # --- 7) Conteúdo Principal ---
         if "📊 Visão Geral" in pagina_selecionada:
@@ -708,6 +772,32 @@ if uploaded_file is not None:
                         delta_color="normal" if pl_total_perc >= 0 else "inverse"
                     )
 
+                col1, col2, col3, _ = st.columns(4)
+                with col1:
+                    st.metric(
+                        "Retorno TWR (1 ano)", format_percentage(retorno_carteira['TWR_Pct']),
+                        help="Retorno ponderado pelo tempo: não depende de quando houve aportes"
+                        + (" (sobre históricos simulados)" if historico_simulado() else "")
+                    )
+                with col2:
+                    st.metric(
+                        "XIRR (a.a.)", format_percentage(retorno_carteira['XIRR_Anual_Pct']),
+                        help="Taxa interna de retorno anual das compras, vendas, proventos e posição atual"
+                    )
+                with col3:
+                    st.metric("Proventos Recebidos", format_currency(retorno_carteira['Dividendos_Recebidos']))
+
+            df_patrimonio = carregar_evolucao_patrimonio(
+                livro, df_historico, versao_livro, tickers_mercado, precos_atuais, hoje, df_dividendos
+            )
+            if not df_patrimonio.empty:
+                if historico_simulado():
+                    st.caption(AVISO_SIMULADO)
+                st.plotly_chart(criar_grafico_patrimonio(df_patrimonio, versao_livro), use_container_width=True)
+
+            with st.expander("🎲 Projeção da Carteira (Monte Carlo)"):
+                mostrar_projecao(df_portfolio, df_dividendos, hoje)
+
             st.divider()
 
             st.subheader("Ativos Monitorados")
@@ -719,7 +809,8 @@ if uploaded_file is not None:
                 'Codigo_Ativo', 'Tipo_Ativo', 'Setor', 'Preco_Atual',
                 'Var_Dia_Pct', 'P_VP', 'DY_12M_Pct', 'Previsto Mês Atual (R$)',
                 'Quantidade_Total', 'Preco_Medio_Compra', 'Custo_Total_Acumulado',
-                'Valor_Atual_Posicao', 'Lucro_Prejuizo_Reais', 'Lucro_Prejuizo_Perc',
+                'Valor_Atual_Posicao', 'Lucro_Prejuizo_Reais', 'Lucro_Prejuizo_Perc', 'Lucro_Realizado',
+                'TWR_Pct', 'XIRR_Anual_Pct', 'Vol_Anual_Pct', 'Max_Drawdown_Pct', 'Sharpe', 'Beta',
                 'Liquidez_Diaria_Vol', 'Erro'
             ]].rename(columns={
                 'Codigo_Ativo': 'Código',
@@ -736,11 +827,20 @@ if uploaded_file is not None:
                 'Valor_Atual_Posicao': 'Valor Atual (R$)',
                 'Lucro_Prejuizo_Reais': 'L/P (R$)',
                 'Lucro_Prejuizo_Perc': 'L/P (%)',
+                'Lucro_Realizado': 'Lucro Realizado (R$)',
+                'TWR_Pct': 'TWR 1A (%)',
+                'XIRR_Anual_Pct': 'XIRR (% a.a.)',
+                'Vol_Anual_Pct': 'Vol. 1A (%)',
+                'Max_Drawdown_Pct': 'Drawdown Máx. (%)',
+                'Sharpe': 'Sharpe',
+                'Beta': 'Beta IFIX',
                 'Liquidez_Diaria_Vol': 'Volume Dia',
                 'Erro': 'Erro API'
             })
 
-            criar_tabela_moderna(df_view)
+            if historico_simulado():
+                st.caption(AVISO_SIMULADO)
+            criar_tabela_moderna(df_view, simulado=historico_simulado())
 
             with st.expander("Ver Histórico de Compras Completo"):
                 st.dataframe(df_historico, use_container_width=True, hide_index=True)
@@ -791,9 +891,10 @@ if uploaded_file is not None:
             st.divider()
 
             # Gráfico de histórico de preços
-            dados_historicos = gerar_dados_historicos_simulados(
+            dados_historicos = carregar_historico_precos(
                 ativo_selecionado,
-                dados_ativo.get('Preco_Atual', 100.0)
+                dados_ativo.get('Preco_Atual', 100.0),
+                datetime.now().date()
             )
             periodos = ['1m', '3m', '6m', '1a', 'YTD']
             periodo_selecionado = st.select_slider(
@@ -807,7 +908,7 @@ if uploaded_file is not None:
             st.divider()
 
             st.subheader("Informações Detalhadas")
-            criar_cards_info(dados_ativo)
+            criar_cards_info(dados_ativo, df_dividendos)
 
             st.divider()
 
@@ -825,7 +926,7 @@ if uploaded_file is not None:
                     with col4:
                         st.metric("Valor Atual Posição", format_currency(dados_ativo.get('Valor_Atual_Posicao')))
 
-                    col5, col6 = st.columns(2)
+                    col5, col6, col7 = st.columns(3)
                     with col5:
                          st.metric(
                              "Lucro/Prejuízo (R$)", 
@@ -840,20 +941,24 @@ if uploaded_file is not None:
                              delta=format_percentage(dados_ativo.get('Lucro_Prejuizo_Perc')) if pd.notna(dados_ativo.get('Lucro_Prejuizo_Perc')) else None,
                              delta_color="normal" if dados_ativo.get('Lucro_Prejuizo_Perc', 0) >= 0 else "inverse"
                          )
+                    with col7:
+                         st.metric("Lucro Realizado (R$)", format_currency(dados_ativo.get('Lucro_Realizado')))
 
                 with st.expander("Ver Histórico de Compras deste Ativo"):
                     st.dataframe(
-                        df_historico[df_historico['Codigo_Ativo'] == ativo_selecionado],
+                        livro.history(ativo_selecionado),
                         hide_index=True,
                         use_container_width=True
                     )
             else:
                 st.info("Você não possui este ativo em carteira (segundo o histórico de compras).")
     else:
-        st.error("Não foi possível carregar os dados do arquivo. Verifique se o formato está correto e tente novamente.")
-        st.info("Baixe o arquivo de exemplo para ver o formato esperado.")
+        st.info("Nenhuma operação salva em 'Historico_Compras'. Envie uma planilha com o histórico de compras.")
 else:
-    st.info("👆 Faça upload do seu arquivo Excel para começar a monitorar seu portfólio.")
+    st.info(
+        "👆 Faça upload do seu arquivo Excel para começar a monitorar seu portfólio."
+        + (" Os dados ficam salvos para as próximas visitas com esta chave." if livro.path != MEMORY else "")
+    )
     st.markdown("""
     ### Como usar esta aplicação:
     1. **Prepare seu arquivo Excel** com duas abas:
@@ -872,4 +977,7 @@ else:
 
 st.markdown("---")
 st.caption(f"Monitor de Portfólio v2.0 | Dados atualizados em: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
-st.caption("Desenvolvido com Streamlit | Dados de mercado simulados para demonstração")
+st.caption(
+    "Desenvolvido com Streamlit | "
+    + ("Dados de mercado simulados para demonstração" if historico_simulado() else "Dados de mercado do Yahoo Finance")
+)
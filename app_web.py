@@ -1,12 +1,25 @@
 import streamlit as st
 import pandas as pd
 import os
-import time
 import sys
 import io
 import tempfile
 from datetime import datetime
 
+from market_cache import CACHE_DIR, MarketDataCache
+from quote_store import QuoteStore
+from market_data import get_provider, to_frames
+from memory_report import report
+from avaliacao import PlanilhaInvalida, carregar_planilha
+from filtros import IndiceFiltros, assinatura, montar_display
+from ledger import VendaDescoberta
+from ledger_store import LEDGER_DIR, MEMORY, LedgerStore, portfolio_path
+from portfolio import CarteiraIncremental
+from workbook import content_hash
+
+# Métodos de apuração do custo das vendas (ver ledger.calcular_posicoes)
+METODOS_CUSTO = {'Custo Médio': 'medio', 'PEPS (FIFO)': 'fifo'}
+
 # --- Configurações da Página ---
 st.set_page_config(
     page_title="Monitor de Portfólio",
@@ -19,35 +32,52 @@ st.set_page_config(
 def load_excel_data(uploaded_file):
     """Carrega os dados das abas do arquivo Excel enviado pelo usuário."""
     try:
-        df_historico = pd.read_excel(uploaded_file, sheet_name='Historico_Compras', parse_dates=['Data_Compra'])
-        df_watchlist = pd.read_excel(uploaded_file, sheet_name='Watchlist')
-        
-        # Garantir que Codigo_Ativo seja string e remover espaços
-        df_historico['Codigo_Ativo'] = df_historico['Codigo_Ativo'].astype(str).str.strip()
-        df_watchlist['Codigo_Ativo'] = df_watchlist['Codigo_Ativo'].astype(str).str.strip()
-        
-        # Validar colunas essenciais
-        required_hist_cols = ['Data_Compra', 'Codigo_Ativo', 'Tipo_Ativo', 'Quantidade', 'Preco_Compra_Unitario']
-        required_watch_cols = ['Codigo_Ativo', 'Tipo_Ativo']
-        
-        if not all(col in df_historico.columns for col in required_hist_cols):
-            st.error(f"A aba 'Historico_Compras' deve conter as colunas: {', '.join(required_hist_cols)}")
-            return None, None
-            
-        if not all(col in df_watchlist.columns for col in required_watch_cols):
-            st.error(f"A aba 'Watchlist' deve conter as colunas: {', '.join(required_watch_cols)}")
-            return None, None
-            
-        # Adicionar coluna Corretagem_Taxas se não existir
-        if 'Corretagem_Taxas' not in df_historico.columns:
-            df_historico['Corretagem_Taxas'] = 0
-        df_historico['Corretagem_Taxas'] = df_historico['Corretagem_Taxas'].fillna(0)
-
-        return df_historico, df_watchlist
+        return carregar_planilha(uploaded_file.getvalue())
+    except PlanilhaInvalida as e:
+        st.error(str(e))
+        return None, None
     except Exception as e:
         st.error(f"Erro ao ler o arquivo Excel: {e}. Verifique o formato e as abas ('Historico_Compras', 'Watchlist').")
         return None, None
 
+@st.cache_resource
+def abrir_livro_salvo(caminho):
+    """Livro salvo de uma carteira (um arquivo por chave), compartilhado pelas sessões que informam a mesma chave."""
+    return LedgerStore(caminho)
+
+def get_ledger_store():
+    """
+    Livro (Historico_Compras e Watchlist) da carteira aberta: o salvo da chave
+    informada, se o servidor permite salvar (MMPG_LEDGER_DIR), ou um livro em
+    memória só desta sessão.
+    """
+    chave = st.session_state.get('chave_carteira')
+    if LEDGER_DIR and chave:
+        return abrir_livro_salvo(portfolio_path(chave))
+    if 'livro_sessao' not in st.session_state:
+        st.session_state['livro_sessao'] = LedgerStore()
+    return st.session_state['livro_sessao']
+
+def importar_planilha(uploaded_file):
+    """Sincroniza o livro com a planilha enviada: inclui operações novas e remove as editadas ou apagadas."""
+    livro = get_ledger_store()
+    hash_arquivo = content_hash(uploaded_file.getvalue())
+    if livro.is_current(hash_arquivo):
+        return
+    df_historico, df_watchlist = load_excel_data(uploaded_file)
+    if df_historico is None or df_watchlist is None:
+        return
+    novas, removidas = livro.import_frames(df_historico, df_watchlist, hash_arquivo, uploaded_file.name)
+    st.success(f"{uploaded_file.name}: {novas} operações incluídas, {removidas} removidas.")
+
+@st.cache_data(max_entries=64, ttl=3600)
+def carregar_livro(_livro, versao):
+    """
+    Lê o livro completo; `versao` ((LedgerStore.id, LedgerStore.version)) muda a cada importação.
+    Limitado e com validade: cada sessão tem seu próprio livro, e os de sessões encerradas saem da memória.
+    """
+    return _livro.history(), _livro.watchlist()
+
 def create_example_excel():
     """Cria um arquivo Excel de exemplo para download."""
     data_historico = {
@@ -78,91 +108,55 @@ def create_example_excel():
     
     return output.getvalue()
 
-# Cache para dados da API (TTL de 15 minutos)
-@st.cache_data(ttl=900)
-def fetch_market_data(tickers):
-    """Simula a busca de dados de mercado para uma lista de tickers."""
-    # Em um ambiente de produção, esta função faria chamadas reais à API
-    # Para esta versão web, usamos dados simulados para evitar problemas de acesso à API
-    
-    market_data = {}
-    
-    # Dados simulados para demonstração
-    sample_data = {
-        'XPLG11': {'Preco_Atual': 99.70, 'Var_Dia_Pct': 0.41, 'P_VP': 0.93, 'DY_12M_Pct': 10.24, 'Liquidez_Diaria_Vol': 3226098},
-        'HGLG11': {'Preco_Atual': 160.23, 'Var_Dia_Pct': 0.14, 'P_VP': 0.98, 'DY_12M_Pct': 8.79, 'Liquidez_Diaria_Vol': 5714559},
-        'ITUB4': {'Preco_Atual': 37.79, 'Var_Dia_Pct': 0.69, 'P_VP': 1.25, 'DY_12M_Pct': 5.32, 'Liquidez_Diaria_Vol': 15000000},
-        'MXRF11': {'Preco_Atual': 9.52, 'Var_Dia_Pct': 0.53, 'P_VP': 0.85, 'DY_12M_Pct': 13.25, 'Liquidez_Diaria_Vol': 8125365},
-        'VALE3': {'Preco_Atual': 53.41, 'Var_Dia_Pct': -2.25, 'P_VP': 1.15, 'DY_12M_Pct': 6.75, 'Liquidez_Diaria_Vol': 25000000},
-        'KNRI11': {'Preco_Atual': 145.70, 'Var_Dia_Pct': 0.48, 'P_VP': 0.90, 'DY_12M_Pct': 8.80, 'Liquidez_Diaria_Vol': 6478154},
-        'VISC11': {'Preco_Atual': 103.30, 'Var_Dia_Pct': -0.54, 'P_VP': 0.84, 'DY_12M_Pct': 9.84, 'Liquidez_Diaria_Vol': 3852021},
-        'MALL11': {'Preco_Atual': 101.40, 'Var_Dia_Pct': -0.59, 'P_VP': 0.84, 'DY_12M_Pct': 10.03, 'Liquidez_Diaria_Vol': 3082284},
-        'CPTS11': {'Preco_Atual': 7.36, 'Var_Dia_Pct': -0.94, 'P_VP': 0.85, 'DY_12M_Pct': 13.25, 'Liquidez_Diaria_Vol': 8125365},
-        'TVRI11': {'Preco_Atual': 91.62, 'Var_Dia_Pct': 0.35, 'P_VP': 0.90, 'DY_12M_Pct': 13.59, 'Liquidez_Diaria_Vol': 1033718},
-        'HGRE11': {'Preco_Atual': 113.60, 'Var_Dia_Pct': 1.21, 'P_VP': 0.74, 'DY_12M_Pct': 9.94, 'Liquidez_Diaria_Vol': 1648659},
-        'VGHF11': {'Preco_Atual': 7.75, 'Var_Dia_Pct': 0.39, 'P_VP': 0.91, 'DY_12M_Pct': 14.27, 'Liquidez_Diaria_Vol': 2954165},
-        'VRTA11': {'Preco_Atual': 81.55, 'Var_Dia_Pct': -0.60, 'P_VP': 0.92, 'DY_12M_Pct': 12.92, 'Liquidez_Diaria_Vol': 1449132},
-        'XPML11': {'Preco_Atual': 104.34, 'Var_Dia_Pct': 0.14, 'P_VP': 0.89, 'DY_12M_Pct': 11.07, 'Liquidez_Diaria_Vol': 11465813}
-    }
-    
-    for ticker in tickers:
-        if ticker in sample_data:
-            market_data[ticker] = sample_data[ticker]
-            market_data[ticker]['Erro'] = None
-        else:
-            # Para tickers não encontrados no nosso conjunto de dados simulados
-            market_data[ticker] = {
-                'Preco_Atual': None,
-                'Var_Dia_Pct': None,
-                'P_VP': None,
-                'DY_12M_Pct': None,
-                'Liquidez_Diaria_Vol': None,
-                'Erro': 'Ticker não encontrado na base de dados simulada'
-            }
-    
-    # Adicionar um pequeno atraso para simular chamada de API
-    time.sleep(0.5)
-    
-    return pd.DataFrame.from_dict(market_data, orient='index')
-
-def calcular_portfolio(df_historico, df_market_data):
-    """Calcula métricas do portfólio com base no histórico e dados de mercado."""
-    if df_historico.empty:
-        return pd.DataFrame(), 0, 0, 0, 0
-
-    # Calcular custo total por transação
-    df_historico['Custo_Total_Transacao'] = (df_historico['Quantidade'] * df_historico['Preco_Compra_Unitario']) + df_historico['Corretagem_Taxas']
-
-    # Agrupar por ativo para calcular posição consolidada
-    portfolio = df_historico.groupby('Codigo_Ativo').agg(
-        Quantidade_Total=('Quantidade', 'sum'),
-        Custo_Total_Acumulado=('Custo_Total_Transacao', 'sum')
-    ).reset_index()
-
-    # Calcular Preço Médio de Compra
-    portfolio['Preco_Medio_Compra'] = portfolio['Custo_Total_Acumulado'] / portfolio['Quantidade_Total']
-
-    # Juntar com dados de mercado
-    portfolio = portfolio.merge(df_market_data[['Preco_Atual', 'Erro']], left_on='Codigo_Ativo', right_index=True, how='left')
-
-    # Calcular Valor Atual da Posição e Lucro/Prejuízo
-    portfolio['Valor_Atual_Posicao'] = portfolio['Quantidade_Total'] * portfolio['Preco_Atual']
-    # Tratar casos onde o preço atual não foi encontrado
-    portfolio['Valor_Atual_Posicao'] = portfolio['Valor_Atual_Posicao'].fillna(0)
-    portfolio['Lucro_Prejuizo_Reais'] = portfolio['Valor_Atual_Posicao'] - portfolio['Custo_Total_Acumulado']
-    # Evitar divisão por zero no cálculo percentual
-    portfolio['Lucro_Prejuizo_Perc'] = portfolio.apply(
-        lambda row: (row['Lucro_Prejuizo_Reais'] / row['Custo_Total_Acumulado'] * 100) if row['Custo_Total_Acumulado'] != 0 else 0,
-        axis=1
-    )
+# Cache persistente em disco, compartilhado entre sessões e reinícios do servidor
+@st.cache_resource
+def get_market_cache():
+    """Retorna o cache de dados de mercado (SQLite, TTL por campo, stale-while-revalidate)."""
+    # Só cotações (sem detalhes nem dividendos): arquivo próprio para não servir registros incompletos ao app_improved
+    return MarketDataCache(os.path.join(CACHE_DIR, 'quotes.sqlite'))
+
+@st.cache_resource
+def get_market_provider():
+    """Retorna o provedor de dados de mercado (MMPG_MARKET_PROVIDER: simulated ou yahoo)."""
+    return get_provider()
 
-    # Calcular totais do portfólio
-    total_investido = portfolio['Custo_Total_Acumulado'].sum()
-    total_atual = portfolio['Valor_Atual_Posicao'].sum()
-    pl_total_reais = total_atual - total_investido
-    pl_total_perc = (pl_total_reais / total_investido * 100) if total_investido != 0 else 0
+@st.cache_resource
+def get_quote_store():
+    """Cotações compartilhadas por todas as sessões do servidor, atualizadas por uma thread em segundo plano."""
+    return QuoteStore(get_market_provider().get_quotes, cache=get_market_cache())
 
-    return portfolio, total_investido, total_atual, pl_total_reais, pl_total_perc
+def fetch_market_data(tickers):
+    """Lê os dados de mercado da memória compartilhada do servidor; só tickers novos são buscados na hora."""
+    market_data = get_quote_store().get(tickers)
+    # Tabela compacta: razões em float32, textos repetidos como categorias
+    return to_frames(market_data)[0]
+
+def calcular_portfolio_incremental(df_historico, df_precos, metodo='medio', versao=None):
+    """Reaproveita as posições entre reexecuções: só ativos com histórico alterado são recalculados."""
+    if 'carteira_incremental' not in st.session_state:
+        st.session_state['carteira_incremental'] = CarteiraIncremental()
+    return st.session_state['carteira_incremental'].calcular(df_historico, df_precos, metodo, versao)
+
+def obter_indice_filtros(df_watchlist, df_market_data, df_portfolio, versao):
+    """Monta a tabela da Visão Geral e suas máscaras de filtro só quando os dados mudam, não a cada clique."""
+    chave = (versao, assinatura(df_market_data, df_portfolio))
+    guardado = st.session_state.get('indice_filtros')
+    if guardado is None or guardado[0] != chave:
+        guardado = (chave, IndiceFiltros(montar_display(df_watchlist, df_market_data, df_portfolio)))
+        st.session_state['indice_filtros'] = guardado
+    return guardado[1]
+
+def mostrar_relatorio_memoria(objetos):
+    """Memória por objeto da sessão e dos DataFrames principais na sidebar (só com MMPG_MEMORY_REPORT=1)."""
+    if not os.environ.get('MMPG_MEMORY_REPORT'):
+        return
+    objetos = {**{f'session_state.{nome}': valor for nome, valor in st.session_state.items()}, **objetos}
+    with st.sidebar.expander("🧠 Memória", expanded=False):
+        df_memoria = report(objetos)
+        st.dataframe(df_memoria[['Objeto', 'Linhas', 'MB']], hide_index=True, use_container_width=True,
+                     column_config={"MB": st.column_config.NumberColumn("MB", format="%.3f")})
+        # Objetos compartilhados (ex.: a tabela da Visão Geral) entram em mais de uma linha
+        st.caption(f"Soma: {df_memoria['MB'].sum():.2f} MB")
 
 # --- Funções de Formatação ---
 def format_currency(value):
@@ -185,6 +179,12 @@ col1, col2 = st.columns(2)
 
 with col1:
     uploaded_file = st.file_uploader("Selecione seu arquivo Excel com as abas 'Historico_Compras' e 'Watchlist'", type=['xlsx'])
+    if LEDGER_DIR:
+        st.text_input(
+            "Chave da carteira (opcional)", key='chave_carteira', type='password',
+            help="Com uma chave, a carteira fica salva no servidor e volta ao informar a mesma chave. "
+                 "Sem ela, os dados ficam só nesta sessão."
+        )
 
 with col2:
     st.write("Não tem um arquivo no formato correto? Baixe nosso modelo:")
@@ -198,32 +198,49 @@ with col2:
     st.caption("Preencha com seus dados e faça upload para usar o monitor.")
 
 # Verificar se o arquivo foi carregado
+# A planilha enviada alimenta o livro da carteira (da sessão ou salvo pela chave); as páginas leem do livro
 if uploaded_file is not None:
-    # Carregar dados do Excel
-    df_historico, df_watchlist = load_excel_data(uploaded_file)
+    importar_planilha(uploaded_file)
+
+livro = get_ledger_store()
+if not livro.is_empty():
+    # Carregar dados do livro (releitura completa só quando o livro muda)
+    versao_livro = (livro.id, livro.version())
+    df_historico, df_watchlist = carregar_livro(livro, versao_livro)
     
-    if df_historico is not None and df_watchlist is not None:
+    if not df_historico.empty:
         # --- Busca de Dados da API ---
         tickers_to_fetch = df_watchlist['Codigo_Ativo'].unique().tolist()
         df_market_data = fetch_market_data(tickers_to_fetch)
 
-        # --- Cálculo do Portfólio ---
-        df_portfolio, total_investido, total_atual, pl_total_reais, pl_total_perc = calcular_portfolio(df_historico, df_market_data)
-
         # --- Sidebar ---
         st.sidebar.title("Navegação e Filtros")
 
         st.sidebar.header("Navegação")
         pagina_selecionada = st.sidebar.radio("Selecione a Visualização", ['Visão Geral', 'Análise Individual'])
 
+        st.sidebar.header("Cálculo")
+        metodo_custo = st.sidebar.radio('Método de Custo', list(METODOS_CUSTO), index=0)
+
+        # --- Cálculo do Portfólio ---
+        try:
+            df_portfolio, total_investido, total_atual, pl_total_reais, pl_total_perc = calcular_portfolio_incremental(df_historico, df_market_data[['Preco_Atual', 'Erro']], METODOS_CUSTO[metodo_custo], versao_livro)
+        except VendaDescoberta as e:
+            st.error(f"Histórico inconsistente: {e}")
+            st.stop()
+
+        # Tabela da Visão Geral (watchlist + mercado + posições), refeita só quando os dados mudam
+        indice_filtros = obter_indice_filtros(df_watchlist, df_market_data, df_portfolio, versao_livro)
+
         st.sidebar.header("Filtros (Visão Geral)")
-        tipo_ativo_opts = sorted(df_watchlist['Tipo_Ativo'].unique())
+        tipo_ativo_opts = indice_filtros.opcoes['Tipo_Ativo']
         tipos_selecionados = st.sidebar.multiselect('Filtrar por Tipo', tipo_ativo_opts, default=tipo_ativo_opts)
 
-        setor_opts = sorted(df_watchlist['Setor'].dropna().unique())
+        setor_opts = indice_filtros.opcoes['Setor']
         setores_selecionados = st.sidebar.multiselect('Filtrar por Setor', setor_opts, default=setor_opts)
 
-        ativos_possessao = df_portfolio['Codigo_Ativo'].unique()
+        # Ativos totalmente vendidos não contam como posse
+        ativos_possessao = df_portfolio.loc[df_portfolio['Quantidade_Total'] > 0, 'Codigo_Ativo'].unique()
         filtro_posse = st.sidebar.radio('Filtrar por Posse', ['Todos da Watchlist', 'Meus Ativos'], index=0)
 
         st.sidebar.header("Seleção (Análise Individual)")
@@ -231,20 +248,19 @@ if uploaded_file is not None:
         ativo_selecionado = st.sidebar.selectbox('Selecione o Ativo para Análise', ativos_disponiveis)
 
         # --- Lógica de Filtragem (Visão Geral) ---
-        df_display = df_watchlist.merge(df_market_data, left_on='Codigo_Ativo', right_index=True, how='left')
-        df_display = df_display.merge(df_portfolio[['Codigo_Ativo', 'Quantidade_Total', 'Preco_Medio_Compra', 'Custo_Total_Acumulado', 'Valor_Atual_Posicao', 'Lucro_Prejuizo_Reais', 'Lucro_Prejuizo_Perc']], on='Codigo_Ativo', how='left')
-
-        # Aplicar filtros da sidebar
-        if filtro_posse == 'Meus Ativos':
-            df_display = df_display[df_display['Codigo_Ativo'].isin(ativos_possessao)]
-
-        if tipos_selecionados:
-            df_display = df_display[df_display['Tipo_Ativo'].isin(tipos_selecionados)]
-
-        if setores_selecionados:
-            # Incluir NaN ou vazios se nenhum setor for selecionado, ou filtrar se houver seleção
-            if len(setores_selecionados) < len(setor_opts):
-                 df_display = df_display[df_display['Setor'].isin(setores_selecionados)]
+        # Máscaras pré-calculadas; todos os setores selecionados inclui ativos sem setor
+        df_display = indice_filtros.filtrar(
+            {
+                'Tipo_Ativo': tipos_selecionados,
+                'Setor': setores_selecionados if len(setores_selecionados) < len(setor_opts) else None,
+            },
+            somente_posse=filtro_posse == 'Meus Ativos'
+        )
+
+        mostrar_relatorio_memoria({
+            'df_historico': df_historico, 'df_watchlist': df_watchlist,
+            'df_market_data': df_market_data, 'df_portfolio': df_portfolio,
+        })
 
         # --- Conteúdo Principal ---
         if pagina_selecionada == 'Visão Geral':
@@ -269,7 +285,7 @@ if uploaded_file is not None:
             df_view = df_display[[
                 'Codigo_Ativo', 'Tipo_Ativo', 'Setor', 'Preco_Atual', 'Var_Dia_Pct', 'P_VP', 'DY_12M_Pct',
                 'Quantidade_Total', 'Preco_Medio_Compra', 'Custo_Total_Acumulado',
-                'Valor_Atual_Posicao', 'Lucro_Prejuizo_Reais', 'Lucro_Prejuizo_Perc',
+                'Valor_Atual_Posicao', 'Lucro_Prejuizo_Reais', 'Lucro_Prejuizo_Perc', 'Lucro_Realizado',
                 'Liquidez_Diaria_Vol', 'Erro'
             ]].rename(columns={
                 'Codigo_Ativo': 'Código',
@@ -285,6 +301,7 @@ if uploaded_file is not None:
                 'Valor_Atual_Posicao': 'Valor Atual (R$)',
                 'Lucro_Prejuizo_Reais': 'L/P (R$)',
                 'Lucro_Prejuizo_Perc': 'L/P (%)',
+                'Lucro_Realizado': 'Lucro Realizado (R$)',
                 'Liquidez_Diaria_Vol': 'Volume Dia',
                 'Erro': 'Erro API'
             })
@@ -301,6 +318,7 @@ if uploaded_file is not None:
                 "Valor Atual (R$)": st.column_config.NumberColumn(format="R$ %.2f"),
                 "L/P (R$)": st.column_config.NumberColumn(format="R$ %.2f"),
                 "L/P (%)": st.column_config.NumberColumn(format="%.2f%%"),
+                "Lucro Realizado (R$)": st.column_config.NumberColumn(format="R$ %.2f"),
                 "Volume Dia": st.column_config.NumberColumn(format="%d"),
             }
 
@@ -359,15 +377,17 @@ if uploaded_file is not None:
                 with col4:
                     st.metric("Valor Atual Posição", format_currency(dados_ativo.get('Valor_Atual_Posicao')))
 
-                col5, col6 = st.columns(2)
+                col5, col6, col7 = st.columns(3)
                 with col5:
                      st.metric("Lucro/Prejuízo (R$)", format_currency(dados_ativo.get('Lucro_Prejuizo_Reais')))
                 with col6:
                      st.metric("Lucro/Prejuízo (%)", format_percentage(dados_ativo.get('Lucro_Prejuizo_Perc')))
+                with col7:
+                     st.metric("Lucro Realizado (R$)", format_currency(dados_ativo.get('Lucro_Realizado')))
 
                 # Mostrar histórico específico do ativo
                 with st.expander("Ver Histórico de Compras deste Ativo"):
-                    st.dataframe(df_historico[df_historico['Codigo_Ativo'] == ativo_selecionado], hide_index=True, use_container_width=True)
+                    st.dataframe(livro.history(ativo_selecionado), hide_index=True, use_container_width=True)
             else:
                 st.info("Você não possui este ativo em carteira (segundo o histórico de compras).")
 
@@ -381,12 +401,14 @@ if uploaded_file is not None:
             st.write(dados_ativo.get('Observacoes', ''))
 
     else:
-        st.error("Não foi possível carregar os dados do arquivo. Verifique se o formato está correto e tente novamente.")
-        st.info("Baixe o arquivo de exemplo para ver o formato esperado.")
+        st.info("Nenhuma operação salva em 'Historico_Compras'. Envie uma planilha com o histórico de compras.")
 
 else:
     # Mostrar informações iniciais quando nenhum arquivo foi carregado
-    st.info("👆 Faça upload do seu arquivo Excel para começar a monitorar seu portfólio.")
+    st.info(
+        "👆 Faça upload do seu arquivo Excel para começar a monitorar seu portfólio."
+        + (" Os dados ficam salvos para as próximas visitas com esta chave." if livro.path != MEMORY else "")
+    )
     
     st.markdown("""
     ### Como usar esta aplicação:
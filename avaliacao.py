@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Núcleo da avaliação da carteira sem Streamlit, usado pelos apps e por avaliar_carteiras.py
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from ledger import TipoOperacaoInvalido, sinal_operacao
+from portfolio import calcular_portfolio, dividir, valorizar_posicoes
+from workbook import get_workbook_cache
+
+ABAS = ['Historico_Compras', 'Watchlist']
+COLUNAS_HISTORICO = ['Data_Compra', 'Codigo_Ativo', 'Tipo_Ativo', 'Quantidade', 'Preco_Compra_Unitario']
+COLUNAS_WATCHLIST = ['Codigo_Ativo', 'Tipo_Ativo']
+
+
+class PlanilhaInvalida(ValueError):
+    """Planilha sem as abas ou colunas esperadas."""
+
+
+def carregar_planilha(dados):
+    """
+    Lê as abas Historico_Compras e Watchlist dos bytes de um arquivo Excel.
+    Retorna (df_historico, df_watchlist) ou levanta PlanilhaInvalida.
+    """
+    try:
+        # Uma única leitura das duas abas; reenvios do mesmo arquivo vêm do cache
+        abas = get_workbook_cache().read(dados, ABAS, {'Historico_Compras': ['Data_Compra']})
+    except ValueError as e:
+        raise PlanilhaInvalida(str(e)) from e
+    df_historico, df_watchlist = abas['Historico_Compras'], abas['Watchlist']
+
+    # Validar colunas essenciais
+    if not all(col in df_historico.columns for col in COLUNAS_HISTORICO):
+        raise PlanilhaInvalida(f"A aba 'Historico_Compras' deve conter as colunas: {', '.join(COLUNAS_HISTORICO)}")
+    if not all(col in df_watchlist.columns for col in COLUNAS_WATCHLIST):
+        raise PlanilhaInvalida(f"A aba 'Watchlist' deve conter as colunas: {', '.join(COLUNAS_WATCHLIST)}")
+
+    if 'Tipo_Operacao' in df_historico.columns:
+        try:
+            sinal_operacao(df_historico['Tipo_Operacao'])
+        except TipoOperacaoInvalido as e:
+            raise PlanilhaInvalida(str(e)) from e
+
+    # Garantir que Codigo_Ativo seja string e remover espaços
+    df_historico['Codigo_Ativo'] = df_historico['Codigo_Ativo'].astype(str).str.strip()
+    df_watchlist['Codigo_Ativo'] = df_watchlist['Codigo_Ativo'].astype(str).str.strip()
+
+    # Adicionar coluna Corretagem_Taxas se não existir
+    if 'Corretagem_Taxas' not in df_historico.columns:
+        df_historico['Corretagem_Taxas'] = 0
+    df_historico['Corretagem_Taxas'] = df_historico['Corretagem_Taxas'].fillna(0)
+
+    return df_historico, df_watchlist
+
+
+def montar_tabela_dividendos(market_data):
+    """
+    Junta os DataFrames da coluna 'Historico_Dividendos' de `market_data`
+    em uma única tabela longa (Codigo_Ativo, Data, Valor, ...) ordenada por
+    data. Os DataFrames originais não são alterados.
+    """
+    colunas = ['Codigo_Ativo', 'Data', 'Valor']
+    if 'Historico_Dividendos' not in market_data.columns:
+        return pd.DataFrame(columns=colunas)
+
+    historicos = market_data['Historico_Dividendos']
+    historicos = historicos[historicos.map(lambda h: isinstance(h, pd.DataFrame))]
+    if historicos.empty:
+        return pd.DataFrame(columns=colunas)
+
+    tabela = pd.concat(historicos.tolist(), keys=historicos.index, names=['Codigo_Ativo', None])
+    tabela = tabela.reset_index(level=0).reset_index(drop=True)
+    tabela['Data'] = pd.to_datetime(tabela['Data'])
+    return tabela.sort_values('Data', kind='stable', ignore_index=True)
+
+
+def prever_pagamento_mes(df_dividendos, tickers, referencia=None):
+    """
+    Retorna uma Series com o valor projetado do pagamento (aluguel/dividendo)
+    no mês de `referencia` (padrão: mês atual) para cada ticker: o último
+    pagamento com data até o fim daquele mês. Resolvido para todos os tickers
+    de uma vez com merge_asof sobre a tabela longa ordenada por data.
+    """
+    referencia = pd.Timestamp(referencia or datetime.now())
+    fim_do_mes = referencia.normalize().replace(day=1) + pd.DateOffset(months=1) - pd.Timedelta(1, 'ns')
+
+    tickers = pd.Index(tickers)
+    if df_dividendos.empty:
+        return pd.Series(float("nan"), index=tickers, name="Prev_Pag_Mes_Atual")
+
+    consulta = pd.DataFrame({'Codigo_Ativo': tickers.astype(str), 'Data': fim_do_mes})
+    consulta['Data'] = consulta['Data'].astype(df_dividendos['Data'].dtype)
+    if isinstance(df_dividendos['Codigo_Ativo'].dtype, pd.CategoricalDtype):
+        # Tabela compacta: a chave precisa ter o mesmo dtype (tickers fora dela viram NaN)
+        consulta['Codigo_Ativo'] = pd.Categorical(consulta['Codigo_Ativo'], dtype=df_dividendos['Codigo_Ativo'].dtype)
+    ultimos = pd.merge_asof(
+        consulta,
+        df_dividendos[['Data', 'Codigo_Ativo', 'Valor']],
+        on='Data',
+        by='Codigo_Ativo',
+        direction='backward'
+    )
+    return pd.Series(ultimos['Valor'].astype(float).to_numpy(), index=tickers, name="Prev_Pag_Mes_Atual")
+
+
+def calcular_previsao_mes_atual_market(market_data):
+    """
+    Recebe o DataFrame `market_data` (retornado por fetch_market_data),
+    que deve conter, entre outras colunas, um possível DataFrame em cada linha
+    na coluna 'Historico_Dividendos'. Retorna uma Series com o valor projetado
+    do pagamento (aluguel/dividendo) para o mês atual para cada ticker.
+    """
+    return prever_pagamento_mes(montar_tabela_dividendos(market_data), market_data.index)
+
+
+def buscar_dados_mercado(tickers, provider=None):
+    """
+    Busca cotações e detalhes de `tickers` em uma única chamada ao provedor.
+    Retorna (df_market_data indexado por ticker, previsão do mês por ticker).
+    """
+    if provider is None:
+        # market_data monta os dados simulados ao ser importado
+        from market_data import get_provider
+        provider = get_provider()
+
+    tickers = list(dict.fromkeys(tickers))
+    df_market_data = pd.DataFrame.from_dict(provider.get_market_data(tickers), orient='index').reindex(tickers)
+    return df_market_data, calcular_previsao_mes_atual_market(df_market_data)
+
+
+def resumir_carteira(df_portfolio):
+    """Uma linha com os totais de uma carteira já valorizada."""
+    if df_portfolio.empty:
+        total_investido = total_atual = lucro_realizado = previsao = 0.0
+        ativos = 0
+    else:
+        total_investido = df_portfolio['Custo_Total_Acumulado'].sum()
+        total_atual = df_portfolio['Valor_Atual_Posicao'].sum()
+        lucro_realizado = df_portfolio['Lucro_Realizado'].sum()
+        previsao = (df_portfolio['Quantidade_Total'] * df_portfolio['Prev_Pag_Mes_Atual']).sum()
+        ativos = int((df_portfolio['Quantidade_Total'] > 0).sum())
+    pl_total_reais = total_atual - total_investido
+    return pd.DataFrame([{
+        'Total_Investido': total_investido,
+        'Total_Atual': total_atual,
+        'Lucro_Prejuizo_Reais': pl_total_reais,
+        'Lucro_Prejuizo_Perc': pl_total_reais / total_investido * 100 if total_investido != 0 else 0,
+        'Lucro_Realizado': lucro_realizado,
+        'Previsao_Recebimento_Mes': previsao,
+        'Ativos': ativos,
+    }])
+
+
+def avaliar_planilha(df_historico, df_watchlist, df_market_data, previsao, metodo='medio'):
+    """
+    Avalia uma planilha já carregada com dados de mercado já buscados.
+    Retorna um dict com 'Carteira' (uma linha por ativo, com previsão do
+    mês), 'Resumo' (uma linha com os totais) e 'Watchlist' (watchlist com
+    dados de mercado).
+    """
+    df_portfolio = calcular_portfolio(df_historico, df_market_data[['Preco_Atual', 'Erro']], metodo)[0]
+    if not df_portfolio.empty:
+        df_portfolio['Prev_Pag_Mes_Atual'] = previsao.reindex(df_portfolio['Codigo_Ativo']).to_numpy()
+
+    colunas_mercado = [c for c in df_market_data.columns if c != 'Historico_Dividendos' and c not in df_watchlist.columns]
+    watchlist = df_watchlist.merge(df_market_data[colunas_mercado], left_on='Codigo_Ativo', right_index=True, how='left')
+    watchlist['Prev_Pag_Mes_Atual'] = previsao.reindex(watchlist['Codigo_Ativo']).to_numpy()
+
+    return {'Carteira': df_portfolio, 'Resumo': resumir_carteira(df_portfolio), 'Watchlist': watchlist}
+
+
+def avaliar_carteira(dados, provider=None, metodo='medio'):
+    """Avalia uma planilha (bytes) de ponta a ponta; mesmo retorno de `avaliar_planilha`."""
+    df_historico, df_watchlist = carregar_planilha(dados)
+    df_market_data, previsao = buscar_dados_mercado(
+        df_watchlist['Codigo_Ativo'].tolist() + df_historico['Codigo_Ativo'].tolist(), provider
+    )
+    return avaliar_planilha(df_historico, df_watchlist, df_market_data, previsao, metodo)
+
+
+def consolidar_carteiras(carteiras, df_market_data, previsao):
+    """
+    Soma as posições de várias carteiras (de `avaliar_planilha`) em uma só,
+    revalorizada com `df_market_data`. Cada carteira mantém seu próprio
+    custo e lucro realizado; o preço médio consolidado é custo / quantidade.
+    """
+    carteiras = [c for c in carteiras if not c.empty]
+    if not carteiras:
+        return pd.DataFrame()
+    colunas = ['Quantidade_Total', 'Custo_Total_Acumulado', 'Lucro_Realizado', 'Quantidade_Comprada', 'Quantidade_Vendida']
+    posicoes = pd.concat([c[['Codigo_Ativo'] + colunas] for c in carteiras], ignore_index=True)
+    posicoes = posicoes.groupby('Codigo_Ativo', sort=True, as_index=False)[colunas].sum()
+    posicoes.insert(3, 'Preco_Medio_Compra', dividir(posicoes['Custo_Total_Acumulado'], posicoes['Quantidade_Total'], np.nan))
+    consolidado = valorizar_posicoes(posicoes, df_market_data[['Preco_Atual', 'Erro']])[0]
+    consolidado['Prev_Pag_Mes_Atual'] = previsao.reindex(consolidado['Codigo_Ativo']).to_numpy()
+    return consolidado
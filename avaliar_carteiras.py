@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Só a biblioteca padrão no topo: pandas e o núcleo são importados depois de
+# ler os argumentos, então --help e erros de uso respondem na hora.
+import argparse
+import glob
+import os
+import sys
+import time
+
+
+def listar_planilhas(caminhos):
+    """Expande arquivos, diretórios (todos os .xlsx) e padrões glob, sem repetir."""
+    planilhas = []
+    for caminho in caminhos:
+        if os.path.isdir(caminho):
+            planilhas += sorted(glob.glob(os.path.join(caminho, '*.xlsx')))
+        elif glob.has_magic(caminho):
+            planilhas += sorted(glob.glob(caminho))
+        else:
+            planilhas.append(caminho)
+    # Arquivos temporários do Excel (~$arquivo.xlsx) não são planilhas
+    return [p for p in dict.fromkeys(planilhas) if not os.path.basename(p).startswith('~$')]
+
+
+def carregar_arquivo(caminho):
+    """Executado nos processos do pool: lê e valida uma planilha."""
+    from avaliacao import carregar_planilha
+
+    with open(caminho, 'rb') as f:
+        return carregar_planilha(f.read())
+
+
+def carregar_planilhas(planilhas, workers=None):
+    """
+    Lê as planilhas em um pool de processos (a leitura do Excel é o passo
+    caro), então o total fica próximo ao da planilha mais lenta.
+    Retorna ({caminho: (df_historico, df_watchlist)}, {caminho: erro}).
+    """
+    carregadas, falhas = {}, {}
+    if len(planilhas) == 1 or workers == 1:
+        for caminho in planilhas:
+            try:
+                carregadas[caminho] = carregar_arquivo(caminho)
+            except Exception as e:
+                falhas[caminho] = str(e)
+        return carregadas, falhas
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(min(workers or os.cpu_count() or 1, len(planilhas))) as pool:
+        futuros = {pool.submit(carregar_arquivo, caminho): caminho for caminho in planilhas}
+        for futuro in as_completed(futuros):
+            caminho = futuros[futuro]
+            try:
+                carregadas[caminho] = futuro.result()
+            except Exception as e:
+                falhas[caminho] = str(e)
+    return carregadas, falhas
+
+
+def avaliar_planilhas(carregadas, provider, metodo):
+    """
+    Busca cada ticker uma única vez para todas as planilhas e monta as
+    tabelas por cliente (coluna Arquivo) e a carteira consolidada.
+    Planilhas que falham na avaliação (ex.: VendaDescoberta) ficam de fora.
+    Retorna (tabelas, nº de tickers, {caminho: erro}).
+    """
+    import pandas as pd
+
+    from avaliacao import avaliar_planilha, buscar_dados_mercado, consolidar_carteiras, resumir_carteira
+
+    tickers = [
+        ticker
+        for df_historico, df_watchlist in carregadas.values()
+        for ticker in df_watchlist['Codigo_Ativo'].tolist() + df_historico['Codigo_Ativo'].tolist()
+    ]
+    df_market_data, previsao = buscar_dados_mercado(tickers, provider)
+
+    resultados, falhas = {}, {}
+    for caminho, (df_historico, df_watchlist) in carregadas.items():
+        try:
+            resultado = avaliar_planilha(df_historico, df_watchlist, df_market_data, previsao, metodo)
+        except Exception as e:
+            falhas[caminho] = str(e)
+            continue
+        for tabela in resultado.values():
+            tabela.insert(0, 'Arquivo', os.path.basename(caminho))
+        resultados[caminho] = resultado
+    if not resultados:
+        return {}, len(set(tickers)), falhas
+
+    tabelas = {
+        nome: pd.concat([r[nome] for r in resultados.values()], ignore_index=True)
+        for nome in ('Carteira', 'Resumo', 'Watchlist')
+    }
+    consolidado = consolidar_carteiras([r['Carteira'] for r in resultados.values()], df_market_data, previsao)
+    if len(resultados) > 1:
+        total = resumir_carteira(consolidado)
+        total.insert(0, 'Arquivo', 'Consolidado')
+        tabelas['Resumo'] = pd.concat([tabelas['Resumo'], total], ignore_index=True)
+    tabelas['Consolidado'] = consolidado
+    return tabelas, len(set(tickers)), falhas
+
+
+def gravar_tabelas(tabelas, saida):
+    """Grava as tabelas em um .xlsx (uma aba cada) ou em um arquivo .csv/.parquet por tabela."""
+    base, extensao = os.path.splitext(saida)
+    if os.path.dirname(saida):
+        os.makedirs(os.path.dirname(saida), exist_ok=True)
+    if extensao == '.xlsx':
+        import pandas as pd
+
+        with pd.ExcelWriter(saida) as writer:
+            for nome, df in tabelas.items():
+                df.to_excel(writer, sheet_name=nome, index=False)
+        return [saida]
+
+    arquivos = []
+    for nome, df in tabelas.items():
+        caminho = saida if nome == 'Carteira' else f'{base}_{nome.lower()}{extensao}'
+        if extensao == '.csv':
+            df.to_csv(caminho, index=False)
+        else:
+            df.to_parquet(caminho, index=False)
+        arquivos.append(caminho)
+    return arquivos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Avalia e consolida uma ou várias planilhas de carteira sem abrir o app.")
+    parser.add_argument('planilhas', nargs='+', help="Arquivos .xlsx, diretórios ou padrões (ex.: 'carteiras/*.xlsx')")
+    parser.add_argument('-o', '--output', default='carteira.csv',
+                        help="Saída .csv, .parquet ou .xlsx; Resumo, Watchlist e Consolidado vão para "
+                             "<nome>_resumo/_watchlist/_consolidado (ou abas, no .xlsx)")
+    parser.add_argument('--metodo', choices=['medio', 'fifo'], default='medio', help="Método de custo das vendas")
+    parser.add_argument('--provider', default=None, help="Provedor de cotações (padrão: MMPG_MARKET_PROVIDER ou simulated)")
+    parser.add_argument('--workers', type=int, default=None, help="Processos de leitura (padrão: nº de CPUs)")
+    args = parser.parse_args(argv)
+
+    planilhas = listar_planilhas(args.planilhas)
+    if not planilhas:
+        parser.error("nenhuma planilha encontrada")
+    if os.path.splitext(args.output)[1] not in ('.csv', '.parquet', '.xlsx'):
+        parser.error("a saída deve ser .csv, .parquet ou .xlsx")
+
+    from market_data import get_provider
+
+    inicio = time.perf_counter()
+    ordem = {caminho: i for i, caminho in enumerate(planilhas)}
+    carregadas, falhas = carregar_planilhas(planilhas, args.workers)
+    carregadas = dict(sorted(carregadas.items(), key=lambda item: ordem[item[0]]))
+    for caminho, erro in falhas.items():
+        print(f"{caminho}: ERRO {erro}", file=sys.stderr)
+    leitura = time.perf_counter() - inicio
+
+    if carregadas:
+        tabelas, n_tickers, falhas_avaliacao = avaliar_planilhas(carregadas, get_provider(args.provider), args.metodo)
+        for caminho, erro in falhas_avaliacao.items():
+            print(f"{caminho}: ERRO {erro}", file=sys.stderr)
+        falhas.update(falhas_avaliacao)
+        if tabelas:
+            arquivos = gravar_tabelas(tabelas, args.output)
+            print(
+                f"{len(carregadas) - len(falhas_avaliacao)} planilhas ({n_tickers} tickers distintos) avaliadas em "
+                f"{time.perf_counter() - inicio:.2f}s (leitura {leitura:.2f}s) -> {', '.join(arquivos)}"
+            )
+    if falhas:
+        print(f"{len(falhas)} planilhas com erro: {', '.join(falhas)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,13 +3,24 @@
 
 import sys
 sys.path.append('/opt/.manus/.sandbox-runtime')
-from data_api import ApiClient
+try:
+    from data_api import ApiClient
+except ImportError:
+    # Outside the sandbox runtime only the FakeApiClient below is available
+    ApiClient = None
 import pandas as pd
+import random
+import threading
 import time
 import json # Import json for potential debugging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from upstream import RETRY_STATUSES, YAHOO_HOST, Upstream, UpstreamError, get_upstream, parse_retry_after
+from upstream import RateLimiter  # noqa: F401 (moved to upstream, kept importable from here)
 
 # Initialize API client
-client = ApiClient()
+client = ApiClient() if ApiClient is not None else None
 
 # List of tickers from the watchlist (add .SA suffix for B3)
 tickers_br = [
@@ -18,88 +29,241 @@ tickers_br = [
     'HGRE11.SA', 'VGHF11.SA', 'VRTA11.SA', 'XPML11.SA'
 ]
 
-def fetch_market_data(tickers):
-    """Fetches market data for a list of tickers using YahooFinance API."""
-    market_data = {}
-    print(f"Fetching data for: {tickers}")
-    for ticker in tickers:
-        ticker_key = ticker.replace('.SA', '') # Key for the dictionary
-        try:
-            print(f"Fetching {ticker}...")
-            api_response = client.call_api('YahooFinance/get_stock_chart',
-                                           query={'symbol': ticker,
-                                                  'region': 'BR',
-                                                  'interval': '1d',
-                                                  'range': '5d', # Get last few days
-                                                  'includePrePost': False,
-                                                  'includeAdjustedClose': False})
-
-            # Check for errors in response
-            chart_data = api_response.get('chart', {})
-            if chart_data.get('error'):
-                error_message = chart_data['error']
-                print(f"API Error for {ticker}: {error_message}")
-                market_data[ticker_key] = {'Preco_Atual': None, 'Erro': str(error_message)}
-                continue
-
-            result = chart_data.get('result', [])
-            if not result or not result[0].get('meta'):
-                print(f"No data/meta found for {ticker} in response: {json.dumps(api_response)}")
-                market_data[ticker_key] = {'Preco_Atual': None, 'Erro': 'No data/meta found'}
-                continue
-
-            meta = result[0]['meta']
-            indicators = result[0].get('indicators', {}).get('quote', [{}])[0]
-            timestamps = result[0].get('timestamp', [])
-
-            # Get the latest regular market price from meta
-            current_price = meta.get('regularMarketPrice')
-            previous_close = meta.get('chartPreviousClose')
-            daily_change_pct = None
-            if current_price is not None and previous_close is not None and previous_close != 0:
-                 daily_change_pct = ((current_price / previous_close) - 1) * 100
-
-            # Fallback: get the last closing price from indicators if meta price is missing
-            if current_price is None and 'close' in indicators and indicators['close']:
-                last_valid_close = next((price for price in reversed(indicators['close']) if price is not None), None)
-                current_price = last_valid_close
-                # Cannot calculate daily change accurately without current market price vs previous close
-                daily_change_pct = None # Or calculate based on last two closes if needed
-
-            # Store data
-            market_data[ticker_key] = {
-                'Preco_Atual': current_price,
-                'Var_Dia_Pct': daily_change_pct,
-                # Add placeholders for other data points
-                'P_VP': None,
-                'DY_12M_Pct': None,
-                'Ult_Dividendo': None,
-                'Data_Ult_Div': None,
-                'Liquidez_Diaria': meta.get('regularMarketVolume'), # Using volume as proxy for now
-                'Patrimonio_Liq': None,
-                'VPA': None,
-                'Erro': None # Explicitly set error to None on success
+# Defaults for the concurrent fetch engine
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_RATE_LIMIT = 10.0 # Requests per second across all workers (see upstream.HOST_LIMITS)
+
+# ApiClient reports HTTP failures as plain exceptions ("HTTP Error 429: Too Many Requests")
+HTTP_STATUS_PATTERN = re.compile(r'\b(?:HTTP Error|status(?: code)?:?)\s*(\d{3})\b', re.IGNORECASE)
+# Chart error codes that mean "slow down or try later"
+CHART_ERROR_STATUSES = {
+    'Too Many Requests': 429,
+    'Internal Server Error': 500,
+    'Bad Gateway': 502,
+    'Service Unavailable': 503,
+    'Gateway Timeout': 504,
+}
+
+
+class FakeApiClient:
+    """Local stand-in for ApiClient with configurable latency, used to measure throughput."""
+
+    def __init__(self, latency=0.2, jitter=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def call_api(self, api_name, query=None):
+        query = query or {}
+        symbol = query.get('symbol', '')
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+        time.sleep(delay)
+
+        if failed:
+            return {'chart': {'result': None,
+                              'error': {'code': 'Not Found', 'description': f'No data found, symbol may be delisted: {symbol}'}}}
+
+        # Deterministic prices per symbol so repeated runs are comparable
+        base = 10 + sum(ord(c) for c in symbol) % 150
+        closes = [round(base * (1 + 0.002 * i), 2) for i in range(5)]
+        now = int(time.time())
+        return {
+            'chart': {
+                'result': [{
+                    'meta': {
+                        'symbol': symbol,
+                        'regularMarketPrice': closes[-1],
+                        'chartPreviousClose': closes[-2],
+                        'regularMarketVolume': 1000 * base,
+                    },
+                    'timestamp': [now - 86400 * (4 - i) for i in range(5)],
+                    'indicators': {'quote': [{'close': closes}]},
+                }],
+                'error': None,
             }
-            print(f"Success for {ticker}: Price={current_price}")
+        }
+
+
+def http_status(error):
+    """HTTP status of an ApiClient failure, from the exception's attributes or its message; None if unknown."""
+    response = getattr(error, 'response', None)
+    for value in (getattr(error, 'status', None), getattr(error, 'code', None), getattr(response, 'status_code', None)):
+        if isinstance(value, int):
+            return value
+    match = HTTP_STATUS_PATTERN.search(str(error))
+    return int(match.group(1)) if match else None
+
+
+def call_chart_api(api_client, query):
+    """Calls YahooFinance/get_stock_chart, raising HTTP failures as UpstreamError(YAHOO_HOST, status).
+
+    That is what upstream needs to back off on 429/5xx (honouring Retry-After
+    when the error carries headers) and to trip the breaker. A chart error
+    whose code is a throttling/server status is raised the same way; other
+    chart errors (e.g. unknown symbol) are returned for the caller.
+    """
+    try:
+        response = api_client.call_api('YahooFinance/get_stock_chart', query=query)
+    except UpstreamError:
+        raise
+    except Exception as e:
+        status = http_status(e)
+        if status is None:
+            raise
+        headers = getattr(e, 'headers', None) or getattr(getattr(e, 'response', None), 'headers', None)
+        retry_after = parse_retry_after(headers.get('Retry-After')) if headers else None
+        raise UpstreamError(YAHOO_HOST, status, str(e), retry_after=retry_after) from e
+
+    error = (response or {}).get('chart', {}).get('error')
+    if error:
+        code = error.get('code') if isinstance(error, dict) else error
+        status = code if isinstance(code, int) else CHART_ERROR_STATUSES.get(code) or http_status(code)
+        if status in RETRY_STATUSES:
+            raise UpstreamError(YAHOO_HOST, status, f"{YAHOO_HOST} chart error: {error}")
+    return response
+
+
+def fetch_ticker_data(ticker, api_client=None, upstream=None):
+    """Fetches market data for a single ticker. Returns (ticker_key, data dict).
+
+    The call goes through `upstream` (default: the shared get_upstream()), which
+    paces, retries and fails fast while YahooFinance is down; failures end up
+    in 'Erro' so the caches keep serving the last good value.
+    """
+    api_client = api_client or client
+    upstream = upstream or get_upstream()
+    ticker_key = ticker.replace('.SA', '') # Key for the dictionary
+    try:
+        print(f"Fetching {ticker}...")
+        api_response = upstream.call(YAHOO_HOST, call_chart_api, api_client,
+                                     {'symbol': ticker,
+                                      'region': 'BR',
+                                      'interval': '1d',
+                                      'range': '5d', # Get last few days
+                                      'includePrePost': False,
+                                      'includeAdjustedClose': False})
+
+        # Check for errors in response
+        chart_data = api_response.get('chart', {})
+        if chart_data.get('error'):
+            error_message = chart_data['error']
+            print(f"API Error for {ticker}: {error_message}")
+            return ticker_key, {'Preco_Atual': None, 'Erro': str(error_message)}
 
-        except Exception as e:
-            print(f"Error processing data for {ticker}: {e}")
-            # Ensure the key exists even if an exception occurs during processing
-            if ticker_key not in market_data:
-                 market_data[ticker_key] = {'Preco_Atual': None, 'Erro': str(e)}
-            else:
-                 # If data was partially fetched before error, update the error field
-                 market_data[ticker_key]['Erro'] = str(e)
+        result = chart_data.get('result', [])
+        if not result or not result[0].get('meta'):
+            print(f"No data/meta found for {ticker} in response: {json.dumps(api_response)}")
+            return ticker_key, {'Preco_Atual': None, 'Erro': 'No data/meta found'}
 
-        # Add a small delay to avoid hitting API rate limits, if any
-        time.sleep(0.5)
+        meta = result[0]['meta']
+        indicators = result[0].get('indicators', {}).get('quote', [{}])[0]
+        timestamps = result[0].get('timestamp', [])
+
+        # Get the latest regular market price from meta
+        current_price = meta.get('regularMarketPrice')
+        previous_close = meta.get('chartPreviousClose')
+        daily_change_pct = None
+        if current_price is not None and previous_close is not None and previous_close != 0:
+             daily_change_pct = ((current_price / previous_close) - 1) * 100
+
+        # Fallback: get the last closing price from indicators if meta price is missing
+        if current_price is None and 'close' in indicators and indicators['close']:
+            last_valid_close = next((price for price in reversed(indicators['close']) if price is not None), None)
+            current_price = last_valid_close
+            # Cannot calculate daily change accurately without current market price vs previous close
+            daily_change_pct = None # Or calculate based on last two closes if needed
+
+        print(f"Success for {ticker}: Price={current_price}")
+        return ticker_key, {
+            'Preco_Atual': current_price,
+            'Var_Dia_Pct': daily_change_pct,
+            # Add placeholders for other data points
+            'P_VP': None,
+            'DY_12M_Pct': None,
+            'Ult_Dividendo': None,
+            'Data_Ult_Div': None,
+            'Liquidez_Diaria': meta.get('regularMarketVolume'), # Using volume as proxy for now
+            'Patrimonio_Liq': None,
+            'VPA': None,
+            'Erro': None # Explicitly set error to None on success
+        }
+
+    except Exception as e:
+        print(f"Error processing data for {ticker}: {e}")
+        return ticker_key, {'Preco_Atual': None, 'Erro': str(e)}
+
+
+def fetch_market_data(tickers, max_workers=DEFAULT_MAX_WORKERS, rate_limit=None, api_client=None, upstream=None):
+    """Fetches market data for a list of tickers using YahooFinance API.
+
+    Tickers are fetched concurrently by a thread pool of `max_workers`. Calls
+    are paced by the YahooFinance token bucket of `upstream` (default: the
+    process-wide one, shared with every other fetch); passing `rate_limit`
+    uses a private bucket of `rate_limit` requests/second instead.
+    The result keeps the input order and the same per-ticker dict shape.
+    """
+    api_client = api_client or client
+    if api_client is None:
+        raise RuntimeError("No ApiClient available; pass api_client=FakeApiClient() outside the sandbox runtime")
+    if upstream is None:
+        upstream = get_upstream() if rate_limit is None else Upstream({YAHOO_HOST: (rate_limit, 1)})
+
+    print(f"Fetching data for: {tickers}")
+
+    def worker(ticker):
+        return fetch_ticker_data(ticker, api_client, upstream)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = list(executor.map(worker, tickers))
+
+    return dict(results)
+
+
+def benchmark(n_tickers=300, latency=0.2, max_workers=DEFAULT_MAX_WORKERS, rate_limit=DEFAULT_RATE_LIMIT):
+    """Compares the old sequential behaviour with the concurrent engine using FakeApiClient."""
+    tickers = [f'TICK{i:03d}11.SA' for i in range(n_tickers)]
+    timings = {}
+    # Old loop: one request at a time plus a 0.5 s sleep, i.e. at most 2 requests/second
+    for label, workers, rate in [('sequential', 1, 2.0), ('concurrent', max_workers, rate_limit)]:
+        fake = FakeApiClient(latency=latency)
+        start = time.perf_counter()
+        data = fetch_market_data(tickers, max_workers=workers, rate_limit=rate, api_client=fake)
+        timings[label] = time.perf_counter() - start
+        assert len(data) == n_tickers
+    return timings
 
-    return market_data
 
 # --- Main execution for testing ---
 if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fetch market data or benchmark the concurrent fetcher.")
+    parser.add_argument('--fake', action='store_true', help="Use FakeApiClient instead of the real API")
+    parser.add_argument('--benchmark', action='store_true', help="Compare sequential vs concurrent fetch with FakeApiClient")
+    parser.add_argument('--tickers', type=int, default=300, help="Number of synthetic tickers for --benchmark")
+    parser.add_argument('--latency', type=float, default=0.2, help="FakeApiClient latency in seconds")
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS)
+    parser.add_argument('--rate', type=float, default=None,
+                        help=f"Max requests per second (default: shared YahooFinance bucket, {DEFAULT_RATE_LIMIT}/s)")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        timings = benchmark(args.tickers, args.latency, args.workers, args.rate or DEFAULT_RATE_LIMIT)
+        print("\n--- Benchmark ---")
+        for label, seconds in timings.items():
+            print(f"{label:>10}: {seconds:8.2f}s ({args.tickers / seconds:6.1f} tickers/s)")
+        print(f"speedup: {timings['sequential'] / timings['concurrent']:.1f}x")
+        sys.exit(0)
+
     print("Testing API data fetch...")
-    fetched_data = fetch_market_data(tickers_br)
+    api_client = FakeApiClient(latency=args.latency) if args.fake else None
+    fetched_data = fetch_market_data(tickers_br, max_workers=args.workers, rate_limit=args.rate, api_client=api_client)
     print("\n--- Fetched Data ---")
     # Use json dumps for potentially cleaner dictionary printing
     print(json.dumps(fetched_data, indent=4))
@@ -108,4 +272,5 @@ if __name__ == '__main__':
     df_fetched = pd.DataFrame.from_dict(fetched_data, orient='index')
     print("\n--- DataFrame ---")
     print(df_fetched)
-
+    print("\n--- Upstream ---")
+    print(pd.DataFrame(get_upstream().metrics()).T)
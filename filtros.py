@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+# Colunas de df_portfolio exibidas junto à watchlist
+COLUNAS_POSICAO = [
+    'Codigo_Ativo', 'Quantidade_Total', 'Preco_Medio_Compra',
+    'Custo_Total_Acumulado', 'Valor_Atual_Posicao',
+    'Lucro_Prejuizo_Reais', 'Lucro_Prejuizo_Perc', 'Lucro_Realizado'
+]
+
+# Colunas com DataFrames por linha, que não entram na assinatura
+COLUNAS_NAO_HASHEAVEIS = ['Historico_Dividendos']
+
+
+def assinatura(*frames):
+    """Hash do conteúdo (valores, índice e colunas) dos DataFrames; muda quando qualquer valor muda."""
+    resumo = hashlib.sha1()
+    for df in frames:
+        df = df.drop(columns=COLUNAS_NAO_HASHEAVEIS, errors='ignore')
+        resumo.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+        resumo.update('\x1f'.join(map(str, df.columns)).encode())
+    return resumo.hexdigest()
+
+
+def montar_display(df_watchlist, df_market_data, df_portfolio):
+    """Watchlist + dados de mercado + posição por ativo (tabela da Visão Geral)."""
+    df_display = df_watchlist.merge(df_market_data, left_on='Codigo_Ativo', right_index=True, how='left')
+    return df_display.merge(df_portfolio[COLUNAS_POSICAO], on='Codigo_Ativo', how='left')
+
+
+class IndiceFiltros:
+    """
+    Tabela da Visão Geral montada uma vez, com Tipo_Ativo e Setor categóricos
+    e uma máscara booleana pré-calculada por valor de cada coluna e para a
+    posse (Quantidade_Total > 0). Cada combinação de filtros é resolvida com
+    OR das máscaras dos valores escolhidos e AND entre colunas.
+    """
+
+    def __init__(self, df_display, colunas=('Tipo_Ativo', 'Setor')):
+        self.df = df_display.reset_index(drop=True)
+        self.opcoes = {}
+        self.mascaras = {}
+        for coluna in colunas:
+            if coluna not in self.df.columns:
+                continue
+            categorias = self.df[coluna].astype('category')
+            self.df[coluna] = categorias
+            codigos = categorias.cat.codes.to_numpy()
+            valores = list(categorias.cat.categories)
+            self.opcoes[coluna] = sorted(valores)
+            self.mascaras[coluna] = {valor: codigos == i for i, valor in enumerate(valores)}
+        quantidade = self.df['Quantidade_Total'] if 'Quantidade_Total' in self.df.columns else pd.Series(0, index=self.df.index)
+        self.posse = (quantidade.fillna(0) > 0).to_numpy()
+
+    def mascara(self, coluna, valores):
+        """OR das máscaras dos `valores` de `coluna` (valores desconhecidos não casam nada)."""
+        resultado = np.zeros(len(self.df), dtype=bool)
+        for valor in valores:
+            mascara = self.mascaras[coluna].get(valor)
+            if mascara is not None:
+                resultado |= mascara
+        return resultado
+
+    def filtrar(self, selecoes=None, somente_posse=False):
+        """
+        Linhas que atendem a todas as `selecoes` ({coluna: valores}); uma
+        seleção vazia ou None não filtra aquela coluna.
+        """
+        mascara = self.posse.copy() if somente_posse else np.ones(len(self.df), dtype=bool)
+        for coluna, valores in (selecoes or {}).items():
+            if valores:
+                mascara &= self.mascara(coluna, valores)
+        return self.df[mascara]
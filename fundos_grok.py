@@ -1,25 +1,30 @@
 import streamlit as st
 import yfinance as yf
 import pandas as pd
-import matplotlib.pyplot as plt
-import requests
-from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 import uuid
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+import statusinvest
+from graficos import assinatura_serie, figura_linha, get_cache_figuras
+from periodos import fatiar_periodo, indexar_por_data
+from price_store import PriceStore
 
 # Streamlit app configuration
 st.set_page_config(page_title="FII Analysis Dashboard", layout="wide")
 st.title("FII Analysis: VRTA11, CPTS11, TVRI11")
 
+# Local store of daily bars; only new bars are downloaded on each refresh
+@st.cache_resource
+def get_price_store():
+    return PriceStore()
+
 # Cache data fetching to improve performance
-@st.cache_data
+@st.cache_data(ttl=900)
 def fetch_price_data(ticker, period="10y", interval="1d"):
     try:
-        stock = yf.Ticker(ticker)
-        df = stock.history(period=period, interval=interval)
-        if df.empty:
+        # Weekly/monthly bars are resampled locally from the stored daily bars
+        df = get_price_store().get(ticker, period=period, interval=interval)
+        if df is None or df.empty:
             return None
         return df
     except Exception as e:
@@ -33,55 +38,32 @@ def fetch_intraday_data(ticker, interval="15m"):
         df = stock.history(period="30d", interval=interval)
         if df.empty:
             return None
-        return df
+        # Sorted by date so windows are cut by binary search (periodos.fatiar_periodo)
+        return indexar_por_data(df)
     except Exception as e:
         st.error(f"Erro ao buscar dados intradiários para {ticker}: {e}")
         return None
 
-@st.cache_data
+@st.cache_data(ttl=3600)
 def fetch_dividends(ticker_symbol):
     try:
-        url = f"https://statusinvest.com.br/fundos-imobiliarios/{ticker_symbol.lower()}"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        response = requests.get(url, headers=headers)
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        dividends = []
-        table = soup.find("table", {"id": "earning-section"})
-        if table:
-            rows = table.find_all("tr")[1:]  # Skip header
-            for row in rows:
-                cols = row.find_all("td")
-                if len(cols) >= 2:
-                    date_str = cols[0].text.strip()
-                    value_str = cols[1].text.strip().replace("R$", "").replace(",", ".")
-                    try:
-                        date = pd.to_datetime(date_str, format="%d/%m/%Y")
-                        value = float(value_str)
-                        dividends.append({"Date": date, "Dividend": value})
-                    except:
-                        continue
-        df = pd.DataFrame(dividends)
-        if not df.empty:
-            df = df.sort_values("Date")
-        return df if not df.empty else None
+        # Shared pooled session with retries; unchanged pages come back as 304
+        return statusinvest.fetch_dividends(ticker_symbol)
     except Exception as e:
         st.error(f"Erro ao buscar dados de dividendos para {ticker_symbol}: {e}")
         return None
 
-# Plotting function
-def plot_data(df, title, ylabel):
-    fig, ax = plt.subplots(figsize=(10, 5))
-    ax.plot(df.index, df["Close" if "Close" in df.columns else "Dividend"], color="blue")
-    ax.set_title(title)
-    ax.set_xlabel("Date")
-    ax.set_ylabel(ylabel)
-    ax.grid(True)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    st.pyplot(fig)
+# Plotting function: series reduced to the chart's pixel budget, WebGL traces,
+# figures shared by all sessions per (ticker, period, interval) and data version
+def plot_data(df, title, ylabel, key, method="lttb"):
+    column = "Close" if "Close" in df.columns else "Dividend"
+    x = df["Date"] if "Date" in df.columns else df.index
+    y = df[column].to_numpy()
+    fig = get_cache_figuras().obter(
+        (*key, assinatura_serie(x, y)),
+        lambda: figura_linha(x, y, title, ylabel, metodo=method)
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
 # About information for each FII
 def show_about_info():
@@ -116,6 +98,7 @@ fiis = {
 selected_fii = st.sidebar.selectbox("Selecione o FII", list(fiis.keys()))
 time_frame = st.sidebar.selectbox("Selecione o Período", ["Mensal", "Semanal", "Diário"])
 intraday_interval = st.sidebar.selectbox("Selecione o Intervalo Intradiário (Últimos 30 Dias)", ["15m", "30m", "60m"])
+intraday_window = st.sidebar.select_slider("Janela Intradiária", ["1d", "5d", "30d"], value="30d")
 
 # About button
 if st.sidebar.button("Sobre"):
@@ -127,16 +110,20 @@ period_map = {"Mensal": "1mo", "Semanal": "1wk", "Diário": "1d"}
 df_price = fetch_price_data(fiis[selected_fii], period="10y", interval=period_map[time_frame])
 if df_price is not None:
     st.write(f"Dados de Preço {time_frame}")
-    plot_data(df_price, f"{selected_fii} Preço {time_frame}", "Preço (BRL)")
+    plot_data(df_price, f"{selected_fii} Preço {time_frame}", "Preço (BRL)", (selected_fii, "10y", period_map[time_frame]))
     st.dataframe(df_price[["Open", "High", "Low", "Close", "Volume"]].tail())
 else:
     st.warning(f"Nenhum dado de preço disponível para {selected_fii}.")
 
 # Fetch and display intraday data
-st.subheader(f"Análise Intradiária para {selected_fii} (Últimos 30 Dias)")
+st.subheader(f"Análise Intradiária para {selected_fii} (Últimos {intraday_window})")
 df_intraday = fetch_intraday_data(fiis[selected_fii], interval=intraday_interval)
 if df_intraday is not None:
-    plot_data(df_intraday, f"{selected_fii} Preço {intraday_interval} (Últimos 30 Dias)", "Preço (BRL)")
+    # Window counted back from the last bar (weekends/holidays have none), cut by binary search
+    df_window = fatiar_periodo(df_intraday, intraday_window, hoje=df_intraday.index[-1])
+    # Min/max buckets keep every intraday spike visible
+    plot_data(df_window, f"{selected_fii} Preço {intraday_interval} (Últimos {intraday_window})", "Preço (BRL)",
+              (selected_fii, intraday_window, intraday_interval), method="minmax")
     st.dataframe(df_intraday[["Open", "High", "Low", "Close", "Volume"]].tail())
 else:
     st.warning(f"Nenhum dado intradiário disponível para {selected_fii}.")
@@ -146,7 +133,7 @@ st.subheader(f"Análise de Dividendos para {selected_fii}")
 df_dividends = fetch_dividends(selected_fii)
 if df_dividends is not None:
     st.write("Dividendos Mensais (conforme disponível)")
-    plot_data(df_dividends, f"{selected_fii} Dividendos Mensais", "Dividendo por Cota (BRL)")
+    plot_data(df_dividends, f"{selected_fii} Dividendos Mensais", "Dividendo por Cota (BRL)", (selected_fii, "dividends", "1mo"))
     st.dataframe(df_dividends.tail())
 else:
     st.warning(f"Nenhum dado de dividendos disponível para {selected_fii}.")
\ No newline at end of file
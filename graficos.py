@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Pontos enviados por série: ~largura do gráfico em pixels; mais que isso não aparece na tela
+PONTOS_PADRAO = 1200
+# Figuras guardadas no processo (compartilhadas entre sessões)
+MAX_FIGURAS = 256
+
+LAYOUT_PADRAO = dict(
+    template='plotly_white',
+    height=400,
+    margin=dict(l=20, r=20, t=50, b=20),
+    hovermode='x unified',
+    legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='right', x=1),
+    xaxis=dict(showgrid=False),
+    yaxis=dict(showgrid=True, gridcolor='rgba(0,0,0,0.1)'),
+)
+
+
+def _eixo_x(x):
+    """x como array; datas com fuso (ex.: yfinance) viram o horário local sem fuso."""
+    if isinstance(getattr(x, 'dtype', None), pd.DatetimeTZDtype):
+        x = pd.DatetimeIndex(x).tz_localize(None)
+    return np.asarray(x)
+
+
+def _numerico(x):
+    """Eixo x como float64 (datas viram nanossegundos) para as contas de área."""
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def lttb(x, y, pontos):
+    """
+    Índices dos `pontos` escolhidos pelo Largest-Triangle-Three-Buckets:
+    primeiro e último pontos mais, em cada balde, o ponto que forma o maior
+    triângulo com o escolhido no balde anterior e a média do seguinte.
+    Preserva o formato visual da série (picos e vales).
+    """
+    n = len(y)
+    if pontos >= n or pontos < 3:
+        return np.arange(n)
+    x = _numerico(x)
+    y = np.asarray(y, dtype=np.float64)
+    baldes = pontos - 2
+    bordas = np.linspace(1, n - 1, baldes + 1).astype(np.int64)
+    # Médias de cada balde por somas acumuladas; depois do último balde vem o último ponto
+    soma_x = np.concatenate([[0.0], np.cumsum(x)])
+    soma_y = np.concatenate([[0.0], np.cumsum(y)])
+    tamanhos = np.diff(bordas)
+    media_x = np.append((soma_x[bordas[1:]] - soma_x[bordas[:-1]]) / tamanhos, x[-1])
+    media_y = np.append((soma_y[bordas[1:]] - soma_y[bordas[:-1]]) / tamanhos, y[-1])
+
+    escolhidos = np.empty(pontos, dtype=np.int64)
+    escolhidos[0], escolhidos[-1] = 0, n - 1
+    anterior = 0
+    for balde in range(baldes):
+        inicio, fim = bordas[balde], bordas[balde + 1]
+        ax, ay = x[anterior], y[anterior]
+        cx, cy = media_x[balde + 1], media_y[balde + 1]
+        area = np.abs((ax - cx) * (y[inicio:fim] - ay) - (ax - x[inicio:fim]) * (cy - ay))
+        anterior = inicio + int(np.argmax(area))
+        escolhidos[balde + 1] = anterior
+    return escolhidos
+
+
+def minmax(y, pontos):
+    """
+    Índices do mínimo e do máximo de cada um de `pontos` // 2 baldes (mais o
+    primeiro e o último ponto), em ordem. Garante que nenhum extremo suma.
+    """
+    n = len(y)
+    if pontos >= n or pontos < 4:
+        return np.arange(n)
+    baldes = pontos // 2
+    balde = np.arange(n) * baldes // n
+    ordem = np.lexsort((np.asarray(y, dtype=np.float64), balde))
+    inicio = np.searchsorted(balde[ordem], np.arange(baldes))
+    fim = np.append(inicio[1:], n) - 1
+    return np.unique(np.concatenate([ordem[inicio], ordem[fim], [0, n - 1]]))
+
+
+def reduzir(x, y, pontos=PONTOS_PADRAO, metodo='lttb'):
+    """
+    Reduz a série (x, y) a no máximo ~`pontos` pontos. Valores ausentes são
+    descartados antes. Retorna (x, y) reduzidos como arrays.
+    """
+    x = _eixo_x(x)
+    y = np.asarray(y, dtype=np.float64)
+    validos = ~np.isnan(y)
+    if not validos.all():
+        x, y = x[validos], y[validos]
+    if metodo == 'lttb':
+        indices = lttb(x, y, pontos)
+    elif metodo == 'minmax':
+        indices = minmax(y, pontos)
+    else:
+        raise ValueError(f"Método de redução desconhecido: {metodo}. Use 'lttb' ou 'minmax'")
+    return x[indices], y[indices]
+
+
+def figura_linha(x, y, titulo, rotulo_y, nome=None, pontos=PONTOS_PADRAO, metodo='lttb', cor='#1f77b4'):
+    """Gráfico de linha com a série reduzida e traço WebGL (Scattergl)."""
+    x, y = reduzir(x, y, pontos, metodo)
+    fig = go.Figure(go.Scattergl(x=x, y=y, mode='lines', name=nome or rotulo_y, line=dict(width=2, color=cor)))
+    fig.update_layout(title=titulo, yaxis_title=rotulo_y, showlegend=False, **LAYOUT_PADRAO)
+    return fig
+
+
+def figura_linhas(x, series, titulo, rotulo_y, pontos=PONTOS_PADRAO, metodo='lttb', cores=None):
+    """Várias séries sobre o mesmo eixo x ({nome: y}), cada uma reduzida e em WebGL, com legenda."""
+    fig = go.Figure()
+    for i, (nome, y) in enumerate(series.items()):
+        xr, yr = reduzir(x, y, pontos, metodo)
+        linha = dict(width=2) if cores is None else dict(width=2, color=cores[i % len(cores)])
+        fig.add_trace(go.Scattergl(x=xr, y=yr, mode='lines', name=nome, line=linha))
+    fig.update_layout(title=titulo, yaxis_title=rotulo_y, **LAYOUT_PADRAO)
+    return fig
+
+
+def figura_leque(x, percentis, titulo, rotulo_y, cor='31, 119, 180'):
+    """
+    Gráfico em leque de uma projeção: faixas P5–P95 e P25–P75 e a mediana,
+    a partir de um DataFrame com colunas P5, P25, P50, P75 e P95.
+    """
+    x = _eixo_x(x)
+    fig = go.Figure()
+    for baixo, alto, opacidade, nome in (('P5', 'P95', 0.15, '5% a 95%'), ('P25', 'P75', 0.3, '25% a 75%')):
+        fig.add_trace(go.Scatter(x=x, y=percentis[alto], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+        fig.add_trace(go.Scatter(
+            x=x, y=percentis[baixo], mode='lines', line=dict(width=0), fill='tonexty',
+            fillcolor=f'rgba({cor}, {opacidade})', name=nome, hoverinfo='skip'
+        ))
+    fig.add_trace(go.Scatter(x=x, y=percentis['P50'], mode='lines', name='Mediana', line=dict(width=2, color=f'rgb({cor})')))
+    fig.update_layout(title=titulo, yaxis_title=rotulo_y, **LAYOUT_PADRAO)
+    return fig
+
+
+def figura_barras_faixa(x, percentis, titulo, rotulo_y, cor='#2ca02c'):
+    """Barras da mediana com a faixa P5–P95 como barra de erro."""
+    fig = go.Figure(go.Bar(
+        x=x, y=percentis['P50'], name='Mediana', marker_color=cor,
+        error_y=dict(
+            type='data', symmetric=False,
+            array=percentis['P95'] - percentis['P50'], arrayminus=percentis['P50'] - percentis['P5']
+        )
+    ))
+    fig.update_layout(title=titulo, yaxis_title=rotulo_y, showlegend=False, **LAYOUT_PADRAO)
+    return fig
+
+
+def assinatura_serie(x, y):
+    """Identifica a versão dos dados de uma série sem percorrê-la: tamanho, extremos de x e último y."""
+    n = len(y)
+    if n == 0:
+        return (0,)
+    x = _eixo_x(x)
+    return (n, x[0], x[-1], float(y[-1]))
+
+
+class CacheFiguras:
+    """
+    Figuras prontas por chave (ex.: (ticker, período, intervalo, assinatura
+    dos dados)), em LRU limitado a `max_figuras` e compartilhado entre
+    sessões. As figuras devolvidas não devem ser alteradas por quem chama.
+    """
+
+    def __init__(self, max_figuras=MAX_FIGURAS):
+        self.max_figuras = max_figuras
+        self.acertos = 0
+        self.faltas = 0
+        self._figuras = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave, construir):
+        """Retorna a figura de `chave`, chamando construir() só quando ela não está guardada."""
+        with self._lock:
+            if chave in self._figuras:
+                self._figuras.move_to_end(chave)
+                self.acertos += 1
+                return self._figuras[chave]
+            self.faltas += 1
+        fig = construir()
+        with self._lock:
+            self._figuras[chave] = fig
+            while len(self._figuras) > self.max_figuras:
+                self._figuras.popitem(last=False)
+        return fig
+
+
+_cache_figuras = None
+_cache_lock = threading.Lock()
+
+
+def get_cache_figuras():
+    """Cache de figuras do processo."""
+    global _cache_figuras
+    with _cache_lock:
+        if _cache_figuras is None:
+            _cache_figuras = CacheFiguras()
+        return _cache_figuras
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    import plotly.express as px
+
+    parser = argparse.ArgumentParser(description="Compara gráficos com todos os pontos e com a série reduzida.")
+    parser.add_argument('--pontos', type=int, nargs='+', default=[2520, 20_000, 200_000],
+                        help="Tamanhos das séries (2520 = 10 anos de pregões)")
+    parser.add_argument('--metodo', choices=['lttb', 'minmax'], default='lttb')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for n in args.pontos:
+        datas = pd.date_range(end=pd.Timestamp.now().normalize(), periods=n, freq='15min' if n > 5000 else 'B')
+        precos = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+        df = pd.DataFrame({'Data': datas, 'Preço': precos})
+
+        inicio = time.perf_counter()
+        completo = px.line(df, x='Data', y='Preço', template='plotly_white').to_json()
+        t_completo = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        reduzido = figura_linha(datas.to_numpy(), precos, 'Série', 'Preço', metodo=args.metodo).to_json()
+        t_reduzido = time.perf_counter() - inicio
+
+        cache = CacheFiguras()
+        chave = ('SINT11', 'max', '1d', assinatura_serie(datas.to_numpy(), precos))
+        cache.obter(chave, lambda: figura_linha(datas.to_numpy(), precos, 'Série', 'Preço'))
+        inicio = time.perf_counter()
+        cache.obter(chave, lambda: figura_linha(datas.to_numpy(), precos, 'Série', 'Preço'))
+        t_cache = time.perf_counter() - inicio
+
+        print(f"{n:>8} pontos: completo {len(completo) / 1024:8.1f} KB em {t_completo * 1000:7.1f} ms | "
+              f"reduzido {len(reduzido) / 1024:6.1f} KB em {t_reduzido * 1000:6.1f} ms | "
+              f"cache {t_cache * 1e6:.0f} µs")
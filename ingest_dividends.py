@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+import statusinvest
+from workbook import read_workbook
+
+COLUMNS = ['Codigo_Ativo', 'Data', 'Valor']
+
+
+def read_tickers(path):
+    """Reads tickers from a workbook Watchlist (FIIs only), a CSV with Codigo_Ativo, or a plain list."""
+    if path.endswith('.xlsx'):
+        with open(path, 'rb') as f:
+            df = read_workbook(f.read(), ['Watchlist'])['Watchlist']
+        if 'Tipo_Ativo' in df.columns:
+            df = df[df['Tipo_Ativo'] == 'FII']
+        return df['Codigo_Ativo'].astype(str).str.strip().tolist()
+    if path.endswith('.csv'):
+        return pd.read_csv(path)['Codigo_Ativo'].astype(str).str.strip().tolist()
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def parse_page(ticker, html):
+    """
+    Runs in a worker process: parses one page into the raw dividends table
+    (Date, Dividend), as cached for 304 responses; save_part reshapes it with to_long.
+    """
+    df = statusinvest.parse_dividends(html)
+    return ticker, df
+
+
+def to_long(ticker, df):
+    long_df = df.rename(columns={'Date': 'Data', 'Dividend': 'Valor'})
+    long_df.insert(0, 'Codigo_Ativo', ticker)
+    return long_df[COLUMNS]
+
+
+def write_table(df, path):
+    if path.endswith('.csv'):
+        df.to_csv(path, index=False)
+    elif path.endswith('.xlsx'):
+        df.to_excel(path, index=False)
+    else:
+        df.to_parquet(path, index=False)
+
+
+class Ingestion:
+    """Downloads pages concurrently (threads) and parses them in a process pool.
+
+    Each finished ticker is written to a part file next to the output, so an
+    interrupted run resumes with the pending tickers only. The parts are then
+    consolidated into one long table (Codigo_Ativo, Data, Valor).
+    """
+
+    def __init__(self, tickers, output, download_workers=16, parse_workers=None, restart=False):
+        self.tickers = list(dict.fromkeys(t.upper() for t in tickers))
+        self.output = output
+        self.parts_dir = output + '.parts'
+        self.download_workers = download_workers
+        self.parse_workers = parse_workers
+        self.cache = statusinvest.get_page_cache()
+        self.done = 0
+        self.failed = {}
+        self.started = time.perf_counter()
+        if restart and os.path.isdir(self.parts_dir):
+            for name in os.listdir(self.parts_dir):
+                os.remove(os.path.join(self.parts_dir, name))
+        os.makedirs(self.parts_dir, exist_ok=True)
+
+    def part_path(self, ticker):
+        return os.path.join(self.parts_dir, f'{ticker}.parquet')
+
+    def pending(self):
+        return [t for t in self.tickers if not os.path.exists(self.part_path(t))]
+
+    def progress(self, ticker, message):
+        self.done += 1
+        elapsed = time.perf_counter() - self.started
+        print(f"[{self.done}/{self.total}] {ticker}: {message} ({elapsed:.1f}s)", file=sys.stderr, flush=True)
+
+    def save_part(self, ticker, df):
+        tmp_path = self.part_path(ticker) + '.tmp'
+        to_long(ticker, df).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.part_path(ticker))
+        self.progress(ticker, f"{len(df)} pagamentos")
+
+    def download(self, ticker):
+        url = statusinvest.FII_URL.format(ticker=ticker.lower())
+        html, entry = statusinvest.fetch_page(url, cache=self.cache)
+        return ticker, url, html, entry
+
+    def run(self):
+        pending = self.pending()
+        self.total = len(pending)
+        skipped = len(self.tickers) - self.total
+        if skipped:
+            print(f"Retomando: {skipped} tickers já ingeridos, {self.total} pendentes", file=sys.stderr)
+
+        entries = {}
+        with ThreadPoolExecutor(self.download_workers) as downloads, \
+                ProcessPoolExecutor(self.parse_workers) as parsers:
+            in_flight = {downloads.submit(self.download, t): ('download', t) for t in pending}
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage, ticker = in_flight.pop(future)
+                    try:
+                        if stage == 'download':
+                            _, url, html, entry = future.result()
+                            if html is None:
+                                # 304: the parsed table from the previous run is still valid
+                                self.save_part(ticker, entry['dividends'])
+                            else:
+                                entries[ticker] = (url, entry)
+                                in_flight[parsers.submit(parse_page, ticker, html)] = ('parse', ticker)
+                        else:
+                            _, df = future.result()
+                            url, entry = entries.pop(ticker)
+                            entry['dividends'] = df
+                            self.cache.put(url, entry)
+                            self.save_part(ticker, df)
+                    except Exception as e:
+                        self.failed[ticker] = str(e)
+                        self.progress(ticker, f"ERRO {e}")
+
+        return self.consolidate()
+
+    def consolidate(self):
+        parts = [pd.read_parquet(self.part_path(t)) for t in self.tickers if os.path.exists(self.part_path(t))]
+        df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=COLUMNS)
+        df = df.sort_values(['Codigo_Ativo', 'Data'], ignore_index=True)
+        write_table(df, self.output)
+        return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestão em lote do histórico de dividendos de FIIs (statusinvest).")
+    parser.add_argument('--tickers', nargs='*', default=[], help="Lista de tickers (ex.: VRTA11 CPTS11)")
+    parser.add_argument('--from-file', help="Arquivo .xlsx (aba Watchlist), .csv (Codigo_Ativo) ou .txt (um ticker por linha)")
+    parser.add_argument('-o', '--output', default='dividendos.parquet', help="Saída .parquet, .csv ou .xlsx")
+    parser.add_argument('--download-workers', type=int, default=16)
+    parser.add_argument('--parse-workers', type=int, default=None, help="Processos de parsing (padrão: nº de CPUs)")
+    parser.add_argument('--restart', action='store_true', help="Ignora o progresso salvo e recomeça do zero")
+    args = parser.parse_args(argv)
+
+    tickers = list(args.tickers)
+    if args.from_file:
+        tickers += read_tickers(args.from_file)
+    if not tickers:
+        parser.error("informe --tickers ou --from-file")
+
+    ingestion = Ingestion(tickers, args.output, args.download_workers, args.parse_workers, args.restart)
+    df = ingestion.run()
+    print(f"{len(df)} pagamentos de {df['Codigo_Ativo'].nunique()} tickers gravados em {args.output}")
+    if ingestion.failed:
+        print(f"{len(ingestion.failed)} tickers com erro (execute novamente para retomar): {', '.join(ingestion.failed)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+METODOS = ('medio', 'fifo')
+
+# Valores aceitos na coluna opcional Tipo_Operacao
+VALORES_VENDA = {'VENDA', 'V', 'SELL', 'S'}
+VALORES_COMPRA = {'COMPRA', 'C', 'BUY', 'B'}
+
+COLUNAS_POSICOES = [
+    'Codigo_Ativo', 'Quantidade_Total', 'Custo_Total_Acumulado', 'Preco_Medio_Compra',
+    'Lucro_Realizado', 'Quantidade_Comprada', 'Quantidade_Vendida'
+]
+
+
+class VendaDescoberta(ValueError):
+    """Venda maior que a posição em carteira no momento da operação."""
+
+
+class TipoOperacaoInvalido(ValueError):
+    """Valor de Tipo_Operacao que não é compra nem venda."""
+
+
+def sinal_operacao(tipos):
+    """
+    Sinal de cada operação pela coluna Tipo_Operacao: -1 para venda, +1 para
+    compra e 0 para célula vazia (vale o sinal de `Quantidade`). Levanta
+    TipoOperacaoInvalido para qualquer outro valor.
+    """
+    # Normaliza só os valores distintos; -1 (vazio) aponta para o 0 final
+    codigo, valores = pd.factorize(tipos)
+    normalizados = pd.Index(valores).astype(str).str.strip().str.upper()
+    venda, compra = normalizados.isin(VALORES_VENDA), normalizados.isin(VALORES_COMPRA)
+    invalidos = sorted(set(valores[~(venda | compra) & (normalizados != '')].astype(str)))
+    if invalidos:
+        raise TipoOperacaoInvalido(
+            f"Tipo_Operacao inválido: {', '.join(invalidos)}. Use 'Compra' ou 'Venda' (ou deixe vazio)"
+        )
+    return np.append(np.where(venda, -1.0, np.where(compra, 1.0, 0.0)), 0.0)[codigo]
+
+
+def normalizar_operacoes(df_historico):
+    """
+    Retorna as operações do histórico como arrays, na ordem da planilha:
+    (codigos, grupo, quantidade assinada, preço unitário, taxas, datas),
+    onde `grupo` indexa `codigos`.
+
+    Vendas são identificadas pela coluna opcional `Tipo_Operacao`
+    ('Compra'/'Venda') ou, na ausência dela ou com a célula vazia, por
+    `Quantidade` negativa. Outros valores levantam TipoOperacaoInvalido.
+    """
+    quantidade = df_historico['Quantidade'].to_numpy(dtype='float64')
+    if 'Tipo_Operacao' in df_historico.columns:
+        sinal = sinal_operacao(df_historico['Tipo_Operacao'])
+        quantidade = np.where(sinal != 0, sinal * np.abs(quantidade), quantidade)
+
+    grupo, codigos = pd.factorize(df_historico['Codigo_Ativo'], sort=True)
+    codigos = np.asarray(codigos, dtype=object)  # Codigo_Ativo categórico também sai como texto
+    taxas = (
+        df_historico['Corretagem_Taxas'].fillna(0).to_numpy(dtype='float64')
+        if 'Corretagem_Taxas' in df_historico.columns else np.zeros(len(df_historico))
+    )
+    return (
+        codigos,
+        grupo,
+        quantidade,
+        df_historico['Preco_Compra_Unitario'].to_numpy(dtype='float64'),
+        taxas,
+        df_historico['Data_Compra'].to_numpy(dtype='datetime64[ns]'),
+    )
+
+
+def _liquidar_custo_medio(grupo, quantidade, preco, taxas, datas, codigos, saida):
+    """Custo médio (padrão da Receita Federal): vendas não alteram o preço médio."""
+    quantidade_pos = custo = realizado = 0.0
+    atual = -1
+    for i, (g, q, p, f) in enumerate(zip(grupo.tolist(), quantidade.tolist(), preco.tolist(), taxas.tolist())):
+        if g != atual:
+            if atual >= 0:
+                saida[atual] = (quantidade_pos, custo, realizado)
+            atual, quantidade_pos, custo, realizado = g, 0.0, 0.0, 0.0
+        if q >= 0:
+            quantidade_pos += q
+            custo += q * p + f
+        else:
+            q = -q
+            if q > quantidade_pos + 1e-9:
+                raise VendaDescoberta(
+                    f"Venda de {q:g} {codigos[g]} em {pd.Timestamp(datas[i]):%d/%m/%Y} maior que a posição ({quantidade_pos:g})"
+                )
+            custo_saida = custo * q / quantidade_pos
+            realizado += q * p - f - custo_saida
+            quantidade_pos -= q
+            custo = custo - custo_saida if quantidade_pos > 1e-9 else 0.0
+    if atual >= 0:
+        saida[atual] = (quantidade_pos, custo, realizado)
+
+
+def _liquidar_fifo(grupo, quantidade, preco, taxas, datas, codigos, saida):
+    """PEPS/FIFO: cada venda consome os lotes mais antigos primeiro."""
+    lotes = deque()
+    quantidade_pos = custo = realizado = 0.0
+    atual = -1
+    for i, (g, q, p, f) in enumerate(zip(grupo.tolist(), quantidade.tolist(), preco.tolist(), taxas.tolist())):
+        if g != atual:
+            if atual >= 0:
+                saida[atual] = (quantidade_pos, custo, realizado)
+            atual, quantidade_pos, custo, realizado = g, 0.0, 0.0, 0.0
+            lotes.clear()
+        if q > 0:
+            lotes.append([q, (q * p + f) / q])
+            quantidade_pos += q
+            custo += q * p + f
+        elif q == 0:
+            custo += f
+        else:
+            q = -q
+            if q > quantidade_pos + 1e-9:
+                raise VendaDescoberta(
+                    f"Venda de {q:g} {codigos[g]} em {pd.Timestamp(datas[i]):%d/%m/%Y} maior que a posição ({quantidade_pos:g})"
+                )
+            restante, custo_saida = q, 0.0
+            while restante > 1e-9:
+                lote = lotes[0]
+                consumido = min(lote[0], restante)
+                custo_saida += consumido * lote[1]
+                lote[0] -= consumido
+                restante -= consumido
+                if lote[0] <= 1e-9:
+                    lotes.popleft()
+            realizado += q * p - f - custo_saida
+            quantidade_pos -= q
+            custo = custo - custo_saida if quantidade_pos > 1e-9 else 0.0
+    if atual >= 0:
+        saida[atual] = (quantidade_pos, custo, realizado)
+
+
+def calcular_posicoes(df_historico, metodo='medio'):
+    """
+    Consolida compras e vendas de `Historico_Compras` em uma linha por ativo
+    com quantidade em carteira, custo da posição aberta, preço médio e lucro
+    realizado, pelo método de custo médio ('medio') ou PEPS ('fifo').
+
+    Ativos sem vendas são resolvidos de forma vetorizada (bincount); só as
+    operações dos ativos com vendas passam pelo laço sequencial sobre arrays.
+    """
+    if metodo not in METODOS:
+        raise ValueError(f"Método inválido: {metodo}. Use um de {METODOS}")
+    if df_historico.empty:
+        return pd.DataFrame(columns=COLUNAS_POSICOES)
+
+    codigos, grupo, quantidade, preco, taxas, datas = normalizar_operacoes(df_historico)
+    n = len(codigos)
+    compra = quantidade > 0
+    venda = quantidade < 0
+
+    quantidade_comprada = np.bincount(grupo, weights=np.where(compra, quantidade, 0.0), minlength=n)
+    quantidade_vendida = np.bincount(grupo, weights=np.where(venda, -quantidade, 0.0), minlength=n)
+    custo_compras = np.bincount(grupo, weights=np.where(compra, quantidade * preco, 0.0) + np.where(venda, 0.0, taxas), minlength=n)
+
+    posicao = quantidade_comprada - quantidade_vendida
+    custo = custo_compras.copy()
+    realizado = np.zeros(n)
+
+    com_vendas = quantidade_vendida > 0
+    if com_vendas.any():
+        # Só os ativos com vendas, ordenados por (ativo, data); lexsort é estável,
+        # então operações do mesmo dia mantêm a ordem da planilha
+        selecao = np.flatnonzero(com_vendas[grupo])
+        selecao = selecao[np.lexsort((datas[selecao], grupo[selecao]))]
+        saida = {}
+        liquidar = _liquidar_custo_medio if metodo == 'medio' else _liquidar_fifo
+        liquidar(grupo[selecao], quantidade[selecao], preco[selecao], taxas[selecao], datas[selecao], codigos, saida)
+        indices = np.fromiter(saida.keys(), dtype='int64', count=len(saida))
+        valores = np.array(list(saida.values()), dtype='float64').reshape(-1, 3)
+        posicao[indices] = valores[:, 0]
+        custo[indices] = valores[:, 1]
+        realizado[indices] = valores[:, 2]
+
+    preco_medio = np.full(n, np.nan)
+    np.divide(custo, posicao, out=preco_medio, where=posicao > 1e-9)
+
+    posicoes = pd.DataFrame({
+        'Codigo_Ativo': codigos,
+        'Quantidade_Total': posicao,
+        'Custo_Total_Acumulado': custo,
+        'Preco_Medio_Compra': preco_medio,
+        'Lucro_Realizado': realizado,
+        'Quantidade_Comprada': quantidade_comprada,
+        'Quantidade_Vendida': quantidade_vendida,
+    })
+    if pd.api.types.is_integer_dtype(df_historico['Quantidade']):
+        for coluna in ('Quantidade_Total', 'Quantidade_Comprada', 'Quantidade_Vendida'):
+            posicoes[coluna] = posicoes[coluna].round().astype(df_historico['Quantidade'].dtype)
+    return posicoes
+
+
+def gerar_livro_sintetico(n_transacoes, n_ativos=500, fracao_vendas=0.2, seed=0):
+    """Gera um histórico sintético de ~10 anos com compras e vendas sem venda descoberta."""
+    from portfolio import gerar_historico_sintetico
+
+    df_historico, df_market_data = gerar_historico_sintetico(n_transacoes, n_ativos, seed)
+    rng = np.random.default_rng(seed + 1)
+    df_historico = df_historico.sort_values(['Codigo_Ativo', 'Data_Compra'], kind='stable', ignore_index=True)
+    sinal = np.where(rng.random(n_transacoes) < fracao_vendas, -1, 1)
+
+    # Vendas que deixariam a posição negativa viram compras (uma passada basta:
+    # trocar uma venda por compra só aumenta as posições seguintes)
+    posicao = (df_historico['Quantidade'] * sinal).groupby(df_historico['Codigo_Ativo']).cumsum()
+    sinal = np.where((sinal < 0) & (posicao.to_numpy() < 0), 1, sinal)
+
+    df_historico['Tipo_Operacao'] = np.where(sinal < 0, 'Venda', 'Compra')
+    return df_historico.sort_values('Data_Compra', kind='stable', ignore_index=True), df_market_data
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Benchmark do livro de operações (custo médio e PEPS).")
+    parser.add_argument('--transacoes', type=int, default=500_000)
+    parser.add_argument('--ativos', type=int, default=500)
+    args = parser.parse_args()
+
+    df_historico, _ = gerar_livro_sintetico(args.transacoes, args.ativos)
+    print(f"{len(df_historico)} operações, {(df_historico['Tipo_Operacao'] == 'Venda').sum()} vendas, {args.ativos} ativos")
+    for metodo in METODOS:
+        inicio = time.perf_counter()
+        posicoes = calcular_posicoes(df_historico, metodo)
+        print(f"{metodo:>6}: {time.perf_counter() - inicio:.3f}s | lucro realizado R$ {posicoes['Lucro_Realizado'].sum():,.2f}")
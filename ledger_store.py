@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# Saving ledgers on disk is opt-in: set MMPG_LEDGER_DIR to keep one SQLite file per portfolio key there.
+# Without it, every ledger lives in memory for its session only.
+LEDGER_DIR = os.environ.get('MMPG_LEDGER_DIR') or None
+MEMORY = ':memory:'
+
+HISTORY_COLUMNS = [
+    'Data_Compra', 'Codigo_Ativo', 'Tipo_Ativo', 'Tipo_Operacao',
+    'Quantidade', 'Preco_Compra_Unitario', 'Corretagem_Taxas'
+]
+WATCHLIST_COLUMNS = ['Codigo_Ativo', 'Tipo_Ativo', 'Setor', 'Nome_Ativo', 'Observacoes']
+
+# Repeated text columns returned as categoricals (one code per row instead of one string)
+HISTORY_CATEGORIES = ['Codigo_Ativo', 'Tipo_Ativo', 'Tipo_Operacao']
+WATCHLIST_CATEGORIES = ['Tipo_Ativo', 'Setor']
+
+# Columns identifying an operation; identical rows are told apart by their ordinal
+KEY_COLUMNS = [
+    'Data_Compra', 'Codigo_Ativo', 'Tipo_Operacao',
+    'Quantidade', 'Preco_Compra_Unitario', 'Corretagem_Taxas'
+]
+
+
+def row_keys(df_history):
+    """Stable key per operation: hash of KEY_COLUMNS plus the occurrence number of that hash."""
+    hashes = pd.util.hash_pandas_object(df_history[KEY_COLUMNS], index=False).to_numpy()
+    ordinal = pd.Series(hashes).groupby(hashes).cumcount().to_numpy()
+    return [f'{h:016x}:{n}' for h, n in zip(hashes.tolist(), ordinal.tolist())]
+
+
+def portfolio_path(key, directory=None):
+    """SQLite file of the portfolio identified by `key` (a secret chosen by its owner); the name is a hash of the key."""
+    directory = directory or LEDGER_DIR
+    if not directory:
+        raise ValueError("Saving portfolios is disabled: set MMPG_LEDGER_DIR")
+    return os.path.join(directory, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.sqlite")
+
+
+def _categorize(df, columns):
+    for column in columns:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df
+
+
+class LedgerStore:
+    """Historico_Compras and Watchlist of one portfolio, in SQLite.
+
+    `path` is the portfolio's file (see portfolio_path) or MEMORY (default)
+    for a ledger that lasts as long as the object. Importing a workbook makes
+    the ledger match it: operations are identified by their values, so only
+    new ones are inserted, stored ones that the workbook no longer has (edited
+    or deleted rows) are removed, and the watchlist is replaced. Reads can be
+    narrowed to one ticker and/or a date range and use the indexes on
+    (Codigo_Ativo, Data_Compra) and Data_Compra. `version()` changes on every
+    write; together with `id` it can key caches of full reads.
+    """
+
+    def __init__(self, path=MEMORY):
+        self.path = path
+        self.id = path if path != MEMORY else f'memory-{uuid.uuid4().hex}'
+        self._lock = threading.Lock()
+        self._memory = None
+        if path == MEMORY:
+            # One connection for the object's lifetime: an in-memory database dies with its connection
+            self._memory = sqlite3.connect(MEMORY, check_same_thread=False)
+            self._memory_lock = threading.RLock()
+        else:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS historico (
+                    id INTEGER PRIMARY KEY,
+                    row_key TEXT UNIQUE,
+                    Ordem INTEGER,
+                    Data_Compra INTEGER,
+                    Codigo_Ativo TEXT,
+                    Tipo_Ativo TEXT,
+                    Tipo_Operacao TEXT,
+                    Quantidade REAL,
+                    Preco_Compra_Unitario REAL,
+                    Corretagem_Taxas REAL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_historico_ativo ON historico (Codigo_Ativo, Data_Compra)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_historico_data ON historico (Data_Compra)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS watchlist (
+                    Codigo_Ativo TEXT PRIMARY KEY,
+                    Tipo_Ativo TEXT,
+                    Setor TEXT,
+                    Nome_Ativo TEXT,
+                    Observacoes TEXT
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS imports (
+                    content_hash TEXT PRIMARY KEY,
+                    name TEXT,
+                    imported_at REAL,
+                    new_rows INTEGER,
+                    removed_rows INTEGER
+                )""")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('version', 0)")
+
+    @contextmanager
+    def _connect(self):
+        if self._memory is not None:
+            with self._memory_lock, self._memory:
+                yield self._memory
+            return
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:  # Commits, or rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def version(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def is_empty(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM watchlist").fetchone()[0] == 0
+
+    def is_current(self, content_hash):
+        """True if the last imported workbook had this content hash (importing it again changes nothing)."""
+        with self._connect() as conn:
+            last = conn.execute("SELECT content_hash FROM imports ORDER BY rowid DESC LIMIT 1").fetchone()
+        return last is not None and last[0] == content_hash
+
+    def import_frames(self, df_history, df_watchlist, content_hash=None, name=None):
+        """
+        Makes the ledger match the workbook: inserts its operations not stored
+        yet, removes stored ones it no longer has and replaces the watchlist.
+        Rows keep the workbook's order. Returns (added, removed).
+        """
+        history = df_history.reindex(columns=HISTORY_COLUMNS)
+        history['Codigo_Ativo'] = history['Codigo_Ativo'].astype(str).str.strip()
+        history['Data_Compra'] = pd.to_datetime(history['Data_Compra'])
+        history['Corretagem_Taxas'] = history['Corretagem_Taxas'].fillna(0).astype('float64')
+        history['Quantidade'] = history['Quantidade'].astype('float64')
+        history['Preco_Compra_Unitario'] = history['Preco_Compra_Unitario'].astype('float64')
+        keys = row_keys(history)
+        history['Data_Compra'] = history['Data_Compra'].to_numpy(dtype='datetime64[ns]').astype('int64')
+        history = history.astype(object).where(history.notna(), None)
+        rows = [
+            (key, order, *values)
+            for order, (key, values) in enumerate(zip(keys, history.itertuples(index=False, name=None)))
+        ]
+
+        watchlist = df_watchlist.reindex(columns=WATCHLIST_COLUMNS)
+        watchlist['Codigo_Ativo'] = watchlist['Codigo_Ativo'].astype(str).str.strip()
+        watchlist = watchlist.drop_duplicates('Codigo_Ativo', keep='last')
+        watchlist = watchlist.astype(object).where(watchlist.notna(), None)
+
+        with self._lock, self._connect() as conn:
+            stored = {key for (key,) in conn.execute("SELECT row_key FROM historico")}
+            removed = stored.difference(keys)
+            new_rows = [row for row in rows if row[0] not in stored]
+            conn.executemany("DELETE FROM historico WHERE row_key = ?", [(key,) for key in removed])
+            conn.executemany(
+                "UPDATE historico SET Ordem = ? WHERE row_key = ?",
+                [(order, key) for key, order, *_ in rows if key in stored]
+            )
+            conn.executemany(
+                f"INSERT INTO historico (row_key, Ordem, {', '.join(HISTORY_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * (len(HISTORY_COLUMNS) + 2))})",
+                new_rows
+            )
+            conn.execute("DELETE FROM watchlist")
+            conn.executemany(
+                f"INSERT INTO watchlist ({', '.join(WATCHLIST_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(WATCHLIST_COLUMNS))})",
+                list(watchlist.itertuples(index=False, name=None))
+            )
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            if content_hash:
+                conn.execute("DELETE FROM imports WHERE content_hash = ?", (content_hash,))
+                conn.execute(
+                    "INSERT INTO imports VALUES (?, ?, ?, ?, ?)",
+                    (content_hash, name, time.time(), len(new_rows), len(removed))
+                )
+        return len(new_rows), len(removed)
+
+    def history(self, ticker=None, start=None, end=None):
+        """Operations in spreadsheet order, optionally for one ticker and/or [start, end]."""
+        conditions, params = [], []
+        if ticker is not None:
+            conditions.append("Codigo_Ativo = ?")
+            params.append(ticker)
+        if start is not None:
+            conditions.append("Data_Compra >= ?")
+            params.append(pd.Timestamp(start).value)
+        if end is not None:
+            conditions.append("Data_Compra <= ?")
+            params.append(pd.Timestamp(end).value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._connect() as conn:
+            df = pd.read_sql_query(
+                f"SELECT {', '.join(HISTORY_COLUMNS)} FROM historico {where} ORDER BY Ordem", conn, params=params
+            )
+        df['Data_Compra'] = pd.to_datetime(df['Data_Compra'].astype('int64'), unit='ns')
+        quantidade = df['Quantidade'].to_numpy(dtype='float64')
+        if np.all(quantidade == np.round(quantidade)):
+            df['Quantidade'] = quantidade.astype('int64')
+        if df['Tipo_Operacao'].isna().all():
+            df = df.drop(columns='Tipo_Operacao')
+        return _categorize(df, HISTORY_CATEGORIES)
+
+    def watchlist(self):
+        with self._connect() as conn:
+            df = pd.read_sql_query(f"SELECT {', '.join(WATCHLIST_COLUMNS)} FROM watchlist ORDER BY rowid", conn)
+        return _categorize(df, WATCHLIST_CATEGORIES)
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM historico")
+            conn.execute("DELETE FROM watchlist")
+            conn.execute("DELETE FROM imports")
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from workbook import content_hash, read_workbook
+
+    parser = argparse.ArgumentParser(description="Import a workbook into a saved portfolio ledger.")
+    parser.add_argument('workbooks', nargs='*', help="Imported in order; the ledger ends up matching the last one")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--portfolio', help="Portfolio key (file under MMPG_LEDGER_DIR)")
+    target.add_argument('--path', help="SQLite file")
+    parser.add_argument('--clear', action='store_true', help="Delete all stored operations and watchlist first")
+    args = parser.parse_args()
+
+    if args.portfolio and not LEDGER_DIR:
+        parser.error("--portfolio needs MMPG_LEDGER_DIR")
+    store = LedgerStore(args.path or portfolio_path(args.portfolio))
+    if args.clear:
+        store.clear()
+    for path in args.workbooks:
+        with open(path, 'rb') as f:
+            data = f.read()
+        sheets = read_workbook(data, ['Historico_Compras', 'Watchlist'])
+        started = time.perf_counter()
+        added, removed = store.import_frames(
+            sheets['Historico_Compras'], sheets['Watchlist'], content_hash(data), os.path.basename(path)
+        )
+        print(f"{path}: {added} operations added, {removed} removed in {time.perf_counter() - started:.2f}s")
+    print(f"{store.path}: version {store.version()}, {len(store.history())} operations, {len(store.watchlist())} tickers")
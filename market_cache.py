@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Directory for on-disk caches shared by the apps (override with MMPG_CACHE_DIR)
+CACHE_DIR = os.environ.get('MMPG_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+
+# Seconds each field stays fresh; fields not listed use default_ttl
+FIELD_TTLS = {
+    'Preco_Atual': 900,
+    'Var_Dia_Pct': 900,
+    'Liquidez_Diaria_Vol': 900,
+    'Liquidez_Diaria': 900,
+    'P_VP': 86400,
+    'DY_12M_Pct': 86400,
+    'Ult_Dividendo': 86400,
+    'Data_Ult_Div': 86400,
+    'Historico_Dividendos': 86400,
+}
+DEFAULT_TTL = 7 * 86400 # Descriptive fields (Descricao, Segmento, ABL...) change rarely
+
+
+class MarketDataCache:
+    """Persistent per-ticker market data cache backed by SQLite.
+
+    Entries are keyed by (ticker, range, interval) and stored one row per field,
+    so each field has its own TTL. Expired entries are still served immediately
+    (stale-while-revalidate) while a background thread refreshes them. The least
+    recently used keys are evicted once more than `max_entries` are stored.
+    """
+
+    def __init__(self, path=None, field_ttls=None, default_ttl=DEFAULT_TTL, max_entries=5000):
+        self.path = path or os.path.join(CACHE_DIR, 'market_data.sqlite')
+        self.field_ttls = dict(FIELD_TTLS if field_ttls is None else field_ttls)
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS fields (
+                    ticker TEXT, range TEXT, interval TEXT, field TEXT,
+                    value BLOB, fetched_at REAL,
+                    PRIMARY KEY (ticker, range, interval, field)
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS access (
+                    ticker TEXT, range TEXT, interval TEXT, accessed_at REAL,
+                    PRIMARY KEY (ticker, range, interval)
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_access_time ON access (accessed_at)")
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation keeps the cache safe across threads
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:  # Commits, or rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def ttl_for(self, field):
+        return self.field_ttls.get(field, self.default_ttl)
+
+    def get(self, ticker, range_='5d', interval='1d'):
+        """Returns (record, stale). record is None if the ticker was never cached."""
+        found = self.get_many([ticker], range_, interval)
+        return found.get(ticker, (None, False))
+
+    def get_many(self, tickers, range_='5d', interval='1d'):
+        """Returns {ticker: (record, stale)} for the cached tickers only."""
+        tickers = list(tickers)
+        if not tickers:
+            return {}
+        now = time.time()
+        placeholders = ','.join('?' * len(tickers))
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT ticker, field, value, fetched_at FROM fields "
+                f"WHERE range = ? AND interval = ? AND ticker IN ({placeholders})",
+                [range_, interval] + tickers
+            ).fetchall()
+            found_tickers = {row[0] for row in rows}
+            conn.executemany(
+                "INSERT OR REPLACE INTO access (ticker, range, interval, accessed_at) VALUES (?, ?, ?, ?)",
+                [(ticker, range_, interval, now) for ticker in found_tickers]
+            )
+
+        result = {}
+        for ticker, field, value, fetched_at in rows:
+            record, stale = result.get(ticker, ({}, False))
+            record[field] = pickle.loads(value)
+            stale = stale or (now - fetched_at) > self.ttl_for(field)
+            result[ticker] = (record, stale)
+        return result
+
+    def put(self, ticker, record, range_='5d', interval='1d'):
+        self.put_many({ticker: record}, range_, interval)
+
+    def put_many(self, records, range_='5d', interval='1d'):
+        """
+        Stores good records, each replacing the ticker's whole stored record: a
+        field the new record no longer has is dropped, not kept from the old one.
+        Records carrying an 'Erro' are skipped so the last good value survives.
+        """
+        now = time.time()
+        rows = []
+        keys = []
+        for ticker, record in records.items():
+            if record.get('Erro'):
+                continue
+            keys.append((ticker, range_, interval, now))
+            rows.extend(
+                (ticker, range_, interval, field, pickle.dumps(value), now)
+                for field, value in record.items()
+            )
+        if not rows:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                "DELETE FROM fields WHERE ticker = ? AND range = ? AND interval = ?", [key[:3] for key in keys]
+            )
+            conn.executemany("INSERT OR REPLACE INTO fields VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.executemany("INSERT OR REPLACE INTO access VALUES (?, ?, ?, ?)", keys)
+        self.evict()
+
+    def evict(self):
+        """Drops the least recently used keys beyond max_entries."""
+        with self._connect() as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM access").fetchone()
+            excess = count - self.max_entries
+            if excess <= 0:
+                return
+            victims = conn.execute(
+                "SELECT ticker, range, interval FROM access ORDER BY accessed_at LIMIT ?", (excess,)
+            ).fetchall()
+            conn.executemany("DELETE FROM fields WHERE ticker = ? AND range = ? AND interval = ?", victims)
+            conn.executemany("DELETE FROM access WHERE ticker = ? AND range = ? AND interval = ?", victims)
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM fields")
+            conn.execute("DELETE FROM access")
+
+    def fetch(self, tickers, loader, range_='5d', interval='1d', background=True):
+        """Returns {ticker: record} for all tickers, calling loader(tickers) -> {ticker: record}.
+
+        Missing tickers are loaded synchronously. Stale tickers are returned as-is
+        and refreshed by a daemon thread (or synchronously if background=False).
+        """
+        tickers = list(dict.fromkeys(tickers))
+        cached = self.get_many(tickers, range_, interval)
+        missing = [t for t in tickers if t not in cached]
+        stale = [t for t, (_, is_stale) in cached.items() if is_stale]
+
+        loaded = {}
+        if missing:
+            loaded = loader(missing)
+            self.put_many(loaded, range_, interval)
+
+        if stale:
+            if background:
+                self._refresh_in_background(stale, loader, range_, interval)
+            else:
+                fresh = loader(stale)
+                self.put_many(fresh, range_, interval)
+                # Keep the last good value when the refresh failed
+                cached.update({t: (r, False) for t, r in fresh.items() if not r.get('Erro')})
+
+        result = {}
+        for ticker in tickers:
+            if ticker in cached:
+                result[ticker] = cached[ticker][0]
+            elif ticker in loaded:
+                result[ticker] = loaded[ticker]
+        return result
+
+    def _refresh_in_background(self, tickers, loader, range_, interval):
+        with self._lock:
+            pending = [t for t in tickers if (t, range_, interval) not in self._refreshing]
+            self._refreshing.update((t, range_, interval) for t in pending)
+        if not pending:
+            return
+
+        def refresh():
+            try:
+                self.put_many(loader(pending), range_, interval)
+            except Exception as e:
+                print(f"Background refresh failed for {pending}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update((t, range_, interval) for t in pending)
+
+        threading.Thread(target=refresh, name='market-cache-refresh', daemon=True).start()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+from datetime import datetime
+
+import pandas as pd
+
+# Fields returned by get_quotes for every ticker
+QUOTE_FIELDS = ['Preco_Atual', 'Var_Dia_Pct', 'P_VP', 'DY_12M_Pct', 'Liquidez_Diaria_Vol', 'Erro']
+
+# Sample data for the simulated provider, built once at import
+SAMPLE_QUOTES = {
+    'XPLG11': {'Preco_Atual': 99.70, 'Var_Dia_Pct': 0.41, 'P_VP': 0.93, 'DY_12M_Pct': 10.24, 'Liquidez_Diaria_Vol': 3226098},
+    'HGLG11': {'Preco_Atual': 160.23, 'Var_Dia_Pct': 0.14, 'P_VP': 0.98, 'DY_12M_Pct': 8.79, 'Liquidez_Diaria_Vol': 5714559},
+    'ITUB4': {'Preco_Atual': 37.79, 'Var_Dia_Pct': 0.69, 'P_VP': 1.25, 'DY_12M_Pct': 5.32, 'Liquidez_Diaria_Vol': 15000000},
+    'MXRF11': {'Preco_Atual': 9.52, 'Var_Dia_Pct': 0.53, 'P_VP': 0.85, 'DY_12M_Pct': 13.25, 'Liquidez_Diaria_Vol': 8125365},
+    'VALE3': {'Preco_Atual': 53.41, 'Var_Dia_Pct': -2.25, 'P_VP': 1.15, 'DY_12M_Pct': 6.75, 'Liquidez_Diaria_Vol': 25000000},
+    'KNRI11': {'Preco_Atual': 145.70, 'Var_Dia_Pct': 0.48, 'P_VP': 0.90, 'DY_12M_Pct': 8.80, 'Liquidez_Diaria_Vol': 6478154},
+    'VISC11': {'Preco_Atual': 103.30, 'Var_Dia_Pct': -0.54, 'P_VP': 0.84, 'DY_12M_Pct': 9.84, 'Liquidez_Diaria_Vol': 3852021},
+    'MALL11': {'Preco_Atual': 101.40, 'Var_Dia_Pct': -0.59, 'P_VP': 0.84, 'DY_12M_Pct': 10.03, 'Liquidez_Diaria_Vol': 3082284},
+    'CPTS11': {'Preco_Atual': 7.36, 'Var_Dia_Pct': -0.94, 'P_VP': 0.85, 'DY_12M_Pct': 13.25, 'Liquidez_Diaria_Vol': 8125365},
+    'TVRI11': {'Preco_Atual': 91.62, 'Var_Dia_Pct': 0.35, 'P_VP': 0.90, 'DY_12M_Pct': 13.59, 'Liquidez_Diaria_Vol': 1033718},
+    'HGRE11': {'Preco_Atual': 113.60, 'Var_Dia_Pct': 1.21, 'P_VP': 0.74, 'DY_12M_Pct': 9.94, 'Liquidez_Diaria_Vol': 1648659},
+    'VGHF11': {'Preco_Atual': 7.75, 'Var_Dia_Pct': 0.39, 'P_VP': 0.91, 'DY_12M_Pct': 14.27, 'Liquidez_Diaria_Vol': 2954165},
+    'VRTA11': {'Preco_Atual': 81.55, 'Var_Dia_Pct': -0.60, 'P_VP': 0.92, 'DY_12M_Pct': 12.92, 'Liquidez_Diaria_Vol': 1449132},
+    'XPML11': {'Preco_Atual': 104.34, 'Var_Dia_Pct': 0.14, 'P_VP': 0.89, 'DY_12M_Pct': 11.07, 'Liquidez_Diaria_Vol': 11465813},
+}
+
+_now = datetime.now()
+
+SAMPLE_DETAILS = {
+    # FIIs
+    'XPLG11': {
+        'Descricao': 'XP Log FII investe em ativos logísticos (galpões e centros de distribuição).',
+        'Segmento': 'Galpões Logísticos',
+        'Taxa_Vacancia': 2.5,
+        'Qtd_Imoveis': 18,
+        'ABL': 106750,
+        'VPA': 107.25,
+        'Historico_Dividendos': pd.DataFrame({
+            'Data': pd.date_range(end=_now, periods=12, freq='ME'),
+            'Valor': [0.82, 0.81, 0.83, 0.80, 0.82, 0.85, 0.83, 0.84, 0.82, 0.81, 0.83, 0.85],
+            'DY': [0.82, 0.81, 0.83, 0.80, 0.82, 0.85, 0.83, 0.84, 0.82, 0.81, 0.83, 0.85]
+        })
+    },
+    'HGLG11': {
+        'Descricao': 'CSHG Logística FII foca em empreendimentos logísticos e industriais de alto padrão.',
+        'Segmento': 'Galpões Logísticos',
+        'Taxa_Vacancia': 1.8,
+        'Qtd_Imoveis': 28,
+        'ABL': 162740,
+        'VPA': 163.50,
+        'Historico_Dividendos': pd.DataFrame({
+            'Data': pd.date_range(end=_now, periods=12, freq='ME'),
+            'Valor': [1.10, 1.12, 1.10, 1.15, 1.10, 1.12, 1.10, 1.15, 1.10, 1.12, 1.10, 1.15],
+            'DY': [0.69, 0.70, 0.69, 0.72, 0.69, 0.70, 0.69, 0.72, 0.69, 0.70, 0.69, 0.72]
+        })
+    },
+    # Ações
+    'ITUB4': {
+        'Descricao': 'Itaú Unibanco Holding S.A. é o maior banco privado do Brasil, oferecendo serviços bancários.',
+        'Segmento': 'Bancos',
+        'P_L': 8.5,
+        'ROE': 18.7,
+        'Margem_Liquida': 21.3,
+        'Divida_Patrimonio': 0.45,
+        'Cresc_Receita': 12.8,
+        'Historico_Dividendos': pd.DataFrame({
+            'Data': pd.date_range(end=_now, periods=4, freq='3ME'),
+            'Valor': [0.50, 0.48, 0.52, 0.55],
+            'DY': [1.32, 1.27, 1.38, 1.46]
+        })
+    },
+    'VALE3': {
+        'Descricao': 'Vale S.A. é uma das maiores empresas de mineração do mundo, maior produtora de minério de ferro.',
+        'Segmento': 'Mineração',
+        'P_L': 5.2,
+        'ROE': 22.5,
+        'Margem_Liquida': 25.8,
+        'Divida_Patrimonio': 0.38,
+        'Cresc_Receita': -5.3,
+        'Historico_Dividendos': pd.DataFrame({
+            'Data': pd.date_range(end=_now, periods=4, freq='3ME'),
+            'Valor': [0.90, 1.20, 0.85, 1.10],
+            'DY': [1.68, 2.25, 1.59, 2.06]
+        })
+    },
+}
+
+NOT_FOUND = 'Ticker não encontrado na base de dados simulada'
+
+# Ratios and percentages kept as float32 in to_frames; prices, VPA and volume stay float64
+FLOAT32_FIELDS = [
+    'Var_Dia_Pct', 'P_VP', 'DY_12M_Pct', 'Taxa_Vacancia', 'Qtd_Imoveis', 'ABL',
+    'P_L', 'ROE', 'Margem_Liquida', 'Divida_Patrimonio', 'Cresc_Receita',
+]
+# Low-cardinality text fields stored as categoricals
+CATEGORY_FIELDS = ['Segmento', 'Setor', 'Tipo_Ativo']
+DIVIDEND_COLUMNS = ['Codigo_Ativo', 'Data', 'Valor', 'DY']
+
+
+def to_frames(market_data):
+    """Compact frames from {ticker: fields} (get_quotes / get_market_data output).
+
+    Returns (quotes, dividends): quotes is indexed by ticker with FLOAT32_FIELDS
+    as float32 and CATEGORY_FIELDS as categoricals, without the nested
+    'Historico_Dividendos' frames; dividends is one long table with
+    DIVIDEND_COLUMNS for all tickers, sorted by date, with a categorical
+    Codigo_Ativo.
+    """
+    histories = {}
+    rows = {}
+    for ticker, fields in market_data.items():
+        history = fields.get('Historico_Dividendos')
+        if isinstance(history, pd.DataFrame) and not history.empty:
+            histories[ticker] = history
+        rows[ticker] = {key: value for key, value in fields.items() if key != 'Historico_Dividendos'}
+
+    quotes = pd.DataFrame.from_dict(rows, orient='index')
+    for column in quotes.columns:
+        if column in FLOAT32_FIELDS:
+            quotes[column] = pd.to_numeric(quotes[column], errors='coerce').astype('float32')
+        elif column in CATEGORY_FIELDS:
+            quotes[column] = quotes[column].astype('category')
+        elif quotes[column].dtype == object and quotes[column].map(lambda v: v is None or isinstance(v, (int, float))).all():
+            # Numeric fields arrive as object when some tickers failed (None)
+            quotes[column] = pd.to_numeric(quotes[column], errors='coerce')
+
+    if not histories:
+        dividends = pd.DataFrame({
+            'Codigo_Ativo': pd.Categorical([]),
+            'Data': pd.Series(dtype='datetime64[ns]'),
+            'Valor': pd.Series(dtype='float64'),
+            'DY': pd.Series(dtype='float32'),
+        })
+        return quotes, dividends
+
+    dividends = pd.concat(histories.values(), keys=histories.keys(), names=['Codigo_Ativo', None])
+    dividends = dividends.reset_index(level=0).reset_index(drop=True).reindex(columns=DIVIDEND_COLUMNS)
+    dividends['Codigo_Ativo'] = pd.Categorical(dividends['Codigo_Ativo'], categories=list(histories))
+    dividends['Data'] = pd.to_datetime(dividends['Data'])
+    dividends['Valor'] = dividends['Valor'].astype('float64')
+    dividends['DY'] = dividends['DY'].astype('float32')
+    return quotes, dividends.sort_values('Data', kind='stable', ignore_index=True)
+
+
+class MarketDataProvider:
+    """Batched market data source used by the apps.
+
+    get_quotes returns {ticker: {QUOTE_FIELDS...}} for every requested ticker
+    (failures carry the message in 'Erro'); get_details returns descriptive
+    fields and 'Historico_Dividendos' for the tickers that have them.
+    """
+
+    name = None
+
+    def get_quotes(self, tickers):
+        raise NotImplementedError
+
+    def get_details(self, tickers):
+        return {}
+
+    def get_market_data(self, tickers):
+        """Quotes merged with details, one dict per ticker."""
+        market_data = self.get_quotes(tickers)
+        for ticker, details in self.get_details(tickers).items():
+            if ticker in market_data and market_data[ticker].get('Erro') is None:
+                market_data[ticker].update(details)
+        return market_data
+
+
+class SimulatedProvider(MarketDataProvider):
+    """Serves the sample data defined above; no network and no artificial latency."""
+
+    name = 'simulated'
+
+    def __init__(self, quotes=None, details=None):
+        self.quotes = SAMPLE_QUOTES if quotes is None else quotes
+        self.details = SAMPLE_DETAILS if details is None else details
+        self._missing = dict.fromkeys(QUOTE_FIELDS[:-1], None)
+        self._missing['Erro'] = NOT_FOUND
+
+    def get_quotes(self, tickers):
+        return {
+            ticker: {**self.quotes[ticker], 'Erro': None} if ticker in self.quotes else dict(self._missing)
+            for ticker in tickers
+        }
+
+    def get_details(self, tickers):
+        return {ticker: dict(self.details[ticker]) for ticker in tickers if ticker in self.details}
+
+
+class YahooProvider(MarketDataProvider):
+    """Real quotes from the YahooFinance API through fetch_api_data's concurrent fetcher."""
+
+    name = 'yahoo'
+
+    def __init__(self, api_client=None, max_workers=None, rate_limit=None, suffix='.SA'):
+        # Imported lazily: fetch_api_data looks for the sandbox ApiClient at import
+        import fetch_api_data
+
+        self._fetch = fetch_api_data.fetch_market_data
+        self.api_client = api_client
+        self.max_workers = max_workers or fetch_api_data.DEFAULT_MAX_WORKERS
+        self.rate_limit = rate_limit  # None: the process-wide YahooFinance bucket in upstream
+        self.suffix = suffix
+
+    def get_quotes(self, tickers):
+        symbols = [ticker if ticker.endswith(self.suffix) else ticker + self.suffix for ticker in tickers]
+        fetched = self._fetch(symbols, max_workers=self.max_workers, rate_limit=self.rate_limit, api_client=self.api_client)
+        quotes = {}
+        for ticker, symbol in zip(tickers, symbols):
+            data = fetched.get(symbol.replace(self.suffix, ''), {})
+            quote = {field: data.get(field) for field in QUOTE_FIELDS}
+            quote['Liquidez_Diaria_Vol'] = data.get('Liquidez_Diaria')
+            quotes[ticker] = quote
+        return quotes
+
+
+PROVIDERS = {
+    SimulatedProvider.name: SimulatedProvider,
+    YahooProvider.name: YahooProvider,
+}
+
+
+def get_provider(name=None, **kwargs):
+    """Builds the provider named by `name` or MMPG_MARKET_PROVIDER (default: simulated)."""
+    name = name or os.environ.get('MMPG_MARKET_PROVIDER', SimulatedProvider.name)
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown market data provider: {name}. Use one of {', '.join(PROVIDERS)}")
+    return PROVIDERS[name](**kwargs)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Fetch quotes through a market data provider.")
+    parser.add_argument('tickers', nargs='*', default=list(SAMPLE_QUOTES))
+    parser.add_argument('--provider', choices=list(PROVIDERS), default=None)
+    args = parser.parse_args()
+
+    provider = get_provider(args.provider)
+    started = time.perf_counter()
+    df = pd.DataFrame.from_dict(provider.get_quotes(args.tickers), orient='index')
+    print(df)
+    print(f"{provider.name}: {len(df)} tickers in {time.perf_counter() - started:.4f}s")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+def deep_size(obj, _seen=None):
+    """Bytes held by `obj`, following nested DataFrames, containers and object attributes.
+
+    DataFrame.memory_usage(deep=True) counts a nested DataFrame in an object
+    column as a pointer only; here those cells are measured too. Objects
+    reachable more than once are counted once.
+    """
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        size = int(obj.memory_usage(index=True, deep=True).sum())
+        for column in obj.columns[obj.dtypes == object]:
+            size += sum(deep_size(value, seen) for value in obj[column] if isinstance(value, (pd.DataFrame, pd.Series)))
+        return size
+    if isinstance(obj, pd.Series):
+        size = int(obj.memory_usage(index=True, deep=True))
+        if obj.dtype == object:
+            size += sum(deep_size(value, seen) for value in obj if isinstance(value, (pd.DataFrame, pd.Series)))
+        return size
+    if isinstance(obj, pd.Index):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(deep_size(item, seen) for item in obj)
+    if hasattr(obj, '__dict__') and not isinstance(obj, type):
+        return sys.getsizeof(obj) + deep_size(vars(obj), seen)
+    return sys.getsizeof(obj)
+
+
+def report(objects):
+    """DataFrame with one row per named object: type, rows and bytes, largest first."""
+    rows = []
+    for name, obj in objects.items():
+        rows.append({
+            'Objeto': name,
+            'Tipo': type(obj).__name__,
+            'Linhas': len(obj) if isinstance(obj, (pd.DataFrame, pd.Series, dict, list, tuple)) else None,
+            'Bytes': deep_size(obj),
+        })
+    df = pd.DataFrame(rows, columns=['Objeto', 'Tipo', 'Linhas', 'Bytes'])
+    df['MB'] = df['Bytes'] / 2**20
+    return df.sort_values('Bytes', ascending=False, ignore_index=True)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from market_data import SAMPLE_DETAILS, SAMPLE_QUOTES, SimulatedProvider, to_frames
+
+    parser = argparse.ArgumentParser(description="Compare the memory of the legacy and compact market data frames.")
+    parser.add_argument('--tickers', type=int, default=2000, help="Synthetic tickers (default: 2000)")
+    args = parser.parse_args()
+
+    # Synthetic universe cycling through the sample quotes and details
+    samples = list(SAMPLE_QUOTES)
+    with_details = list(SAMPLE_DETAILS)
+    quotes = {f'T{i:05d}11': SAMPLE_QUOTES[samples[i % len(samples)]] for i in range(args.tickers)}
+    # Each ticker gets its own dividend frame, as a real provider returns
+    details = {}
+    for i, ticker in enumerate(quotes):
+        sample = SAMPLE_DETAILS[with_details[i % len(with_details)]]
+        details[ticker] = {**sample, 'Historico_Dividendos': sample['Historico_Dividendos'].copy()}
+    market_data = SimulatedProvider(quotes, details).get_market_data(list(quotes))
+
+    legacy = pd.DataFrame.from_dict(market_data, orient='index')
+    compact_quotes, dividends = to_frames(market_data)
+    df = report({
+        'legacy (nested dividends)': legacy,
+        'compact quotes': compact_quotes,
+        'compact dividends': dividends,
+    })
+    print(df.to_string(index=False))
+    compact = df.loc[df['Objeto'] != 'legacy (nested dividends)', 'Bytes'].sum()
+    print(f"{args.tickers} tickers: legacy {deep_size(legacy) / 2**20:.2f} MB, "
+          f"compact {compact / 2**20:.2f} MB ({deep_size(legacy) / compact:.1f}x smaller)")
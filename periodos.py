@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import pandas as pd
+
+from price_store import period_start
+
+# Janelas do seletor de período do app; YTD começa em 1º de janeiro
+JANELAS = {
+    '1m': pd.Timedelta(days=30),
+    '3m': pd.Timedelta(days=90),
+    '6m': pd.Timedelta(days=180),
+    '1a': pd.Timedelta(days=365),
+}
+PERIODO_PADRAO = '1a'
+
+
+def inicio_periodo(periodo, hoje=None):
+    """
+    Data inicial do `periodo` terminando em `hoje` (padrão: agora). Aceita as
+    opções do app (1m, 3m, 6m, 1a, YTD) e os períodos do yfinance ('5d',
+    '6mo', '10y', 'ytd', 'max'; 'max' retorna None, sem limite).
+    """
+    hoje = pd.Timestamp(hoje if hoje is not None else pd.Timestamp.now())
+    if periodo == 'YTD':
+        return hoje.normalize().replace(month=1, day=1)
+    if periodo in JANELAS:
+        return hoje - JANELAS[periodo]
+    try:
+        return period_start(hoje, periodo)
+    except ValueError:
+        return hoje - JANELAS[PERIODO_PADRAO]
+
+
+def indexar_por_data(df, coluna=None):
+    """
+    DataFrame ordenado e indexado por data, pronto para `fatiar`. Com
+    `coluna`, o índice vem dessa coluna (que é mantida); sem ela, usa o
+    índice atual (ex.: barras do yfinance). Só ordena se preciso.
+    """
+    if coluna is not None:
+        df = df.set_index(pd.DatetimeIndex(df[coluna]), drop=False)
+        df.index.name = None
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index(kind='stable')
+    return df
+
+
+def _no_fuso_do_indice(data, indice):
+    data = pd.Timestamp(data)
+    fuso = getattr(indice, 'tz', None)
+    if fuso is not None and data.tzinfo is None:
+        return data.tz_localize(fuso)
+    if fuso is None and data.tzinfo is not None:
+        return data.tz_localize(None)
+    return data
+
+
+def fatiar(df, inicio=None, fim=None):
+    """
+    Linhas de `df` (indexado e ordenado por data) com inicio <= data <= fim,
+    localizadas por busca binária no índice: O(log n) e sem cópia (fatia
+    posicional do mesmo bloco de dados).
+    """
+    indice = df.index
+    i = 0 if inicio is None else indice.searchsorted(_no_fuso_do_indice(inicio, indice), side='left')
+    j = len(df) if fim is None else indice.searchsorted(_no_fuso_do_indice(fim, indice), side='right')
+    return df.iloc[i:j]
+
+
+def fatiar_periodo(df, periodo, hoje=None):
+    """Linhas dos últimos `periodo` até `hoje` (padrão: agora) de um `df` indexado por data."""
+    return fatiar(df, inicio_periodo(periodo, hoje))
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    import numpy as np
+
+    parser = argparse.ArgumentParser(description="Compara a máscara booleana com a busca binária ao trocar o período.")
+    parser.add_argument('--linhas', type=int, default=1_000_000, help="Barras no histórico (ex.: anos de barras de 15 min)")
+    parser.add_argument('--repeticoes', type=int, default=50)
+    args = parser.parse_args()
+
+    hoje = pd.Timestamp.now()
+    datas = pd.date_range(end=hoje, periods=args.linhas, freq='15min')
+    df = pd.DataFrame({'Data': datas, 'Preço': np.linspace(10, 20, args.linhas)})
+    indexado = indexar_por_data(df, 'Data')
+
+    for periodo in ['1m', '3m', '6m', '1a', 'YTD']:
+        inicio = time.perf_counter()
+        for _ in range(args.repeticoes):
+            mascara = df[df['Data'] >= inicio_periodo(periodo, hoje)]
+        t_mascara = (time.perf_counter() - inicio) / args.repeticoes
+        inicio = time.perf_counter()
+        for _ in range(args.repeticoes):
+            fatia = fatiar_periodo(indexado, periodo, hoje)
+        t_fatia = (time.perf_counter() - inicio) / args.repeticoes
+        assert fatia['Preço'].to_numpy().tolist() == mascara['Preço'].to_numpy().tolist()
+        print(f"{periodo:>4}: {len(fatia):>8} linhas | máscara {t_mascara * 1000:7.2f} ms | "
+              f"busca binária {t_fatia * 1e6:6.1f} µs | compartilha memória: "
+              f"{np.shares_memory(fatia['Preço'].to_numpy(), indexado['Preço'].to_numpy())}")
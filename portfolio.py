@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import numpy as np
+import pandas as pd
+
+from ledger import calcular_posicoes
+
+# Colunas do histórico que afetam o cálculo das posições
+COLUNAS_HASH = [
+    'Data_Compra', 'Tipo_Operacao', 'Quantidade',
+    'Preco_Compra_Unitario', 'Corretagem_Taxas'
+]
+
+
+def dividir(numerador, denominador, padrao=0.0):
+    """Divisão elemento a elemento que devolve `padrao` onde o denominador é zero."""
+    numerador = np.asarray(numerador, dtype='float64')
+    denominador = np.asarray(denominador, dtype='float64')
+    resultado = np.full(numerador.shape, padrao, dtype='float64')
+    np.divide(numerador, denominador, out=resultado, where=denominador != 0)
+    return resultado
+
+
+def calcular_portfolio(df_historico, df_market_data, metodo='medio'):
+    """Calcula métricas do portfólio com base no histórico e dados de mercado.
+
+    Compras e vendas são consolidadas por `ledger.calcular_posicoes` pelo
+    método de custo médio ('medio') ou PEPS ('fifo'). Lucro_Realizado vem das
+    vendas e Lucro_Prejuizo_Reais é o lucro não realizado da posição aberta.
+    Sem efeitos colaterais: `df_historico` não é alterado.
+    """
+    if df_historico.empty:
+        return pd.DataFrame(), 0, 0, 0, 0
+
+    # Posição consolidada por ativo (quantidade, custo da posição aberta, preço médio)
+    return valorizar_posicoes(calcular_posicoes(df_historico, metodo), df_market_data)
+
+
+def valorizar_posicoes(posicoes, df_market_data):
+    """Acrescenta às posições as colunas que dependem das cotações e calcula os totais."""
+    portfolio = posicoes.copy()
+
+    # Juntar com dados de mercado
+    mercado = df_market_data.reindex(portfolio['Codigo_Ativo'])
+    portfolio['Preco_Atual'] = mercado['Preco_Atual'].to_numpy()
+    portfolio['Erro'] = mercado['Erro'].to_numpy()
+
+    # Calcular Valor Atual da Posição e Lucro/Prejuízo
+    portfolio['Valor_Atual_Posicao'] = (
+        portfolio['Quantidade_Total'] * portfolio['Preco_Atual'].astype('float64')
+    ).fillna(0)
+    portfolio['Lucro_Prejuizo_Reais'] = (
+        portfolio['Valor_Atual_Posicao'] - portfolio['Custo_Total_Acumulado']
+    )
+    portfolio['Lucro_Prejuizo_Perc'] = dividir(
+        portfolio['Lucro_Prejuizo_Reais'] * 100, portfolio['Custo_Total_Acumulado']
+    )
+    portfolio['Lucro_Total'] = portfolio['Lucro_Realizado'] + portfolio['Lucro_Prejuizo_Reais']
+
+    # Calcular totais do portfólio
+    total_investido = portfolio['Custo_Total_Acumulado'].sum()
+    total_atual = portfolio['Valor_Atual_Posicao'].sum()
+    pl_total_reais = total_atual - total_investido
+    pl_total_perc = (
+        pl_total_reais / total_investido * 100
+    ) if total_investido != 0 else 0
+
+    return portfolio, total_investido, total_atual, pl_total_reais, pl_total_perc
+
+
+def hash_por_ativo(df_historico):
+    """
+    Retorna uma Series (uint64) com um hash do histórico de cada ativo. O hash
+    muda se qualquer operação do ativo for incluída, removida, alterada ou
+    reordenada, e não depende das operações dos demais ativos.
+    """
+    colunas = [c for c in COLUNAS_HASH if c in df_historico.columns]
+    grupo, ativos = pd.factorize(df_historico['Codigo_Ativo'])
+    linhas = df_historico[colunas].assign(_ordem=pd.Series(grupo).groupby(grupo).cumcount().to_numpy())
+    hashes = pd.Series(pd.util.hash_pandas_object(linhas, index=False).to_numpy())
+    # Soma em uint64 (com estouro) é independente da ordem entre ativos
+    por_ativo = hashes.groupby(grupo).sum()
+    por_ativo.index = pd.Index(np.asarray(ativos, dtype=object)[por_ativo.index])
+    return por_ativo
+
+
+class CarteiraIncremental:
+    """
+    Mantém as posições calculadas entre reexecuções do Streamlit.
+
+    A cada chamada de `calcular`, o histórico é resumido por `hash_por_ativo`:
+    só os ativos cujo hash mudou têm a posição recalculada. Se o histórico não
+    mudou, só as colunas de valor de mercado são refeitas quando as cotações
+    mudam; se nada mudou, o resultado anterior é devolvido. Quem chama pode
+    informar `versao` (ex.: hash do arquivo enviado) para pular até o hash
+    do histórico enquanto a versão não mudar.
+    """
+
+    def __init__(self):
+        self.versao = None
+        self.metodo = None
+        self.hashes = None
+        self.posicoes = None
+        self.recalculados = []  # Ativos recalculados na última chamada
+        self._precos = None
+        self._resultado = None
+
+    def atualizar_historico(self, df_historico, metodo='medio'):
+        """Recalcula as posições dos ativos alterados. Retorna True se algo mudou."""
+        hashes = hash_por_ativo(df_historico)
+        if self.posicoes is None or metodo != self.metodo:
+            alterados = hashes.index
+            mantidos = self.posicoes.iloc[0:0] if self.posicoes is not None else None
+        else:
+            anteriores = self.hashes.reindex(hashes.index)
+            alterados = hashes.index[anteriores.isna().to_numpy() | (anteriores.to_numpy() != hashes.to_numpy())]
+            if len(alterados) == 0 and len(hashes) == len(self.hashes):
+                self.recalculados = []
+                return False
+            mantidos = self.posicoes[
+                self.posicoes['Codigo_Ativo'].isin(hashes.index) & ~self.posicoes['Codigo_Ativo'].isin(alterados)
+            ]
+
+        partes = [] if mantidos is None or mantidos.empty else [mantidos]
+        if len(alterados):
+            partes.append(calcular_posicoes(df_historico[df_historico['Codigo_Ativo'].isin(alterados)], metodo))
+        posicoes = pd.concat(partes) if len(partes) > 1 else partes[0]
+        self.posicoes = posicoes.sort_values('Codigo_Ativo', ignore_index=True)
+        self.hashes = hashes
+        self.metodo = metodo
+        self.recalculados = list(alterados)
+        self._resultado = None
+        return True
+
+    def calcular(self, df_historico, df_market_data, metodo='medio', versao=None):
+        """Mesmo retorno de `calcular_portfolio`, recalculando só o necessário."""
+        if df_historico.empty:
+            return calcular_portfolio(df_historico, df_market_data, metodo)
+        if versao is None or versao != self.versao or metodo != self.metodo:
+            self.atualizar_historico(df_historico, metodo)
+            self.versao = versao
+        else:
+            self.recalculados = []
+        if self._resultado is None or not self._precos.equals(df_market_data):
+            self._precos = df_market_data.copy()
+            self._resultado = valorizar_posicoes(self.posicoes, df_market_data)
+        return self._resultado
+
+
+def gerar_historico_sintetico(n_transacoes, n_ativos=500, seed=0):
+    """Gera um histórico de compras sintético no layout da aba Historico_Compras."""
+    rng = np.random.default_rng(seed)
+    codigos = np.array([f'ATV{i:04d}11' for i in range(n_ativos)])
+    precos_base = rng.uniform(5, 200, n_ativos)
+    ativo = rng.integers(0, n_ativos, n_transacoes)
+    df_historico = pd.DataFrame({
+        'Data_Compra': pd.Timestamp('2015-01-01') + pd.to_timedelta(rng.integers(0, 3650, n_transacoes), unit='D'),
+        'Codigo_Ativo': codigos[ativo],
+        'Tipo_Ativo': 'FII',
+        'Quantidade': rng.integers(1, 500, n_transacoes),
+        'Preco_Compra_Unitario': np.round(precos_base[ativo] * rng.uniform(0.8, 1.2, n_transacoes), 2),
+        'Corretagem_Taxas': np.round(rng.choice([0, 2.5, 4.9], n_transacoes), 2),
+    })
+    df_market_data = pd.DataFrame(
+        {'Preco_Atual': np.round(precos_base * rng.uniform(0.7, 1.3, n_ativos), 2), 'Erro': None},
+        index=codigos
+    )
+    return df_historico.sort_values('Data_Compra', ignore_index=True), df_market_data
+
+
+def benchmark(tamanhos=(10_000, 100_000, 1_000_000), repeticoes=3):
+    """Mede tempo (melhor de `repeticoes`) e pico de memória de calcular_portfolio."""
+    import time
+    import tracemalloc
+
+    resultados = []
+    for n in tamanhos:
+        df_historico, df_market_data = gerar_historico_sintetico(n)
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            calcular_portfolio(df_historico, df_market_data)
+            tempos.append(time.perf_counter() - inicio)
+        tracemalloc.start()
+        calcular_portfolio(df_historico, df_market_data)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        resultados.append({'transacoes': n, 'segundos': min(tempos), 'pico_mb': pico / 2**20})
+    return pd.DataFrame(resultados)
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Benchmark de calcular_portfolio com históricos sintéticos.")
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--max-segundos', type=float, default=None,
+                        help="Falha (código 1) se algum tamanho passar deste tempo")
+    args = parser.parse_args()
+
+    resultados = benchmark(args.tamanhos)
+    print(resultados.to_string(index=False, float_format=lambda v: f'{v:.3f}'))
+    if args.max_segundos is not None and (resultados['segundos'] > args.max_segundos).any():
+        print(f"Regressão: tempo acima de {args.max_segundos}s")
+        sys.exit(1)
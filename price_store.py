@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import re
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from market_cache import CACHE_DIR
+
+# How daily OHLCV bars are combined when resampling to weekly/monthly views
+RESAMPLE_AGG = {
+    'Open': 'first',
+    'High': 'max',
+    'Low': 'min',
+    'Close': 'last',
+    'Volume': 'sum',
+    'Dividends': 'sum',
+    'Stock Splits': 'max',
+    'Capital Gains': 'sum',
+}
+
+# yfinance interval -> pandas resample rule (labels match yfinance: week/month start)
+RESAMPLE_RULES = {
+    '1wk': 'W-MON',
+    '1mo': 'MS',
+}
+
+
+def yfinance_downloader(ticker, period=None, start=None):
+    """Downloads daily bars with yfinance (imported lazily so the store works without it)."""
+    import yfinance as yf
+    stock = yf.Ticker(ticker)
+    if start is not None:
+        return stock.history(start=start, interval='1d')
+    return stock.history(period=period, interval='1d')
+
+
+def period_start(end, period):
+    """Start of a yfinance-style period ('10y', '6mo', '30d', 'ytd', 'max') ending at `end`."""
+    if period in (None, 'max'):
+        return None
+    if period == 'ytd':
+        return end.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    match = re.fullmatch(r'(\d+)(y|mo|wk|d)', period)
+    if not match:
+        raise ValueError(f"Unsupported period: {period}")
+    n, unit = int(match.group(1)), match.group(2)
+    offset = {
+        'y': pd.DateOffset(years=n),
+        'mo': pd.DateOffset(months=n),
+        'wk': pd.DateOffset(weeks=n),
+        'd': pd.DateOffset(days=n),
+    }[unit]
+    return end - offset
+
+
+def resample_bars(daily, interval):
+    """Builds weekly/monthly bars locally from daily bars."""
+    if interval == '1d':
+        return daily
+    if interval not in RESAMPLE_RULES:
+        raise ValueError(f"Unsupported interval: {interval}")
+    agg = {col: how for col, how in RESAMPLE_AGG.items() if col in daily.columns}
+    bars = daily.resample(RESAMPLE_RULES[interval], label='left', closed='left').agg(agg)
+    return bars.dropna(subset=['Close'])
+
+
+def daily_closes(daily):
+    """Close series of stored daily bars indexed by tz-naive, normalized dates (one per day)."""
+    closes = daily['Close']
+    index = closes.index.tz_localize(None) if closes.index.tz is not None else closes.index
+    closes = pd.Series(closes.to_numpy(), index=index.normalize())
+    return closes[~closes.index.duplicated(keep='last')]
+
+
+def close_matrix(store, tickers, start=None, suffix='.SA'):
+    """
+    Daily closes of `tickers` from the bars already in `store` (no download),
+    aligned on the union of their trading days from `start` on. Returns the
+    (tickers x dates) matrix, NaN where a ticker has no bar, and the dates.
+    """
+    series = {}
+    for ticker in tickers:
+        daily = store.load(f'{ticker}{suffix}')
+        if daily is not None and not daily.empty:
+            series[ticker] = daily_closes(daily)
+    if not series:
+        return np.full((len(tickers), 0), np.nan), pd.DatetimeIndex([])
+    frame = pd.DataFrame(series).sort_index()
+    if start is not None:
+        frame = frame[frame.index >= pd.Timestamp(start).normalize()]
+    return frame.reindex(columns=list(tickers)).to_numpy(dtype=np.float64).T, pd.DatetimeIndex(frame.index)
+
+
+class PriceStore:
+    """Local Parquet store of daily OHLCV bars, one file per ticker.
+
+    The first request for a ticker downloads `initial_period` of history; later
+    refreshes only download bars from the last stored date onwards (the last bar
+    is re-fetched because it may have been an intraday partial). Weekly and
+    monthly views are resampled from the stored daily bars.
+    """
+
+    def __init__(self, root=None, downloader=yfinance_downloader, initial_period='10y'):
+        self.root = root or os.path.join(CACHE_DIR, 'prices')
+        self.downloader = downloader
+        self.initial_period = initial_period
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, ticker):
+        return os.path.join(self.root, f"{ticker.replace('/', '_')}.parquet")
+
+    def _lock(self, ticker):
+        with self._locks_guard:
+            return self._locks.setdefault(ticker, threading.Lock())
+
+    def load(self, ticker):
+        """Returns the stored daily bars or None."""
+        path = self.path(ticker)
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path)
+
+    def save(self, ticker, daily):
+        tmp_path = self.path(ticker) + '.tmp'
+        daily.to_parquet(tmp_path)
+        os.replace(tmp_path, self.path(ticker))
+
+    def refresh(self, ticker):
+        """Appends bars newer than the last stored date and returns the full daily history."""
+        with self._lock(ticker):
+            stored = self.load(ticker)
+            if stored is None or stored.empty:
+                daily = self.downloader(ticker, period=self.initial_period)
+                if daily is None or daily.empty:
+                    return None
+            else:
+                last_date = stored.index[-1]
+                new_bars = self.downloader(ticker, start=last_date.strftime('%Y-%m-%d'))
+                if new_bars is None or new_bars.empty:
+                    return stored
+                new_bars = new_bars.reindex(columns=stored.columns)
+                daily = pd.concat([stored[stored.index < new_bars.index[0]], new_bars])
+            daily = daily[~daily.index.duplicated(keep='last')].sort_index()
+            self.save(ticker, daily)
+            return daily
+
+    def get(self, ticker, period='10y', interval='1d', refresh=True):
+        """Returns bars for `period` at `interval` ('1d', '1wk' or '1mo')."""
+        daily = self.refresh(ticker) if refresh else self.load(ticker)
+        if daily is None or daily.empty:
+            return None
+        start = period_start(daily.index[-1], period)
+        if start is not None:
+            daily = daily[daily.index >= start]
+        return resample_bars(daily, interval)
+
+
+if __name__ == '__main__':
+    import sys
+
+    ticker = sys.argv[1] if len(sys.argv) > 1 else 'VRTA11.SA'
+    store = PriceStore()
+    started = datetime.now()
+    df = store.get(ticker, interval='1mo')
+    print(f"{ticker}: {len(store.load(ticker))} daily bars stored, refreshed in {datetime.now() - started}")
+    print(df.tail())
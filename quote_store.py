@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import threading
+import time
+from concurrent.futures import Future
+
+from market_cache import FIELD_TTLS
+
+# Seconds between refresher passes
+REFRESH_INTERVAL = 60
+# Records older than this are refreshed by the background thread
+MAX_AGE = FIELD_TTLS['Preco_Atual']
+# Tickers nobody asked for in this long stop being refreshed and are dropped from memory
+ACTIVE_WINDOW = 3600
+
+
+class QuoteStore:
+    """Process-wide per-ticker market data shared by every session.
+
+    Sessions call get(tickers) and read records from memory. Only tickers
+    never seen by the process are loaded on the spot, first from the
+    persistent MarketDataCache (if given) and then upstream. A daemon thread
+    refreshes, every `refresh_interval` seconds, the records older than
+    `max_age` among the tickers requested in the last `active_window` seconds
+    (the union of all sessions' watchlists), so sessions never wait on a
+    refresh. Concurrent loads of the same ticker are coalesced into a single
+    loader call; callers asking for a ticker already in flight wait for
+    that call instead of issuing their own.
+    """
+
+    def __init__(self, loader, cache=None, refresh_interval=REFRESH_INTERVAL, max_age=MAX_AGE,
+                 active_window=ACTIVE_WINDOW, range_='5d', interval='1d'):
+        self.loader = loader
+        self.cache = cache
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.active_window = active_window
+        self.range_ = range_
+        self.interval = interval
+        self.upstream_calls = 0
+        self.upstream_tickers = 0
+        self.refreshes = 0
+        self._records = {}    # ticker -> (record, fetched_at)
+        self._last_seen = {}  # ticker -> last time a session asked for it
+        self._inflight = {}   # ticker -> Future of the loader call fetching it
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def get(self, tickers):
+        """Returns {ticker: record} for the tickers with data; never waits on a refresh."""
+        tickers = list(dict.fromkeys(tickers))
+        now = time.time()
+        with self._lock:
+            self._start_refresher()
+            for ticker in tickers:
+                self._last_seen[ticker] = now
+            found = {ticker: self._records[ticker][0] for ticker in tickers if ticker in self._records}
+        missing = [ticker for ticker in tickers if ticker not in found]
+        if missing:
+            found.update(self._load_missing(missing))
+        # Shallow copies: callers may add fields without touching the shared record
+        return {ticker: dict(found[ticker]) for ticker in tickers if found.get(ticker) is not None}
+
+    def _load_missing(self, tickers):
+        loaded = {}
+        if self.cache is not None:
+            stale = False
+            cached = self.cache.get_many(tickers, self.range_, self.interval)
+            with self._lock:
+                for ticker, (record, is_stale) in cached.items():
+                    # Stale records are served now and picked up by the next refresher pass
+                    self._records[ticker] = (record, 0.0 if is_stale else time.time())
+                    loaded[ticker] = record
+                    stale = stale or is_stale
+            if stale:
+                self._wake.set()
+        rest = [ticker for ticker in tickers if ticker not in loaded]
+        if rest:
+            loaded.update(self._load(rest))
+        return loaded
+
+    def _load(self, tickers):
+        """Loads `tickers` upstream, joining loads already in flight. Returns {ticker: record or None}."""
+        own, futures = [], {}
+        with self._lock:
+            for ticker in tickers:
+                future = self._inflight.get(ticker)
+                if future is None:
+                    future = self._inflight[ticker] = Future()
+                    own.append(ticker)
+                futures[ticker] = future
+
+        if own:
+            try:
+                fetched = self.loader(own)
+            except BaseException as e:
+                with self._lock:
+                    for ticker in own:
+                        self._inflight.pop(ticker).set_exception(e)
+                raise
+            now = time.time()
+            with self._lock:
+                self.upstream_calls += 1
+                self.upstream_tickers += len(own)
+                for ticker in own:
+                    record = fetched.get(ticker)
+                    previous = self._records.get(ticker)
+                    # Keep the last good value when the upstream call failed for this ticker
+                    if record is not None and not (record.get('Erro') and previous and not previous[0].get('Erro')):
+                        self._records[ticker] = (record, now)
+                    current = self._records.get(ticker)
+                    self._inflight.pop(ticker).set_result(current[0] if current else None)
+            if self.cache is not None:
+                self.cache.put_many(fetched, self.range_, self.interval)
+
+        return {ticker: future.result() for ticker, future in futures.items()}
+
+    def due(self, now=None):
+        """Active tickers whose record is older than max_age or carries an error."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return [
+                ticker for ticker, seen in self._last_seen.items()
+                if now - seen <= self.active_window and ticker not in self._inflight and (
+                    ticker not in self._records
+                    or now - self._records[ticker][1] > self.max_age
+                    or self._records[ticker][0].get('Erro')
+                )
+            ]
+
+    def refresh(self):
+        """One refresher pass: drops inactive tickers and reloads the due ones in one loader call."""
+        now = time.time()
+        with self._lock:
+            for ticker in [t for t, seen in self._last_seen.items() if now - seen > self.active_window]:
+                del self._last_seen[ticker]
+                self._records.pop(ticker, None)
+        tickers = self.due(now)
+        if tickers:
+            self._load(tickers)
+            with self._lock:
+                self.refreshes += 1
+        return tickers
+
+    def _start_refresher(self):
+        # Called with the lock held
+        if self._thread is None and self.refresh_interval and not self._stopped:
+            self._thread = threading.Thread(target=self._run, name='quote-store-refresh', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+            if self._stopped:
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Quote refresh failed: {e}")
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tickers': len(self._records),
+                'active': len(self._last_seen),
+                'upstream_calls': self.upstream_calls,
+                'upstream_tickers': self.upstream_tickers,
+                'refreshes': self.refreshes,
+            }
+
+
+if __name__ == '__main__':
+    import argparse
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+
+    from market_data import SAMPLE_QUOTES, get_provider
+
+    parser = argparse.ArgumentParser(description="Simulate many sessions with overlapping watchlists on one server.")
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--reruns', type=int, default=5, help="Reruns per session")
+    parser.add_argument('--watchlist', type=int, default=8, help="Tickers per session")
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds per upstream call")
+    parser.add_argument('--provider', default=None)
+    args = parser.parse_args()
+
+    provider = get_provider(args.provider)
+    universe = list(SAMPLE_QUOTES)
+    rng = random.Random(0)
+    watchlists = [rng.sample(universe, min(args.watchlist, len(universe))) for _ in range(args.sessions)]
+
+    def loader(tickers):
+        time.sleep(args.latency)
+        return provider.get_market_data(tickers)
+
+    def run(fetch):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(16) as pool:
+            list(pool.map(lambda w: [fetch(w) for _ in range(args.reruns)], watchlists))
+        return time.perf_counter() - started
+
+    # Baseline: a cache keyed by the exact ticker list, like st.cache_data on fetch_market_data
+    by_list, calls = {}, []
+
+    def fetch_by_list(watchlist):
+        key = tuple(watchlist)
+        if key not in by_list:
+            calls.append(len(watchlist))
+            by_list[key] = loader(watchlist)
+        return by_list[key]
+
+    baseline = run(fetch_by_list)
+    print(f"cache per ticker list: {len(calls)} upstream calls, {sum(calls)} tickers, {baseline:.2f}s")
+
+    store = QuoteStore(loader, refresh_interval=None)
+    shared = run(store.get)
+    stats = store.stats()
+    print(f"shared store:          {stats['upstream_calls']} upstream calls, {stats['upstream_tickers']} tickers, {shared:.2f}s")
@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import numpy as np
+import pandas as pd
+
+from ledger import normalizar_operacoes
+
+CARTEIRA = 'Carteira'
+COLUNAS_FLUXOS = ['Codigo_Ativo', 'Data', 'Valor', 'Tipo']
+COLUNAS_RETORNOS = ['TWR_Pct', 'XIRR_Anual_Pct', 'Dividendos_Recebidos']
+# Pontos de partida do Newton, tentados em ordem para os grupos que ainda não convergiram
+CHUTES = (0.1, 0.0, -0.5, 1.0)
+# Taxas acima disso (1.000.000% a.a.) são tratadas como divergência
+TAXA_MAXIMA = 1e4
+
+
+def fluxos_caixa(df_historico, df_market_data=None, df_dividendos=None, hoje=None):
+    """
+    Fluxos de caixa do investidor por ativo em formato longo (Codigo_Ativo,
+    Data, Valor, Tipo): compras negativas e vendas positivas (com taxas),
+    proventos recebidos (valor por cota x quantidade em carteira na véspera
+    do pagamento) e, com `df_market_data`, o valor da posição em `hoje`
+    como fluxo final ('Posicao').
+    """
+    hoje = pd.Timestamp(hoje if hoje is not None else pd.Timestamp.now())
+    if df_historico.empty:
+        return pd.DataFrame(columns=COLUNAS_FLUXOS)
+    codigos, grupo, quantidade, preco, taxas, datas = normalizar_operacoes(df_historico)
+    ativo = codigos[grupo]
+    partes = [pd.DataFrame({
+        'Codigo_Ativo': ativo,
+        'Data': datas,
+        'Valor': -(quantidade * preco + taxas),
+        'Tipo': np.where(quantidade < 0, 'Venda', 'Compra'),
+    })]
+
+    # Quantidade em carteira após cada operação, para pagar os proventos
+    posicoes = pd.DataFrame({'Codigo_Ativo': ativo, 'Data': datas, 'Quantidade': quantidade})
+    posicoes = posicoes.sort_values('Data', kind='stable', ignore_index=True)
+    posicoes['Quantidade'] = posicoes.groupby('Codigo_Ativo', sort=False)['Quantidade'].cumsum()
+
+    if df_dividendos is not None and not df_dividendos.empty:
+        proventos = df_dividendos[['Codigo_Ativo', 'Data', 'Valor']].copy()
+        proventos['Codigo_Ativo'] = proventos['Codigo_Ativo'].astype(str).astype(object)
+        proventos['Data'] = pd.to_datetime(proventos['Data']).astype('datetime64[ns]')
+        proventos = proventos[proventos['Codigo_Ativo'].isin(codigos) & (proventos['Data'] <= hoje)]
+        proventos = pd.merge_asof(
+            proventos.sort_values('Data', kind='stable'), posicoes,
+            on='Data', by='Codigo_Ativo', direction='backward', allow_exact_matches=False
+        )
+        proventos['Valor'] = proventos['Valor'].astype('float64') * proventos['Quantidade'].fillna(0)
+        proventos = proventos[proventos['Valor'] > 0]
+        partes.append(proventos[['Codigo_Ativo', 'Data', 'Valor']].assign(Tipo='Provento'))
+
+    if df_market_data is not None:
+        quantidade_final = pd.Series(quantidade).groupby(grupo).sum()
+        preco_atual = df_market_data['Preco_Atual'].reindex(codigos[quantidade_final.index]).astype('float64').to_numpy()
+        final = pd.DataFrame({
+            'Codigo_Ativo': codigos[quantidade_final.index],
+            'Data': hoje,
+            'Valor': quantidade_final.to_numpy() * preco_atual,
+            'Tipo': 'Posicao',
+        })
+        partes.append(final[final['Valor'] > 0])
+
+    fluxos = pd.concat(partes, ignore_index=True)
+    fluxos['Data'] = fluxos['Data'].astype('datetime64[ns]')
+    return fluxos.sort_values(['Codigo_Ativo', 'Data'], kind='stable', ignore_index=True)
+
+
+def _newton(grupo, valores, anos, n, chute, ativos, tolerancia, max_iter):
+    """Newton em lote a partir de `chute` para os grupos `ativos`; NaN onde não converge."""
+    taxa = np.full(n, float(chute))
+    ativos = ativos.copy()
+    falhas = np.zeros(n, dtype=bool)
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        for _ in range(max_iter):
+            if not ativos.any():
+                break
+            linhas = ativos[grupo]
+            g, v, t = grupo[linhas], valores[linhas], anos[linhas]
+            desconto = v * np.exp(-t * np.log1p(taxa[g]))
+            vpl = np.bincount(g, desconto, n)
+            derivada = np.bincount(g, -t * desconto / (1 + taxa[g]), n)
+            passo = vpl / derivada
+            nova = taxa - passo
+            # Passo que cruzaria -100% vai só até metade do caminho
+            nova = np.where(nova <= -1, (taxa - 1) / 2, nova)
+            falhou = ativos & (~np.isfinite(passo) | (nova > TAXA_MAXIMA))
+            taxa = np.where(ativos & ~falhou, nova, taxa)
+            falhas |= falhou
+            ativos &= ~falhou & ~(np.abs(passo) < tolerancia)
+    return np.where(falhas | ativos, np.nan, taxa)
+
+
+def xirr(grupo, valores, datas, n_grupos=None, chutes=CHUTES, tolerancia=1e-9, max_iter=100):
+    """
+    Taxa interna de retorno anual (base 365 dias) de cada grupo de fluxos
+    irregulares, resolvida para todos os grupos juntos: cada iteração de
+    Newton avalia o VPL e sua derivada de todos os fluxos de uma vez e soma
+    por grupo com bincount; grupos que convergem saem das próximas
+    iterações e os que não convergem recomeçam do próximo chute. NaN para
+    grupos sem fluxos dos dois sinais ou sem convergência.
+    """
+    grupo = np.asarray(grupo, dtype=np.int64)
+    valores = np.asarray(valores, dtype=np.float64)
+    dias = np.asarray(datas, dtype='datetime64[ns]').astype(np.int64) / 86_400e9
+    n = int(n_grupos if n_grupos is not None else (grupo.max() + 1 if len(grupo) else 0))
+
+    inicio = np.full(n, np.inf)
+    np.minimum.at(inicio, grupo, dias)
+    anos = (dias - inicio[grupo]) / 365.0
+    pendentes = (np.bincount(grupo, valores > 0, n) > 0) & (np.bincount(grupo, valores < 0, n) > 0)
+
+    taxa = np.full(n, np.nan)
+    for chute in chutes:
+        if not pendentes.any():
+            break
+        encontradas = _newton(grupo, valores, anos, n, chute, pendentes, tolerancia, max_iter)
+        resolvidos = pendentes & ~np.isnan(encontradas)
+        taxa[resolvidos] = encontradas[resolvidos]
+        pendentes &= ~resolvidos
+    return taxa
+
+
+def xirr_por_ativo(fluxos):
+    """
+    XIRR anual de cada ativo e da carteira inteira (sob a chave CARTEIRA)
+    a partir da tabela de `fluxos_caixa`, numa única chamada de `xirr`.
+    """
+    if fluxos.empty:
+        return pd.Series(dtype='float64', name='XIRR_Anual')
+    grupo, ativos = pd.factorize(fluxos['Codigo_Ativo'], sort=True)
+    n = len(ativos)
+    # A carteira é o grupo extra n, com todos os fluxos
+    todos = np.concatenate([grupo, np.full(len(grupo), n)])
+    valores = np.tile(fluxos['Valor'].to_numpy(dtype='float64'), 2)
+    datas = np.tile(fluxos['Data'].to_numpy(dtype='datetime64[ns]'), 2)
+    taxas = xirr(todos, valores, datas, n + 1)
+    return pd.Series(taxas, index=pd.Index(list(ativos) + [CARTEIRA], name='Codigo_Ativo'), name='XIRR_Anual')
+
+
+def _matriz(linha, coluna, valores, n, d):
+    """Soma `valores` nas células (linha, coluna) de uma matriz (n, d)."""
+    return np.bincount(linha * d + coluna, weights=valores, minlength=n * d).reshape(n, d)
+
+
+def _retorno_diario(valor, proventos, aportes):
+    """Retorno de cada dia sobre o valor da véspera: (V_t + proventos_t - aportes_t) / V_{t-1} - 1."""
+    anterior = np.concatenate([np.zeros((valor.shape[0], 1)), valor[:, :-1]], axis=1)
+    resultado = np.zeros(valor.shape)
+    np.divide(valor + proventos - aportes - anterior, anterior, out=resultado, where=anterior > 0)
+    return resultado
+
+
+def twr_diario(df_historico, precos, datas, tickers, df_dividendos=None, aportes_a_mercado=False):
+    """
+    Retornos diários ponderados pelo tempo (TWR) de cada ativo e da carteira
+    sobre a matriz de preços (tickers x datas). Compras e vendas entram como
+    aportes/resgates no fim do dia em que ocorrem (operações anteriores à
+    primeira data formam a posição inicial); proventos contam como retorno.
+    Com `aportes_a_mercado`, os aportes valem o preço da própria matriz no
+    dia (mais taxas) em vez do preço da operação: use quando a matriz não é
+    a mesma fonte de preços das operações (ex.: históricos simulados), para
+    que a diferença entre as duas não vire retorno.
+    Retorna (retornos dos ativos (n, d), retornos da carteira (d,)); sem
+    datas (ex.: sem barras guardadas), matrizes vazias.
+    """
+    datas = pd.DatetimeIndex(datas)
+    n, d = len(tickers), len(datas)
+    if df_historico.empty or d == 0:
+        return np.zeros((n, d)), np.zeros(d)
+    precos = pd.DataFrame(np.asarray(precos, dtype=np.float64)).ffill(axis=1).fillna(0).to_numpy()
+
+    codigos, grupo, quantidade, preco, taxas, datas_operacoes = normalizar_operacoes(df_historico)
+    linha = pd.Index(tickers).get_indexer(codigos)[grupo]
+    dia = np.minimum(datas.searchsorted(datas_operacoes), d - 1)
+    manter = linha >= 0
+    linha, dia = linha[manter], dia[manter]
+    quantidades = _matriz(linha, dia, quantidade[manter], n, d).cumsum(axis=1)
+    if aportes_a_mercado:
+        preco = np.zeros(len(quantidade))
+        preco[manter] = precos[linha, dia]
+    aportes = _matriz(linha, dia, (quantidade * preco + taxas)[manter], n, d)
+    valor = quantidades * precos
+
+    proventos = np.zeros((n, d))
+    if df_dividendos is not None and not df_dividendos.empty:
+        linha_div = pd.Index(tickers).get_indexer(df_dividendos['Codigo_Ativo'].astype(str))
+        data_div = pd.DatetimeIndex(df_dividendos['Data'])
+        dia_div = datas.searchsorted(data_div)
+        manter = (linha_div >= 0) & (data_div > datas[0]) & (dia_div < d)
+        por_cota = _matriz(linha_div[manter], dia_div[manter], df_dividendos['Valor'].to_numpy(dtype=np.float64)[manter], n, d)
+        # Paga a quantidade em carteira na véspera
+        proventos = por_cota * np.concatenate([np.zeros((n, 1)), quantidades[:, :-1]], axis=1)
+
+    por_ativo = _retorno_diario(valor, proventos, aportes)
+    carteira = _retorno_diario(valor.sum(axis=0)[np.newaxis], proventos.sum(axis=0)[np.newaxis], aportes.sum(axis=0)[np.newaxis])[0]
+    return por_ativo, carteira
+
+
+def metricas_retorno(df_historico, df_market_data, precos, datas, tickers, df_dividendos=None, hoje=None,
+                     aportes_a_mercado=False):
+    """
+    TWR do período da matriz de preços, XIRR anual (histórico completo, com
+    proventos) e proventos recebidos de cada ativo e da carteira
+    (`aportes_a_mercado`: ver `twr_diario`). Retorna
+    (DataFrame indexado por ticker com COLUNAS_RETORNOS, uma linha com os
+    mesmos campos para a carteira, Series com o TWR acumulado diário da carteira).
+    Sem datas na matriz, o TWR fica NaN.
+    """
+    fluxos = fluxos_caixa(df_historico, df_market_data, df_dividendos, hoje)
+    taxas = xirr_por_ativo(fluxos)
+    recebidos = fluxos[fluxos['Tipo'] == 'Provento'].groupby('Codigo_Ativo')['Valor'].sum()
+
+    retornos_ativos, retornos_carteira = twr_diario(
+        df_historico, precos, datas, tickers, df_dividendos, aportes_a_mercado
+    )
+    twr_ativos = np.prod(1 + retornos_ativos, axis=1) - 1 if len(datas) else np.full(len(tickers), np.nan)
+    acumulado = pd.Series(np.cumprod(1 + retornos_carteira) - 1, index=pd.DatetimeIndex(datas), name='TWR')
+
+    por_ativo = pd.DataFrame({
+        'TWR_Pct': twr_ativos * 100,
+        'XIRR_Anual_Pct': taxas.reindex(tickers).to_numpy() * 100,
+        'Dividendos_Recebidos': recebidos.reindex(tickers).fillna(0).to_numpy(),
+    }, index=pd.Index(tickers, name='Codigo_Ativo'))
+    carteira = {
+        'TWR_Pct': (acumulado.iloc[-1] if len(acumulado) else np.nan) * 100,
+        'XIRR_Anual_Pct': taxas.get(CARTEIRA, np.nan) * 100,
+        'Dividendos_Recebidos': recebidos.sum(),
+    }
+    return por_ativo, carteira, acumulado
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from portfolio import gerar_historico_sintetico
+
+    parser = argparse.ArgumentParser(description="XIRR em lote (Newton vetorizado) vs. uma busca de raiz por ativo.")
+    parser.add_argument('--transacoes', type=int, default=100_000)
+    parser.add_argument('--ativos', type=int, default=5000)
+    args = parser.parse_args()
+
+    df_historico, df_market_data = gerar_historico_sintetico(args.transacoes, args.ativos)
+    hoje = pd.Timestamp('2025-06-30')
+    inicio = time.perf_counter()
+    fluxos = fluxos_caixa(df_historico, df_market_data, hoje=hoje)
+    t_fluxos = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    lote = xirr_por_ativo(fluxos)
+    t_lote = time.perf_counter() - inicio
+
+    # Referência: Newton escalar por ativo (como scipy.optimize.newton num laço)
+    def newton(valores, anos):
+        for taxa in CHUTES:
+            for _ in range(100):
+                desconto = valores * (1 + taxa) ** -anos
+                passo = desconto.sum() / (-anos * desconto / (1 + taxa)).sum()
+                nova = taxa - passo
+                if not np.isfinite(passo) or nova > TAXA_MAXIMA:
+                    break
+                taxa = (taxa - 1) / 2 if nova <= -1 else nova
+                if abs(passo) < 1e-9:
+                    return taxa
+        return np.nan
+
+    inicio = time.perf_counter()
+    referencia = {}
+    np.seterr(all='ignore')
+    for ativo, grupo in fluxos.groupby('Codigo_Ativo', sort=True):
+        dias = grupo['Data'].to_numpy(dtype='datetime64[ns]').astype(np.int64) / 86_400e9
+        referencia[ativo] = newton(grupo['Valor'].to_numpy(), (dias - dias.min()) / 365.0)
+    t_laco = time.perf_counter() - inicio
+
+    referencia = pd.Series(referencia)
+    diferenca = np.nanmax(np.abs(lote.reindex(referencia.index) - referencia))
+    print(f"{len(fluxos)} fluxos, {lote.size - 1} ativos (fluxos em {t_fluxos * 1000:.0f} ms)")
+    print(f"XIRR em lote {t_lote * 1000:.1f} ms | por ativo {t_laco * 1000:.0f} ms ({t_laco / t_lote:.0f}x) | "
+          f"diferença máxima {diferenca:.2e} | carteira {lote[CARTEIRA]:.2%} a.a.")
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+
+import numpy as np
+import pandas as pd
+
+DIAS_UTEIS_ANO = 252
+JANELA_VOLATILIDADE = 21  # ~1 mês de pregões
+# CDI anual (fração) para o Sharpe; ajuste com MMPG_CDI_ANUAL (ex.: 0.1490)
+CDI_ANUAL = float(os.environ.get('MMPG_CDI_ANUAL', '0.15'))
+# Série do benchmark (ex.: IFIX) em .csv ou .parquet com colunas de data e fechamento
+BENCHMARK_PATH = os.environ.get(
+    'MMPG_BENCHMARK_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ifix.csv')
+)
+COLUNAS_DATA = ['Data', 'Date', 'data', 'date']
+COLUNAS_FECHAMENTO = ['Fechamento', 'Close', 'Adj Close', 'Preço', 'Valor', 'close']
+COLUNAS_RISCO = ['Vol_21d_Pct', 'Vol_Anual_Pct', 'Max_Drawdown_Pct', 'Sharpe', 'Beta']
+
+
+def matriz_precos(df_longo, coluna_valor='Preço'):
+    """
+    Tabela longa (Codigo_Ativo, Data, valor) -> (precos, datas, tickers): matriz
+    (tickers x datas) com NaN onde o ativo não tem barra naquela data.
+    """
+    tabela = df_longo.pivot_table(index='Codigo_Ativo', columns='Data', values=coluna_valor, aggfunc='last', observed=True)
+    return tabela.to_numpy(dtype=np.float64), pd.DatetimeIndex(tabela.columns), tabela.index.tolist()
+
+
+def retornos_diarios(precos):
+    """Retornos simples entre barras consecutivas, (n, d) -> (n, d - 1); NaN onde falta preço."""
+    precos = np.asarray(precos, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return precos[:, 1:] / precos[:, :-1] - 1
+
+
+def _somas_moveis(valores, janela):
+    """Somas das últimas `janela` colunas de cada linha via soma acumulada (O(n·d), sem laço)."""
+    acumulado = np.concatenate([np.zeros((valores.shape[0], 1)), np.cumsum(valores, axis=1)], axis=1)
+    return acumulado[:, janela:] - acumulado[:, :-janela]
+
+
+def periodos_por_ano(datas):
+    """
+    Barras por ano da série com estas `datas` (ex.: ~250 para pregões, ~365
+    para dias corridos), para anualizar na periodicidade real da série.
+    Com menos de duas datas, assume pregões (DIAS_UTEIS_ANO).
+    """
+    datas = pd.DatetimeIndex(datas)
+    if len(datas) < 2 or datas[-1] <= datas[0]:
+        return float(DIAS_UTEIS_ANO)
+    return (len(datas) - 1) / ((datas[-1] - datas[0]).days / 365.25)
+
+
+def ultimos_anos(precos, datas, anos=1):
+    """Colunas da matriz (tickers x datas) nos últimos `anos` até a última data."""
+    datas = pd.DatetimeIndex(datas)
+    if len(datas) == 0:
+        return np.asarray(precos), datas
+    inicio = datas.searchsorted(datas[-1] - pd.DateOffset(years=anos))
+    return np.asarray(precos)[:, inicio:], datas[inicio:]
+
+
+def volatilidade_movel(retornos, janela=JANELA_VOLATILIDADE, anualizar=True, periodos_ano=DIAS_UTEIS_ANO):
+    """
+    Desvio padrão móvel (amostral) dos retornos em janelas de `janela` barras,
+    para todas as linhas de uma vez: (n, d) -> (n, d - janela + 1). Barras
+    ausentes não entram; janelas com menos de 2 retornos ficam NaN. A
+    anualização usa `periodos_ano` barras por ano.
+    """
+    validos = ~np.isnan(retornos)
+    r = np.where(validos, retornos, 0.0)
+    n = _somas_moveis(validos.astype(np.float64), janela)
+    s1 = _somas_moveis(r, janela)
+    s2 = _somas_moveis(r * r, janela)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variancia = (s2 - s1 * s1 / n) / (n - 1)
+    vol = np.sqrt(np.where(n >= 2, np.maximum(variancia, 0.0), np.nan))
+    return vol * np.sqrt(periodos_ano) if anualizar else vol
+
+
+def _media_desvio(retornos):
+    validos = ~np.isnan(retornos)
+    n = validos.sum(axis=1).astype(np.float64)
+    r = np.where(validos, retornos, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        media = r.sum(axis=1) / n
+        variancia = ((r * r).sum(axis=1) - n * media * media) / (n - 1)
+    return media, np.sqrt(np.where(n >= 2, np.maximum(variancia, 0.0), np.nan))
+
+
+def drawdown_maximo(precos):
+    """Maior queda a partir do pico anterior, por linha (fração negativa; 0 sem queda)."""
+    precos = np.asarray(precos, dtype=np.float64)
+    picos = np.fmax.accumulate(precos, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        quedas = np.where(np.isnan(precos), np.inf, precos / picos - 1)
+    resultado = np.min(quedas, axis=1, initial=np.inf)
+    return np.where(np.isinf(resultado), np.nan, resultado)
+
+
+def sharpe(retornos, cdi_anual=CDI_ANUAL, periodos_ano=DIAS_UTEIS_ANO):
+    """Índice de Sharpe anualizado dos retornos (`periodos_ano` barras por ano) contra o CDI, por linha."""
+    cdi_diario = (1 + cdi_anual) ** (1 / periodos_ano) - 1
+    media, desvio = _media_desvio(retornos)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(desvio > 0, (media - cdi_diario) / desvio * np.sqrt(periodos_ano), np.nan)
+
+
+def beta(retornos, retornos_benchmark):
+    """
+    Beta de cada linha contra o benchmark (vetor com as mesmas colunas),
+    usando só as datas em que ambos têm retorno. Resolvido com produtos de
+    matrizes, sem laço por ativo.
+    """
+    b = np.asarray(retornos_benchmark, dtype=np.float64)
+    validos = ~np.isnan(retornos) & ~np.isnan(b)
+    m = validos.astype(np.float64)
+    r = np.where(validos, retornos, 0.0)
+    b0 = np.nan_to_num(b)
+    n = m.sum(axis=1)
+    soma_r = r.sum(axis=1)
+    soma_b = m @ b0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariancia = (r @ b0 - soma_r * soma_b / n) / (n - 1)
+        variancia_b = (m @ (b0 * b0) - soma_b * soma_b / n) / (n - 1)
+        return np.where((n >= 2) & (variancia_b > 0), covariancia / variancia_b, np.nan)
+
+
+def versao_arquivo(caminho=None):
+    """mtime do arquivo do benchmark (None se não existe), para chavear caches."""
+    caminho = caminho or BENCHMARK_PATH
+    return os.path.getmtime(caminho) if os.path.exists(caminho) else None
+
+
+def carregar_benchmark(caminho=None):
+    """
+    Série de fechamento do benchmark indexada por data, lida de um .csv ou
+    .parquet local. Retorna None se o arquivo não existe.
+    """
+    caminho = caminho or BENCHMARK_PATH
+    if not os.path.exists(caminho):
+        return None
+    df = pd.read_parquet(caminho) if caminho.endswith('.parquet') else pd.read_csv(caminho)
+    coluna_data = next((c for c in COLUNAS_DATA if c in df.columns), df.columns[0])
+    coluna_valor = next(
+        (c for c in COLUNAS_FECHAMENTO if c in df.columns),
+        df.drop(columns=coluna_data).select_dtypes('number').columns[-1]
+    )
+    serie = pd.Series(df[coluna_valor].to_numpy(dtype=np.float64), index=pd.to_datetime(df[coluna_data], dayfirst=False))
+    return serie[~serie.index.duplicated(keep='last')].sort_index()
+
+
+def alinhar_benchmark(serie, datas):
+    """Fechamentos do benchmark nas `datas` da matriz (último fechamento conhecido em cada data)."""
+    return serie.reindex(serie.index.union(datas)).ffill().reindex(datas).to_numpy(dtype=np.float64)
+
+
+def metricas_risco(precos, datas, tickers, benchmark=None, cdi_anual=CDI_ANUAL, janela=JANELA_VOLATILIDADE,
+                   anos=1, periodos_ano=None):
+    """
+    Métricas de risco de todos os ativos a partir da matriz de preços
+    (tickers x datas), nos últimos `anos` da matriz (None: matriz inteira):
+    volatilidade anualizada da última janela e do período, drawdown máximo,
+    Sharpe contra o CDI e beta contra `benchmark` (Series de fechamentos por
+    data; None deixa o beta em NaN). A anualização usa `periodos_ano`
+    barras por ano, por padrão a periodicidade das próprias `datas`.
+    Retorna um DataFrame indexado por ticker com COLUNAS_RISCO (NaN com
+    menos de duas datas, ex.: sem barras guardadas).
+    """
+    precos = np.asarray(precos, dtype=np.float64)
+    datas = pd.DatetimeIndex(datas)
+    if len(datas) < 2:
+        return pd.DataFrame(np.nan, index=pd.Index(tickers, name='Codigo_Ativo'), columns=COLUNAS_RISCO)
+    if periodos_ano is None:
+        periodos_ano = periodos_por_ano(datas)
+    if anos is not None:
+        precos, datas = ultimos_anos(precos, datas, anos)
+    retornos = retornos_diarios(precos)
+    if retornos.shape[1] >= janela:
+        vol_movel = volatilidade_movel(retornos, janela, periodos_ano=periodos_ano)
+    else:
+        vol_movel = np.full((len(tickers), 1), np.nan)
+    _, desvio = _media_desvio(retornos)
+    if benchmark is not None:
+        betas = beta(retornos, retornos_diarios(alinhar_benchmark(benchmark, datas)[np.newaxis, :])[0])
+    else:
+        betas = np.full(len(tickers), np.nan)
+    return pd.DataFrame({
+        'Vol_21d_Pct': vol_movel[:, -1] * 100,
+        'Vol_Anual_Pct': desvio * np.sqrt(periodos_ano) * 100,
+        'Max_Drawdown_Pct': drawdown_maximo(precos) * 100,
+        'Sharpe': sharpe(retornos, cdi_anual, periodos_ano),
+        'Beta': betas,
+    }, index=pd.Index(tickers, name='Codigo_Ativo'))
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Métricas de risco vetorizadas vs. cálculo por ativo com pandas.")
+    parser.add_argument('--ativos', type=int, default=500)
+    parser.add_argument('--dias', type=int, default=2520, help="Pregões (2520 = 10 anos)")
+    parser.add_argument('--benchmark', default=None, help=f"Arquivo do benchmark (padrão: {BENCHMARK_PATH})")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    datas = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=args.dias)
+    mercado = rng.normal(0.0003, 0.01, args.dias)
+    sensibilidade = rng.uniform(0.3, 1.5, (args.ativos, 1))
+    retornos = sensibilidade * mercado + rng.normal(0, 0.01, (args.ativos, args.dias))
+    precos = 100 * np.cumprod(1 + retornos, axis=1)
+    precos[rng.random(precos.shape) < 0.01] = np.nan  # Barras faltando
+    tickers = [f'SIM{i:04d}11' for i in range(args.ativos)]
+    benchmark = carregar_benchmark(args.benchmark) if args.benchmark else pd.Series(1000 * np.cumprod(1 + mercado), index=datas)
+
+    inicio = time.perf_counter()
+    risco = metricas_risco(precos, datas, tickers, benchmark, anos=None, periodos_ano=DIAS_UTEIS_ANO)
+    t_matriz = time.perf_counter() - inicio
+
+    # Referência: pandas, um ativo por vez
+    inicio = time.perf_counter()
+    ret_bench = benchmark.reindex(datas).ffill().pct_change()
+    referencia = {}
+    for i, ticker in enumerate(tickers):
+        serie = pd.Series(precos[i], index=datas)
+        ret = serie / serie.shift(1) - 1
+        par = pd.concat([ret, ret_bench], axis=1).dropna()
+        referencia[ticker] = {
+            'Vol_21d_Pct': ret.rolling(JANELA_VOLATILIDADE, min_periods=2).std().iloc[-1] * np.sqrt(DIAS_UTEIS_ANO) * 100,
+            'Max_Drawdown_Pct': (serie / serie.cummax() - 1).min() * 100,
+            'Beta': par.iloc[:, 0].cov(par.iloc[:, 1]) / par.iloc[:, 1].var(),
+        }
+    t_loop = time.perf_counter() - inicio
+    referencia = pd.DataFrame.from_dict(referencia, orient='index')
+
+    for coluna in referencia.columns:
+        diferenca = np.nanmax(np.abs(risco[coluna].to_numpy() - referencia[coluna].to_numpy()))
+        print(f"{coluna:>17}: diferença máxima para o pandas {diferenca:.2e}")
+    print(risco.describe().T[['mean', 'min', 'max']])
+    print(f"{args.ativos} ativos x {args.dias} dias: matriz {t_matriz * 1000:.1f} ms, por ativo {t_loop * 1000:.0f} ms "
+          f"({t_loop / t_matriz:.0f}x)")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Dividendos simulados (FIIs): a cada 60 dias, a partir do dia 30
+INICIO_DIVIDENDOS = 30
+INTERVALO_DIVIDENDOS = 60
+
+# Caminhos normalizados (preço atual = 1) por (ticker, dias, volatilidade)
+MAX_CAMINHOS = 20_000
+_caminhos = OrderedDict()
+_caminhos_lock = threading.Lock()
+
+
+def semente_ticker(ticker):
+    """Semente estável entre execuções (hash() de str muda a cada interpretador)."""
+    return zlib.crc32(ticker.encode('utf-8'))
+
+
+def _gerar_caminhos(tickers, volatilidade, dias):
+    """
+    Gera de uma vez os caminhos de vários tickers como matrizes (n, dias):
+    preço relativo ao preço atual e dividendo relativo ao preço atual.
+    Cada ticker tem seu próprio gerador, então o caminho não depende do lote.
+    """
+    n = len(tickers)
+    retornos = np.empty((n, dias))
+    dias_dividendo = np.arange(INICIO_DIVIDENDOS, dias, INTERVALO_DIVIDENDOS)
+    taxas_dividendo = np.zeros((n, len(dias_dividendo)))
+    for i, ticker in enumerate(tickers):
+        rng = np.random.default_rng(semente_ticker(ticker))
+        tendencia = rng.choice([-0.1, 0.1])  # Tendência de alta ou baixa
+        retornos[i] = rng.normal(tendencia / dias, volatilidade, dias)
+        if 'FII' in ticker.upper():
+            taxas_dividendo[i] = rng.uniform(0.005, 0.01, len(dias_dividendo))  # 0.5% a 1% do preço
+
+    # Movimento browniano geométrico de trás para frente a partir do preço atual:
+    # preco[k] = preco_atual * prod(1 - retorno[j]) para j em [k, dias - 2]
+    precos = np.ones((n, dias))
+    if dias > 1:
+        precos[:, :-1] = np.cumprod((1 - retornos[:, -2::-1]), axis=1)[:, ::-1]
+
+    dividendos = np.zeros((n, dias))
+    dividendos[:, dias_dividendo] = precos[:, dias_dividendo] * taxas_dividendo
+    return precos, dividendos
+
+
+def caminhos_normalizados(tickers, volatilidade=0.02, dias=365):
+    """Retorna (precos, dividendos) normalizados (n, dias), gerando só os ausentes do cache."""
+    chaves = [(ticker, dias, volatilidade) for ticker in tickers]
+    with _caminhos_lock:
+        encontrados = {chave: _caminhos[chave] for chave in chaves if chave in _caminhos}
+        for chave in encontrados:
+            _caminhos.move_to_end(chave)
+    faltantes = list(dict.fromkeys(chave[0] for chave in chaves if chave not in encontrados))
+    if faltantes:
+        precos, dividendos = _gerar_caminhos(faltantes, volatilidade, dias)
+        novos = {(ticker, dias, volatilidade): (precos[i], dividendos[i]) for i, ticker in enumerate(faltantes)}
+        encontrados.update(novos)
+        with _caminhos_lock:
+            _caminhos.update(novos)
+            while len(_caminhos) > MAX_CAMINHOS:
+                _caminhos.popitem(last=False)
+    if not chaves:
+        return np.empty((0, dias)), np.empty((0, dias))
+    return (
+        np.stack([encontrados[chave][0] for chave in chaves]),
+        np.stack([encontrados[chave][1] for chave in chaves]),
+    )
+
+
+def datas_simuladas(dias, hoje=None):
+    """Os `dias` dias anteriores a hoje, em ordem cronológica."""
+    hoje = pd.Timestamp(hoje if hoje is not None else pd.Timestamp.now()).normalize()
+    return pd.date_range(end=hoje - pd.Timedelta(days=1), periods=dias, freq='D')
+
+
+def gerar_historicos_simulados(tickers, precos_atuais, volatilidade=0.02, dias=365, hoje=None):
+    """
+    Gera históricos simulados de vários tickers em formato longo
+    (Codigo_Ativo, Data, Preço, Dividendos), terminando em `precos_atuais`.
+    """
+    tickers = list(tickers)
+    precos, dividendos = caminhos_normalizados(tickers, volatilidade, dias)
+    escala = np.asarray(precos_atuais, dtype='float64').reshape(-1, 1)
+    return pd.DataFrame({
+        'Codigo_Ativo': np.repeat(np.asarray(tickers, dtype=object), dias),
+        'Data': np.tile(datas_simuladas(dias, hoje).to_numpy(), len(tickers)),
+        'Preço': (precos * escala).ravel(),
+        'Dividendos': (dividendos * escala).ravel(),
+    })
+
+
+def gerar_dados_historicos_simulados(ticker, preco_atual, volatilidade=0.02, dias=365, hoje=None):
+    """Gera dados históricos simulados para um ticker."""
+    precos, dividendos = caminhos_normalizados([ticker], volatilidade, dias)
+    return pd.DataFrame({
+        'Data': datas_simuladas(dias, hoje),
+        'Preço': precos[0] * preco_atual,
+        'Dividendos': dividendos[0] * preco_atual,
+    })
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Benchmark do gerador de históricos simulados.")
+    parser.add_argument('--tickers', type=int, default=5000)
+    parser.add_argument('--dias', type=int, default=365)
+    args = parser.parse_args()
+
+    tickers = [f'SIM{i:05d}11' for i in range(args.tickers)]
+    precos_atuais = np.full(len(tickers), 100.0)
+    for rodada in ('frio', 'cache'):
+        inicio = time.perf_counter()
+        df = gerar_historicos_simulados(tickers, precos_atuais, dias=args.dias)
+        print(f"{rodada:>5}: {len(tickers)} tickers x {args.dias} dias = {len(df)} linhas em {time.perf_counter() - inicio:.3f}s")
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import hashlib
+import os
+import pickle
+import threading
+
+import pandas as pd
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.adapters import HTTPAdapter
+
+from market_cache import CACHE_DIR
+from upstream import UpstreamError, get_upstream
+
+FII_URL = "https://statusinvest.com.br/fundos-imobiliarios/{ticker}"
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+# lxml is several times faster than the pure-Python html.parser backend
+try:
+    import lxml  # noqa: F401
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+# Only the dividend table is parsed, the rest of the page is skipped
+EARNINGS_TABLE = SoupStrainer("table", attrs={"id": "earning-section"})
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size=32):
+    """Returns the shared keep-alive session. Pacing, retries and backoff are done by upstream."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def parse_dividends(html):
+    """Parses the statusinvest earnings table into a Date/Dividend DataFrame (may be empty)."""
+    soup = BeautifulSoup(html, PARSER, parse_only=EARNINGS_TABLE)
+    dividends = []
+    table = soup.find("table", {"id": "earning-section"})
+    if table:
+        rows = table.find_all("tr")[1:]  # Skip header
+        for row in rows:
+            cols = row.find_all("td")
+            if len(cols) >= 2:
+                date_str = cols[0].text.strip()
+                value_str = cols[1].text.strip().replace("R$", "").replace(",", ".")
+                try:
+                    date = pd.to_datetime(date_str, format="%d/%m/%Y")
+                    value = float(value_str)
+                    dividends.append({"Date": date, "Dividend": value})
+                except ValueError:
+                    continue
+    df = pd.DataFrame(dividends, columns=["Date", "Dividend"])
+    return df.sort_values("Date").reset_index(drop=True)
+
+
+class PageCache:
+    """Parsed dividend tables plus ETag/Last-Modified validators, keyed by URL.
+
+    Kept in memory and mirrored to disk so nightly runs can send conditional
+    requests for pages scraped by earlier processes.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(CACHE_DIR, "statusinvest")
+        self._entries = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, url):
+        return os.path.join(self.root, hashlib.sha1(url.encode()).hexdigest() + ".pkl")
+
+    def get(self, url):
+        with self._lock:
+            if url in self._entries:
+                return self._entries[url]
+        try:
+            with open(self._path(url), "rb") as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        with self._lock:
+            self._entries[url] = entry
+        return entry
+
+    def put(self, url, entry):
+        with self._lock:
+            self._entries[url] = entry
+        tmp_path = self._path(url) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(entry, f)
+        os.replace(tmp_path, self._path(url))
+
+
+_page_cache = None
+
+
+def get_page_cache():
+    global _page_cache
+    with _session_lock:
+        if _page_cache is None:
+            _page_cache = PageCache()
+        return _page_cache
+
+
+def fetch_page(url, session=None, cache=None, timeout=30):
+    """Downloads a page with a conditional GET. Returns (html or None, cache entry or None).
+
+    html is None when the server answered 304 and the cached entry is still
+    valid, or when the site is throttling/down (after upstream's retries, or
+    at once while its circuit is open) and a cached entry exists.
+    """
+    session = session or get_session()
+    cache = cache or get_page_cache()
+    entry = cache.get(url)
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    try:
+        response = get_upstream().get(url, session=session, headers=headers, timeout=timeout)
+    except (UpstreamError, requests.ConnectionError, requests.Timeout):
+        if entry:
+            return None, entry
+        raise
+    if response.status_code == 304 and entry:
+        return None, entry
+    response.raise_for_status()
+    return response.text, {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+
+
+def fetch_dividends(ticker_symbol, session=None, cache=None):
+    """Returns the dividend history for a FII as a Date/Dividend DataFrame, or None if empty."""
+    cache = cache or get_page_cache()
+    url = FII_URL.format(ticker=ticker_symbol.lower())
+    html, entry = fetch_page(url, session=session, cache=cache)
+    if html is not None:
+        entry["dividends"] = parse_dividends(html)
+        cache.put(url, entry)
+    df = entry["dividends"]
+    return df if not df.empty else None
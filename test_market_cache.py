@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# MarketDataCache against a temporary SQLite file
+
+import pytest
+
+from market_cache import MarketDataCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return MarketDataCache(str(tmp_path / 'market_data.sqlite'))
+
+
+def test_new_record_replaces_the_stored_one(cache):
+    cache.put('XPLG11', {'Preco_Atual': 100.0, 'DY_12M_Pct': 9.5})
+    cache.put('XPLG11', {'Preco_Atual': 101.0})  # DY no longer reported
+    record, stale = cache.get('XPLG11')
+    assert record == {'Preco_Atual': 101.0}
+    assert not stale
+
+
+def test_records_with_errors_keep_the_last_good_value(cache):
+    cache.put('XPLG11', {'Preco_Atual': 100.0, 'DY_12M_Pct': 9.5})
+    cache.put('XPLG11', {'Preco_Atual': None, 'Erro': 'HTTP 503'})
+    assert cache.get('XPLG11')[0] == {'Preco_Atual': 100.0, 'DY_12M_Pct': 9.5}
+
+
+def test_other_tickers_are_untouched(cache):
+    cache.put_many({'XPLG11': {'Preco_Atual': 100.0}, 'HGLG11': {'Preco_Atual': 160.0, 'P_VP': 0.9}})
+    cache.put('XPLG11', {'Preco_Atual': 99.0})
+    assert cache.get('HGLG11')[0] == {'Preco_Atual': 160.0, 'P_VP': 0.9}
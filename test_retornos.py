@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# TWR e XIRR sobre a matriz de preços, incluindo a matriz vazia de um PriceStore sem barras
+
+import numpy as np
+import pandas as pd
+
+from retornos import metricas_retorno, twr_diario
+
+HISTORICO = pd.DataFrame({
+    'Codigo_Ativo': ['A', 'A'],
+    'Data_Compra': pd.to_datetime(['2026-01-02', '2026-01-06']),
+    'Quantidade': [10, 10],
+    'Preco_Compra_Unitario': [10.0, 5.0],
+})
+
+
+def test_twr_sem_datas_da_matrizes_vazias():
+    por_ativo, carteira = twr_diario(HISTORICO, np.full((1, 0), np.nan), pd.DatetimeIndex([]), ['A'])
+    assert por_ativo.shape == (1, 0)
+    assert carteira.shape == (0,)
+
+
+def test_metricas_sem_datas_deixam_twr_nan():
+    df_precos = pd.DataFrame({'Preco_Atual': [12.0]}, index=['A'])
+    por_ativo, carteira, acumulado = metricas_retorno(
+        HISTORICO, df_precos, np.full((1, 0), np.nan), pd.DatetimeIndex([]), ['A'], hoje=pd.Timestamp('2026-10-16')
+    )
+    assert np.isnan(por_ativo.loc['A', 'TWR_Pct'])
+    assert np.isnan(carteira['TWR_Pct'])
+    assert acumulado.empty
+    assert np.isfinite(carteira['XIRR_Anual_Pct'])
+
+
+def test_aportes_a_mercado_ignoram_o_preco_da_operacao():
+    datas = pd.bdate_range('2026-01-02', periods=5)
+    precos = np.full((1, 5), 10.0)
+    _, pelo_negocio = twr_diario(HISTORICO, precos, datas, ['A'])
+    _, a_mercado = twr_diario(HISTORICO, precos, datas, ['A'], aportes_a_mercado=True)
+    assert np.prod(1 + pelo_negocio) - 1 == 0.5  # Compra a 5 marcada a 10
+    assert np.prod(1 + a_mercado) - 1 == 0
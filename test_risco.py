@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Métricas de risco sobre a matriz de preços, incluindo a matriz vazia de um PriceStore sem barras
+
+import numpy as np
+import pandas as pd
+
+from risco import COLUNAS_RISCO, drawdown_maximo, metricas_risco
+
+
+def test_matriz_vazia_da_metricas_nan():
+    risco = metricas_risco(np.full((2, 0), np.nan), pd.DatetimeIndex([]), ['A', 'B'])
+    assert list(risco.index) == ['A', 'B']
+    assert list(risco.columns) == COLUNAS_RISCO
+    assert risco.isna().all().all()
+
+
+def test_uma_data_so_da_metricas_nan():
+    risco = metricas_risco(np.array([[10.0], [20.0]]), pd.DatetimeIndex(['2026-10-16']), ['A', 'B'])
+    assert risco.isna().all().all()
+
+
+def test_drawdown_sem_colunas_e_nan():
+    assert np.isnan(drawdown_maximo(np.full((3, 0), np.nan))).all()
+
+
+def test_metricas_do_ultimo_ano():
+    datas = pd.bdate_range(end='2026-10-16', periods=600)
+    precos = np.vstack([np.linspace(10, 20, 600), np.full(600, 5.0)])
+    precos[0, 100] = 1.0  # Queda fora do último ano: não entra no drawdown
+    risco = metricas_risco(precos, datas, ['A', 'B'])
+    assert risco.loc['A', 'Max_Drawdown_Pct'] == 0
+    assert risco.loc['B', 'Vol_Anual_Pct'] == 0
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Upstream (token bucket, Retry-After, circuit breaker, metrics) against a local stub HTTP server
+
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from fetch_api_data import fetch_ticker_data
+from upstream import YAHOO_HOST, CircuitOpen, Upstream, UpstreamError
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers the next scripted (status, headers), or 200 once the script is over; 503 for all while down."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits.append(time.monotonic())
+            if server.down:
+                status, headers = 503, {}
+            else:
+                status, headers = server.script.popleft() if server.script else (200, {})
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.script = deque()
+    server.down = False
+    server.hits = []
+    server.lock = threading.Lock()
+    server.host = f'127.0.0.1:{server.server_address[1]}'
+    server.url = f'http://{server.host}/quote'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def session():
+    with requests.Session() as session:
+        yield session
+
+
+def test_calls_are_paced_per_host(stub, session):
+    upstream = Upstream({stub.host: (20.0, 1)})
+    started = time.monotonic()
+    for _ in range(6):
+        assert upstream.get(stub.url, session=session, timeout=5).status_code == 200
+    # Burst of 1 at 20/s: the 5 calls after the first wait 50 ms each
+    assert time.monotonic() - started >= 5 / 20 * 0.9
+    assert stub.hits[-1] - stub.hits[0] >= 5 / 20 * 0.9
+
+    # The same server under another host name has its own bucket: no wait although 127.0.0.1's is empty
+    other_url = stub.url.replace('127.0.0.1', 'localhost')
+    started = time.monotonic()
+    assert upstream.get(other_url, session=session, timeout=5).status_code == 200
+    assert time.monotonic() - started < 1 / 20
+    assert set(upstream.metrics()) == {stub.host, stub.host.replace('127.0.0.1', 'localhost')}
+
+
+def test_retry_after_is_honoured(stub, session):
+    stub.script.append((429, {'Retry-After': '1'}))
+    upstream = Upstream({stub.host: (100.0, 10)}, backoff=0.01)
+    started = time.monotonic()
+    assert upstream.get(stub.url, session=session, timeout=5).status_code == 200
+    assert time.monotonic() - started >= 0.95
+    assert stub.hits[1] - stub.hits[0] >= 0.95
+
+    metrics = upstream.metrics()[stub.host]
+    assert (metrics['requests'], metrics['errors'], metrics['throttled'], metrics['retries']) == (2, 1, 1, 1)
+    assert metrics['state'] == 'closed'
+
+
+def test_breaker_opens_after_failures_and_rejects(stub, session):
+    stub.down = True
+    upstream = Upstream({stub.host: (1000.0, 100)}, max_retries=0, failure_threshold=3, reset_timeout=30.0)
+    for _ in range(3):
+        with pytest.raises(UpstreamError) as error:
+            upstream.get(stub.url, session=session, timeout=5)
+        assert error.value.status == 503
+    assert upstream.metrics()[stub.host]['state'] == 'open'
+
+    with pytest.raises(CircuitOpen):
+        upstream.get(stub.url, session=session, timeout=5)
+    assert len(stub.hits) == 3  # Rejected without calling the host
+    assert upstream.metrics()[stub.host]['rejected'] == 1
+
+
+def test_half_open_probe_closes_the_breaker(stub, session):
+    stub.down = True
+    upstream = Upstream({stub.host: (1000.0, 100)}, max_retries=0, failure_threshold=2, reset_timeout=0.2)
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            upstream.get(stub.url, session=session, timeout=5)
+    assert upstream.metrics()[stub.host]['state'] == 'open'
+
+    stub.down = False
+    time.sleep(0.25)
+    assert upstream.metrics()[stub.host]['state'] == 'half_open'
+    assert upstream.get(stub.url, session=session, timeout=5).status_code == 200
+    assert upstream.metrics()[stub.host]['state'] == 'closed'
+
+
+def test_failed_probe_reopens_the_breaker(stub, session):
+    stub.down = True
+    upstream = Upstream({stub.host: (1000.0, 100)}, max_retries=0, failure_threshold=2, reset_timeout=0.2)
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            upstream.get(stub.url, session=session, timeout=5)
+    time.sleep(0.25)
+    with pytest.raises(UpstreamError):
+        upstream.get(stub.url, session=session, timeout=5)
+    assert upstream.metrics()[stub.host]['state'] == 'open'
+
+
+def test_metrics_count_each_outcome(stub, session):
+    stub.script.extend([(503, {}), (404, {})])
+    upstream = Upstream({stub.host: (1000.0, 100)}, backoff=0.01)
+    assert upstream.get(stub.url, session=session, timeout=5).status_code == 404  # Retried after the 503
+    assert upstream.get(stub.url, session=session, timeout=5).status_code == 200
+
+    metrics = upstream.metrics()[stub.host]
+    assert metrics['requests'] == 3
+    assert metrics['errors'] == 1
+    assert metrics['throttled'] == 0
+    assert metrics['retries'] == 1
+    assert metrics['rejected'] == 0
+    assert metrics['error_rate'] == pytest.approx(1 / 3)
+    assert metrics['p50_ms'] is not None and metrics['p95_ms'] >= metrics['p50_ms']
+
+
+class FailingApiClient:
+    """ApiClient stand-in that raises like the real one on HTTP errors."""
+
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def call_api(self, api_name, query=None):
+        self.calls += 1
+        raise self.error
+
+
+def test_yahoo_http_errors_back_off_and_open_the_breaker():
+    client = FailingApiClient(Exception("HTTP Error 429: Too Many Requests"))
+    upstream = Upstream({YAHOO_HOST: (1000.0, 100)}, max_retries=1, backoff=0.01, failure_threshold=2)
+    _, record = fetch_ticker_data('XPLG11.SA', client, upstream)
+    assert record['Erro']
+
+    metrics = upstream.metrics()[YAHOO_HOST]
+    assert client.calls == 2
+    assert (metrics['retries'], metrics['throttled'], metrics['state']) == (1, 2, 'open')
+
+    _, record = fetch_ticker_data('XPLG11.SA', client, upstream)
+    assert 'circuit open' in record['Erro']
+    assert client.calls == 2
+
+
+def test_unknown_errors_do_not_reset_the_breaker():
+    upstream = Upstream({YAHOO_HOST: (1000.0, 100)}, max_retries=0, failure_threshold=2)
+    fetch_ticker_data('XPLG11.SA', FailingApiClient(Exception("HTTP Error 503: Service Unavailable")), upstream)
+    fetch_ticker_data('XPLG11.SA', FailingApiClient(KeyError('meta')), upstream)
+    assert upstream.host(YAHOO_HOST).breaker.failures == 1
+    fetch_ticker_data('XPLG11.SA', FailingApiClient(Exception("HTTP Error 503: Service Unavailable")), upstream)
+    assert upstream.metrics()[YAHOO_HOST]['state'] == 'open'
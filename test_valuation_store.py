@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# ValuationStore: daily appends must match a full rebuild, including days without a close
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from valuation_store import ValuationStore, value_history
+
+HOLIDAY = pd.Timestamp('2026-10-12')  # B3 closed: no bar that day
+
+HISTORY = pd.DataFrame({
+    'Codigo_Ativo': ['A', 'B'],
+    'Data_Compra': pd.to_datetime(['2026-10-01', '2026-10-05']),
+    'Quantidade': [10, 4],
+    'Preco_Compra_Unitario': [10.0, 50.0],
+})
+DIVIDENDS = pd.DataFrame({'Codigo_Ativo': ['A'], 'Data': pd.to_datetime(['2026-10-08']), 'Valor': [0.5]})
+
+
+def loader(tickers, dates):
+    """Close of 20 for A and 40 for B on every business day except the holiday."""
+    closes = np.tile(np.array([[20.0], [40.0]])[:len(tickers)], (1, len(dates)))
+    closes[:, pd.DatetimeIndex(dates) == HOLIDAY] = np.nan
+    return closes
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ValuationStore(str(tmp_path / 'valuation.sqlite'))
+
+
+def test_append_across_a_day_without_close_matches_a_rebuild(store, tmp_path):
+    assert store.update(HISTORY, loader, DIVIDENDS, today=HOLIDAY)['Valor_Mercado'].iloc[-1] == 360.0
+    appended = store.update(HISTORY, loader, DIVIDENDS, today=HOLIDAY + pd.offsets.BDay(1))
+    assert store.days_computed == 2  # Only the last stored day and the new one
+
+    fresh = ValuationStore(str(tmp_path / 'fresh.sqlite')).update(
+        HISTORY, loader, DIVIDENDS, today=HOLIDAY + pd.offsets.BDay(1)
+    )
+    pd.testing.assert_frame_equal(appended, fresh)
+    in_memory = value_history(HISTORY, loader, DIVIDENDS, today=HOLIDAY + pd.offsets.BDay(1))
+    pd.testing.assert_frame_equal(appended, in_memory, check_freq=False)
+    assert appended.loc[HOLIDAY, 'Valor_Mercado'] == 360.0  # Last close carried, not the trade price
+
+
+def test_backdated_dividend_recomputes_from_its_day(store):
+    store.update(HISTORY, loader, DIVIDENDS, today='2026-10-16')
+    backdated = pd.concat([DIVIDENDS, pd.DataFrame({
+        'Codigo_Ativo': ['B'], 'Data': pd.to_datetime(['2026-10-14']), 'Valor': [1.0]
+    })], ignore_index=True)
+    series = store.update(HISTORY, loader, backdated, today='2026-10-16')
+    assert store.days_computed == 3
+    assert series['Proventos_Acumulados'].iloc[-1] == 10 * 0.5 + 4 * 1.0
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+
+# Statuses that mean "slow down or try later"; other 4xx are final answers
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+YAHOO_HOST = 'YahooFinance'  # Calls go through ApiClient, not a URL
+STATUSINVEST_HOST = 'statusinvest.com.br'
+
+# (requests per second, burst) per host; other hosts use DEFAULT_LIMIT
+HOST_LIMITS = {
+    YAHOO_HOST: (10.0, 1),
+    STATUSINVEST_HOST: (5.0, 10),
+}
+DEFAULT_LIMIT = (5.0, 5)
+
+
+class UpstreamError(Exception):
+    """An upstream call that failed with a throttling/server status."""
+
+    def __init__(self, host, status=None, message=None, retry_after=None):
+        self.host = host
+        self.status = status
+        self.retry_after = retry_after
+        super().__init__(message or f"{host} answered {status}")
+
+
+class CircuitOpen(UpstreamError):
+    """Raised without calling the host while its circuit breaker is open."""
+
+    def __init__(self, host, retry_in):
+        super().__init__(host, message=f"{host} unavailable (circuit open, retry in {retry_in:.0f}s)", retry_after=retry_in)
+
+
+class RateLimiter:
+    """Token bucket shared by all worker threads, replacing the fixed per-ticker sleep.
+
+    pause(seconds) empties the bucket until then, so one throttled response
+    slows every thread calling the same host.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = float(max(burst, 1))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """Takes a token if available. Returns 0 on success or the seconds to wait. Lock held."""
+        now = time.monotonic()
+        if now < self._paused_until:
+            self._last = now
+            return self._paused_until - now
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def try_acquire(self):
+        """Takes a request slot without blocking. Returns True if one was available."""
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            return self._take() == 0
+
+    def acquire(self):
+        """Blocks until a request slot is available."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and fails fast for
+    `reset_timeout` seconds; then lets a single probe through (half-open) and
+    closes on its success or opens again on its failure.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._probing or time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def retry_in(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release(self):
+        """Ends a half-open probe whose outcome says nothing about the host; the next call probes again."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class HostMetrics:
+    """Request counts and recent latencies for one host."""
+
+    def __init__(self, window=1000):
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.retries = 0
+        self.rejected = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, error=False, throttled=False):
+        with self._lock:
+            self.requests += 1
+            self.errors += bool(error)
+            self.throttled += bool(throttled)
+            self._latencies.append(seconds)
+
+    def count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            snapshot = {
+                'requests': self.requests,
+                'errors': self.errors,
+                'throttled': self.throttled,
+                'retries': self.retries,
+                'rejected': self.rejected,
+                'error_rate': self.errors / self.requests if self.requests else 0.0,
+            }
+        for name, q in (('p50_ms', 0.5), ('p95_ms', 0.95)):
+            snapshot[name] = latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else None
+        return snapshot
+
+
+class _Host:
+    def __init__(self, limit, failure_threshold, reset_timeout):
+        self.limiter = RateLimiter(*limit)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.metrics = HostMetrics()
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    if isinstance(error, CircuitOpen):
+        return False
+    if isinstance(error, UpstreamError):
+        return error.status in RETRY_STATUSES
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError))
+
+
+class Upstream:
+    """Guards calls to external services, one token bucket, circuit breaker
+    and metrics set per host.
+
+    call(host, fn) waits for a token, runs fn and, on a throttling/server
+    error (UpstreamError with a RETRY_STATUSES status, connection errors and
+    timeouts), pauses the whole host for Retry-After or an exponential backoff
+    with jitter and retries up to `max_retries` times. Those failures count
+    towards the host's circuit breaker; while it is open calls raise
+    CircuitOpen at once so callers can serve cached values. Any other
+    UpstreamError (e.g. 404) means the host answered and counts as a success;
+    other exceptions leave the breaker as it was.
+    """
+
+    def __init__(self, limits=None, default_limit=DEFAULT_LIMIT, max_retries=3, backoff=0.5, max_backoff=30.0,
+                 failure_threshold=5, reset_timeout=30.0):
+        self.limits = dict(HOST_LIMITS if limits is None else limits)
+        self.default_limit = default_limit
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def host(self, host):
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = _Host(self.limits.get(host, self.default_limit), self.failure_threshold, self.reset_timeout)
+            return self._hosts[host]
+
+    def call(self, host, fn, *args, **kwargs):
+        guard = self.host(host)
+        attempt = 0
+        while True:
+            if not guard.breaker.allow():
+                guard.metrics.count('rejected')
+                raise CircuitOpen(host, guard.breaker.retry_in())
+            guard.limiter.acquire()
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                retryable = is_retryable(e)
+                guard.metrics.record(time.perf_counter() - started, error=True,
+                                     throttled=getattr(e, 'status', None) == 429)
+                if not retryable:
+                    if isinstance(e, UpstreamError) and not isinstance(e, CircuitOpen):
+                        # The host answered (e.g. 404): not a reason to open the circuit
+                        guard.breaker.record_success()
+                    else:
+                        # Unknown failure (bad payload, bug in fn): neither a success nor a host failure
+                        guard.breaker.release()
+                    raise
+                guard.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                delay = getattr(e, 'retry_after', None)
+                if delay is None:
+                    delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                guard.limiter.pause(delay)
+                guard.metrics.count('retries')
+                attempt += 1
+                continue
+            guard.metrics.record(time.perf_counter() - started)
+            guard.breaker.record_success()
+            return result
+
+    def get(self, url, session=None, **kwargs):
+        """GET through call(); 429/5xx responses raise UpstreamError after the retries."""
+        host = urlsplit(url).netloc
+        session = session or requests
+
+        def request():
+            response = session.get(url, **kwargs)
+            if response.status_code in RETRY_STATUSES:
+                raise UpstreamError(host, response.status_code,
+                                    retry_after=parse_retry_after(response.headers.get('Retry-After')))
+            return response
+
+        return self.call(host, request)
+
+    def metrics(self):
+        """{host: counters, error rate, p50/p95 latency and breaker state}."""
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {host: {**guard.metrics.snapshot(), 'state': guard.breaker.state} for host, guard in hosts.items()}
+
+
+_upstream = None
+_upstream_lock = threading.Lock()
+
+
+def get_upstream():
+    """Returns the process-wide Upstream shared by all fetchers."""
+    global _upstream
+    with _upstream_lock:
+        if _upstream is None:
+            _upstream = Upstream()
+        return _upstream
+
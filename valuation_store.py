@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import hashlib
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from ledger import normalizar_operacoes
+from ledger_store import KEY_COLUMNS
+from market_cache import CACHE_DIR
+from price_store import daily_closes
+
+# Derived from a saved ledger and real prices, so it lives with the caches: one file per
+# portfolio (override the directory with MMPG_VALUATION_DIR)
+VALUATION_DIR = os.environ.get('MMPG_VALUATION_DIR', os.path.join(CACHE_DIR, 'valuation'))
+
+VALUATION_COLUMNS = ['Valor_Mercado', 'Capital_Aplicado', 'Proventos', 'Proventos_Acumulados']
+DIVIDEND_COLUMNS = ['Codigo_Ativo', 'Data', 'Valor']
+
+
+def valuation_path(portfolio_id, directory=None):
+    """SQLite file of the valuation series of the portfolio `portfolio_id` (e.g. its LedgerStore.id)."""
+    directory = directory or VALUATION_DIR
+    return os.path.join(directory, f"{hashlib.sha256(portfolio_id.encode('utf-8')).hexdigest()[:32]}.sqlite")
+
+
+def trade_day_hashes(df_history):
+    """uint64 hash of each day's operations, keyed by day. Any change to a day's trades changes its hash."""
+    if df_history.empty:
+        return pd.Series(dtype='uint64')
+    columns = [c for c in KEY_COLUMNS if c in df_history.columns]
+    hashes = pd.Series(pd.util.hash_pandas_object(df_history[columns], index=False).to_numpy())
+    days = pd.DatetimeIndex(df_history['Data_Compra']).normalize()
+    # Sum with uint64 wraparound: independent of row order within the day
+    return hashes.groupby(days.to_numpy()).sum()
+
+
+def dividend_day_hashes(df_dividends, tickers):
+    """uint64 hash of each day's dividends of `tickers`, keyed by day (see trade_day_hashes)."""
+    if df_dividends is None or df_dividends.empty:
+        return pd.Series(dtype='uint64')
+    dividends = df_dividends[DIVIDEND_COLUMNS].astype({'Codigo_Ativo': str})
+    dividends = dividends[dividends['Codigo_Ativo'].isin(tickers)]
+    if dividends.empty:
+        return pd.Series(dtype='uint64')
+    hashes = pd.Series(pd.util.hash_pandas_object(dividends, index=False).to_numpy())
+    return hashes.groupby(pd.DatetimeIndex(dividends['Data']).normalize().to_numpy()).sum()
+
+
+def day_hashes(df_history, df_dividends=None):
+    """
+    Trade and dividend hashes combined per day: a new, edited or removed
+    operation or dividend (e.g. a backdated one) changes that day's hash.
+    """
+    trades = trade_day_hashes(df_history)
+    tickers = pd.unique(df_history['Codigo_Ativo'].astype(str)) if not df_history.empty else []
+    dividends = dividend_day_hashes(df_dividends, tickers)
+    days = trades.index.union(dividends.index)
+    combined = (
+        trades.reindex(days, fill_value=0).to_numpy(dtype=np.uint64)
+        + dividends.reindex(days, fill_value=0).to_numpy(dtype=np.uint64)
+    )
+    return pd.Series(combined, index=days)
+
+
+def carried_prices(df_history, prices, dates, tickers, opening_prices=None):
+    """
+    The prices the valuation uses: `prices` (tickers x dates, NaN where
+    unknown) with each gap filled by that day's last trade price or else the
+    last known price, starting from `opening_prices` (the carried prices of
+    the day before dates[0], e.g. the last column of an earlier call; None
+    when unknown). NaN before any price.
+    """
+    dates = pd.DatetimeIndex(dates)
+    n, d = len(tickers), len(dates)
+    known = np.asarray(prices, dtype=np.float64).reshape(n, d)
+    if not df_history.empty and d > 0:
+        codes, group, _, price, _, trade_dates = normalizar_operacoes(df_history)
+        trade_days = pd.DatetimeIndex(trade_dates).normalize().to_numpy()
+        order = np.argsort(trade_days, kind='stable')
+        row = pd.Index(tickers).get_indexer(codes)[group][order]
+        day = dates.searchsorted(trade_days[order])
+        # Trades before dates[0] are already in opening_prices
+        dated = (row >= 0) & (trade_days[order] >= dates[0].to_datetime64()) & (day < d)
+        fallback = np.full((n, d), np.nan)
+        fallback[row[dated], day[dated]] = price[order][dated]  # Sorted by date, so the day's last trade wins
+        known = np.where(np.isnan(known), fallback, known)
+    if opening_prices is None:
+        return pd.DataFrame(known).ffill(axis=1).to_numpy()
+    seeded = np.concatenate([np.asarray(opening_prices, dtype=np.float64).reshape(n, 1), known], axis=1)
+    return pd.DataFrame(seeded).ffill(axis=1).to_numpy()[:, 1:]
+
+
+def value_series(df_history, prices, dates, tickers, df_dividends=None, opening_prices=None):
+    """
+    Daily portfolio rows for `dates` (ascending days): market value of the
+    positions at the end of each day, capital applied (buys minus sells,
+    with fees, since the first trade) and dividends paid that day on the
+    quantity held the day before. Operations before dates[0] form the
+    opening positions. `prices` is a (tickers x dates) matrix with NaN
+    where unknown; those days use the day's trade price or the last known
+    price, carried from `opening_prices` (see carried_prices). Returns a
+    DataFrame indexed by date with Valor_Mercado, Capital_Aplicado and
+    Proventos.
+    """
+    dates = pd.DatetimeIndex(dates)
+    n, d = len(tickers), len(dates)
+    if df_history.empty or d == 0:
+        return pd.DataFrame(0.0, index=dates, columns=VALUATION_COLUMNS[:3])
+
+    codes, group, quantity, price, fees, trade_dates = normalizar_operacoes(df_history)
+    trade_days = pd.DatetimeIndex(trade_dates).normalize().to_numpy()
+    order = np.argsort(trade_days, kind='stable')
+    row = pd.Index(tickers).get_indexer(codes)[group][order]
+    day = dates.searchsorted(trade_days[order])
+    quantity, cash = quantity[order], (quantity * price + fees)[order]
+    opening = (row >= 0) & (trade_days[order] < dates[0].to_datetime64())
+    keep = (row >= 0) & (day < d)
+    held_opening = np.bincount(row[opening], weights=quantity[opening], minlength=n)
+    row, day, quantity, cash = row[keep], day[keep], quantity[keep], cash[keep]
+
+    held = np.bincount(row * d + day, weights=quantity, minlength=n * d).reshape(n, d).cumsum(axis=1)
+    capital = np.bincount(day, weights=cash, minlength=d).cumsum()
+
+    known = carried_prices(df_history, prices, dates, tickers, opening_prices)
+    market_value = np.where(held != 0, held * np.nan_to_num(known), 0.0).sum(axis=0)
+
+    dividends = np.zeros(d)
+    if df_dividends is not None and not df_dividends.empty:
+        div_row = pd.Index(tickers).get_indexer(df_dividends['Codigo_Ativo'].astype(str))
+        div_days = pd.DatetimeIndex(df_dividends['Data']).normalize()
+        div_day = dates.searchsorted(div_days)
+        # A dividend goes to the first row on or after its date; older ones belong to rows already stored
+        take = (div_row >= 0) & (div_days > dates[0] - pd.offsets.BDay(1)) & (div_day < d)
+        per_share = np.bincount(
+            div_row[take] * d + div_day[take],
+            weights=df_dividends['Valor'].to_numpy(dtype=np.float64)[take], minlength=n * d
+        ).reshape(n, d)
+        held_before = np.concatenate([held_opening[:, np.newaxis], held[:, :-1]], axis=1)
+        dividends = (per_share * held_before).sum(axis=0)
+
+    return pd.DataFrame({'Valor_Mercado': market_value, 'Capital_Aplicado': capital, 'Proventos': dividends}, index=dates)
+
+
+def _value_rows(df_history, price_loader, tickers, first, dates, df_dividends=None):
+    """value_series for `dates`, with the prices carried into dates[0] from the first trade on, as in a full rebuild."""
+    every_day = pd.bdate_range(first, dates[-1])
+    prices = price_loader(tickers, every_day)
+    before = every_day.searchsorted(dates[0])
+    opening = carried_prices(df_history, prices[:, :before], every_day[:before], tickers)[:, -1] if before else None
+    return value_series(df_history, prices[:, before:], dates, tickers, df_dividends, opening)
+
+
+def value_history(df_history, price_loader, df_dividends=None, start=None, today=None):
+    """
+    The whole series, computed in memory without a store: business days
+    from the first trade (or `start`, if later) to `today`, with
+    VALUATION_COLUMNS. Operations before `start` form the opening positions.
+    """
+    today = pd.Timestamp(today if today is not None else pd.Timestamp.now()).normalize()
+    if df_history.empty:
+        return pd.DataFrame(columns=VALUATION_COLUMNS, index=pd.DatetimeIndex([], name='Data'), dtype='float64')
+    first = pd.Timestamp(df_history['Data_Compra'].min()).normalize()
+    dates = pd.bdate_range(first if start is None else max(first, pd.Timestamp(start).normalize()), today, name='Data')
+    tickers = sorted(pd.unique(df_history['Codigo_Ativo'].astype(str)))
+    rows = _value_rows(df_history, price_loader, tickers, first, dates, df_dividends)
+    rows['Proventos_Acumulados'] = rows['Proventos'].cumsum()
+    return rows
+
+
+def price_store_loader(price_store, suffix='.SA'):
+    """
+    Price loader over the bars already stored by a PriceStore (no download):
+    loader(tickers, dates) -> (tickers x dates) matrix of closes, NaN where unknown.
+    """
+    def loader(tickers, dates):
+        dates = pd.DatetimeIndex(dates)
+        matrix = np.full((len(tickers), len(dates)), np.nan)
+        for i, ticker in enumerate(tickers):
+            bars = price_store.load(f'{ticker}{suffix}')
+            if bars is not None and not bars.empty:
+                matrix[i] = daily_closes(bars).reindex(dates).to_numpy()
+        return matrix
+    return loader
+
+
+class ValuationStore:
+    """Daily portfolio valuation series kept in SQLite and extended one day at a time.
+
+    update() only computes the days after the last stored one (the last day
+    is recomputed, as it may have been valued intraday). The ledger's trades
+    and the dividends are summarized as one hash per day: when a day's trades
+    or dividends change (e.g. a backdated operation is imported), rows from
+    that day on are recomputed and everything before it is kept. Rows are
+    business days. Keep one store per portfolio (see valuation_path), and
+    only for real prices: simulated valuations belong in value_history.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.days_computed = 0  # Rows computed by the last update()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS valuation (
+                    Data INTEGER PRIMARY KEY,
+                    {', '.join(f'{column} REAL' for column in VALUATION_COLUMNS)}
+                )""")
+            conn.execute("CREATE TABLE IF NOT EXISTS day_hashes (Data INTEGER PRIMARY KEY, hash TEXT)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:  # Commits, or rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def load(self, start=None):
+        """Stored rows (from `start` on, if given) as a DataFrame indexed by date."""
+        query = f"SELECT Data, {', '.join(VALUATION_COLUMNS)} FROM valuation"
+        params = ()
+        if start is not None:
+            query += " WHERE Data >= ?"
+            params = (pd.Timestamp(start).value,)
+        with self._connect() as conn:
+            df = pd.read_sql_query(query + " ORDER BY Data", conn, params=params)
+        return df.set_index(pd.DatetimeIndex(pd.to_datetime(df.pop('Data').astype('int64'), unit='ns'), name='Data'))
+
+    def last_date(self):
+        with self._connect() as conn:
+            return self._last_date(conn)
+
+    def _last_date(self, conn):
+        value = conn.execute("SELECT MAX(Data) FROM valuation").fetchone()[0]
+        return None if value is None else pd.Timestamp(value)
+
+    def _first_changed_day(self, conn, hashes):
+        stored = dict(conn.execute("SELECT Data, hash FROM day_hashes").fetchall())
+        current = {pd.Timestamp(day).value: f'{h:016x}' for day, h in hashes.items()}
+        changed = [day for day in stored.keys() | current.keys() if stored.get(day) != current.get(day)]
+        return pd.Timestamp(min(changed)) if changed else None
+
+    def update(self, df_history, price_loader, df_dividends=None, today=None):
+        """
+        Brings the series up to `today` (default: now) and returns it.
+        price_loader(tickers, dates) -> (tickers x dates) price matrix, NaN where unknown.
+        """
+        today = pd.Timestamp(today if today is not None else pd.Timestamp.now()).normalize()
+        with self._lock:
+            if df_history.empty:
+                self.days_computed = 0
+                return self.load()
+            hashes = day_hashes(df_history, df_dividends)
+            with self._connect() as conn:
+                last = self._last_date(conn)
+                changed = self._first_changed_day(conn, hashes)
+            first = pd.Timestamp(df_history['Data_Compra'].min()).normalize()
+            if last is None:
+                start = first
+            else:
+                # Dividends paid before the first trade may change without affecting any row
+                start = last if changed is None else max(min(last, changed), first)
+            dates = pd.bdate_range(start, today)
+            if len(dates) == 0:
+                self.days_computed = 0
+                return self.load()
+
+            tickers = sorted(pd.unique(df_history['Codigo_Ativo'].astype(str)))
+            rows = _value_rows(df_history, price_loader, tickers, first, dates, df_dividends)
+            with self._connect() as conn:
+                previous = conn.execute(
+                    "SELECT Proventos_Acumulados FROM valuation WHERE Data < ? ORDER BY Data DESC LIMIT 1",
+                    (dates[0].value,)
+                ).fetchone()
+                rows['Proventos_Acumulados'] = (previous[0] if previous else 0.0) + rows['Proventos'].cumsum()
+                conn.execute("DELETE FROM valuation WHERE Data >= ?", (dates[0].value,))
+                conn.executemany(
+                    f"INSERT INTO valuation (Data, {', '.join(VALUATION_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * (len(VALUATION_COLUMNS) + 1))})",
+                    zip(dates.asi8.tolist(), *(rows[column].tolist() for column in VALUATION_COLUMNS))
+                )
+                conn.execute("DELETE FROM day_hashes")
+                conn.executemany(
+                    "INSERT INTO day_hashes VALUES (?, ?)",
+                    [(pd.Timestamp(day).value, f'{h:016x}') for day, h in hashes.items()]
+                )
+            self.days_computed = len(dates)
+            return self.load()
+
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+    import time
+
+    from portfolio import gerar_historico_sintetico
+
+    parser = argparse.ArgumentParser(description="Full rebuild vs. daily append of the valuation series.")
+    parser.add_argument('--transacoes', type=int, default=20_000)
+    parser.add_argument('--ativos', type=int, default=500)
+    args = parser.parse_args()
+
+    df_history, df_market_data = gerar_historico_sintetico(args.transacoes, args.ativos)
+    base = df_market_data['Preco_Atual'].to_numpy()
+
+    def loader(tickers, dates):
+        # Deterministic random walk per (ticker, day) so rebuilds and appends see the same prices
+        steps = pd.DatetimeIndex(dates).asi8 // 86_400_000_000_000
+        noise = np.sin(np.outer(np.arange(len(tickers)) + 1, steps) * 0.01) * 0.2
+        return base[pd.Index(df_market_data.index).get_indexer(tickers)][:, np.newaxis] * (1 + noise)
+
+    last_trade = pd.Timestamp(df_history['Data_Compra'].max()).normalize()
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ValuationStore(os.path.join(tmp, 'valuation.sqlite'))
+        started = time.perf_counter()
+        full = store.update(df_history, loader, today=last_trade)
+        t_full = time.perf_counter() - started
+
+        started = time.perf_counter()
+        store.update(df_history, loader, today=last_trade + pd.offsets.BDay(1))
+        t_append = time.perf_counter() - started
+        appended = store.days_computed
+
+        fresh = ValuationStore(os.path.join(tmp, 'fresh.sqlite')).update(df_history, loader, today=last_trade + pd.offsets.BDay(1))
+        difference = (store.load() - fresh).abs().to_numpy().max()
+        in_memory = value_history(df_history, loader, today=last_trade + pd.offsets.BDay(1))
+        difference = max(difference, (store.load() - in_memory).abs().to_numpy().max())
+
+        backdated = df_history.iloc[[len(df_history) // 2]].copy()
+        backdated['Quantidade'] = 10
+        changed = pd.concat([df_history, backdated], ignore_index=True)
+        started = time.perf_counter()
+        store.update(changed, loader, today=last_trade + pd.offsets.BDay(1))
+        t_backdated = time.perf_counter() - started
+
+    print(f"{len(full)} days, {args.ativos} assets, {args.transacoes} trades")
+    print(f"full build {t_full * 1000:.0f} ms | daily append {t_append * 1000:.1f} ms ({appended} rows) | "
+          f"backdated trade {t_backdated * 1000:.0f} ms ({store.days_computed} rows)")
+    print(f"append vs. fresh rebuild and in-memory series: max difference {difference:.2e}")
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import hashlib
+import io
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# calamine (Rust) reads .xlsx several times faster than openpyxl; optional
+try:
+    import python_calamine  # noqa: F401
+    ENGINE = 'calamine'
+except ImportError:
+    ENGINE = 'openpyxl'
+
+# Parsed workbooks are client data: they are kept on disk only if MMPG_WORKBOOK_CACHE_DIR is set
+WORKBOOK_CACHE_DIR = os.environ.get('MMPG_WORKBOOK_CACHE_DIR') or None
+
+
+def content_hash(data):
+    """SHA-1 of the workbook bytes, used as cache key and as version of the upload."""
+    return hashlib.sha1(data).hexdigest()
+
+
+def _read_openpyxl(data, sheets):
+    """Single pass over the workbook in openpyxl read-only (streaming) mode."""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True, keep_links=False)
+    try:
+        frames = {}
+        for sheet in sheets:
+            if sheet not in workbook.sheetnames:
+                raise ValueError(f"Worksheet named '{sheet}' not found")
+            rows = workbook[sheet].iter_rows(values_only=True)
+            header = next(rows, ())
+            # Read-only mode may report trailing empty columns and rows
+            while header and header[-1] is None:
+                header = header[:-1]
+            width = len(header)
+            values = [row[:width] for row in rows if any(v is not None for v in row[:width])]
+            df = pd.DataFrame(values, columns=list(header)).infer_objects()
+            # Empty cells as NaN, like pd.read_excel
+            for column in df.columns[df.dtypes == object]:
+                df[column] = df[column].where(df[column].notna(), np.nan)
+            frames[sheet] = df
+        return frames
+    finally:
+        workbook.close()
+
+
+def _read_calamine(data, sheets):
+    return pd.read_excel(io.BytesIO(data), sheet_name=list(sheets), engine='calamine')
+
+
+def read_workbook(data, sheets, parse_dates=None, engine=None):
+    """Reads `sheets` from the workbook bytes in one pass. Returns {sheet: DataFrame}.
+
+    `parse_dates` maps sheet name -> columns converted with pd.to_datetime.
+    """
+    engine = engine or ENGINE
+    if engine == 'calamine':
+        try:
+            frames = _read_calamine(data, sheets)
+        except Exception:
+            # calamine rejects some files openpyxl reads; a genuinely bad file fails again below
+            frames = _read_openpyxl(data, sheets)
+    else:
+        frames = _read_openpyxl(data, sheets)
+    for sheet, columns in (parse_dates or {}).items():
+        for column in columns:
+            if column in frames[sheet].columns:
+                frames[sheet][column] = pd.to_datetime(frames[sheet][column])
+    return frames
+
+
+class WorkbookCache:
+    """Parsed workbooks keyed by content hash, in memory (LRU) and optionally on disk.
+
+    Re-uploading the same file skips the Excel parsing entirely; with a
+    `root` directory this also holds across restarts. Callers get copies and
+    may modify them.
+    """
+
+    def __init__(self, root=None, max_memory=8, max_files=64):
+        self.root = root
+        self.max_memory = max_memory
+        self.max_files = max_files
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if self.root:
+            os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.pkl')
+
+    def _remember(self, key, frames):
+        with self._lock:
+            self._entries[key] = frames
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_memory:
+                self._entries.popitem(last=False)
+
+    def _load(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if not self.root:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                frames = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        os.utime(self._path(key))
+        self._remember(key, frames)
+        return frames
+
+    def _store(self, key, frames):
+        self._remember(key, frames)
+        if not self.root:
+            return
+        # Unique per writer: bulk runs may parse the same file in several processes
+        tmp_path = f'{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(frames, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path(key))
+        self._prune()
+
+    def _prune(self):
+        files = [os.path.join(self.root, name) for name in os.listdir(self.root) if name.endswith('.pkl')]
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def read(self, data, sheets, parse_dates=None):
+        """Same as `read_workbook`, served from cache when the bytes were seen before."""
+        key = content_hash(data) + '-' + hashlib.sha1(repr((list(sheets), parse_dates)).encode()).hexdigest()[:8]
+        frames = self._load(key)
+        if frames is None:
+            frames = read_workbook(data, sheets, parse_dates)
+            self._store(key, frames)
+        return {sheet: df.copy() for sheet, df in frames.items()}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_workbook_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = WorkbookCache(WORKBOOK_CACHE_DIR)
+        return _cache
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Compare workbook read times (pandas per sheet vs single pass).")
+    parser.add_argument('path', nargs='?', default='portfolio_monitor.xlsx')
+    parser.add_argument('--sheets', nargs='+', default=['Historico_Compras', 'Watchlist'])
+    args = parser.parse_args()
+
+    with open(args.path, 'rb') as f:
+        data = f.read()
+
+    started = time.perf_counter()
+    for sheet in args.sheets:
+        pd.read_excel(io.BytesIO(data), sheet_name=sheet)
+    print(f"pd.read_excel per sheet: {time.perf_counter() - started:.3f}s")
+
+    started = time.perf_counter()
+    frames = read_workbook(data, args.sheets)
+    print(f"read_workbook ({ENGINE}): {time.perf_counter() - started:.3f}s | "
+          + ", ".join(f"{sheet}: {len(df)} rows" for sheet, df in frames.items()))
+
+    cache = WorkbookCache()
+    cache.read(data, args.sheets)
+    started = time.perf_counter()
+    cache.read(data, args.sheets)
+    print(f"cached: {time.perf_counter() - started:.4f}s")